@@ -0,0 +1,287 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, MatchAny,
+    FilterSelector, PointIdsList, PayloadSchemaType, OrderBy
+)
+from .query_cache import get_query_embedding
+from .vector_db import client
+from .tracing import traced
+
+# "memory" keeps entries in this process, "qdrant" in a collection shared by workers, "off" disables it
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+# Cosine similarity a new query needs to an earlier one to reuse its answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_COLLECTION = os.getenv("ANSWER_CACHE_COLLECTION", "answer_cache")
+
+
+def chunk_set_key(chunks: List[Dict]) -> str:
+    """Order independent signature of the retrieved chunk ids"""
+    ids = sorted(str(chunk.get("qdrant_id")) for chunk in chunks)
+    return hashlib.sha256(",".join(ids).encode("utf-8")).hexdigest()
+
+
+def context_key(chunks: List[Dict], history: Optional[List[Dict[str, str]]] = None, summary: Optional[str] = None, tenant_id: Optional[str] = None) -> str:
+    """Chunk set signature extended with everything else the prompt is built from.
+
+    Answers depend on the session's history and summary, so two sessions only share
+    an entry when their conversations so far are identical (usually both empty).
+    """
+    digest = hashlib.sha256(chunk_set_key(chunks).encode("utf-8"))
+    digest.update(f"\0{tenant_id or ''}\0{summary or ''}".encode("utf-8"))
+    for turn in history or ():
+        digest.update(f"\0{turn.get('role')}\0{turn.get('message')}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _document_ids(chunks: List[Dict]) -> List[str]:
+    return sorted({str(chunk["document"]["id"]) for chunk in chunks if chunk.get("document")})
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class InMemoryAnswerStore:
+    """Answers grouped by chunk set, evicted least recently used first"""
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE):
+        self.maxsize = maxsize
+        # entry id -> (chunk set, unit query vector, answer, document ids)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_chunk_set: Dict[str, Set[str]] = {}
+        self._by_document: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def lookup(self, vector: np.ndarray, chunk_set: str, threshold: float) -> Optional[str]:
+        with self._lock:
+            best_id, best_score = None, threshold
+            for entry_id in self._by_chunk_set.get(chunk_set, ()):
+                score = float(np.dot(self._entries[entry_id][1], vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                return None
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][2]
+
+    def add(self, vector: np.ndarray, chunk_set: str, answer: str, document_ids: List[str]):
+        entry_id = str(uuid.uuid4())
+        with self._lock:
+            self._entries[entry_id] = (chunk_set, vector, answer, document_ids)
+            self._by_chunk_set.setdefault(chunk_set, set()).add(entry_id)
+            for document_id in document_ids:
+                self._by_document.setdefault(document_id, set()).add(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: str):
+        chunk_set, _, _, document_ids = self._entries.pop(entry_id)
+        same_set = self._by_chunk_set.get(chunk_set)
+        if same_set is not None:
+            same_set.discard(entry_id)
+            if not same_set:
+                del self._by_chunk_set[chunk_set]
+        for document_id in document_ids:
+            cited = self._by_document.get(document_id)
+            if cited is not None:
+                cited.discard(entry_id)
+                if not cited:
+                    del self._by_document[document_id]
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        with self._lock:
+            entry_ids = set()
+            for document_id in document_ids:
+                entry_ids |= self._by_document.get(str(document_id), set())
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+        return len(entry_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_chunk_set.clear()
+            self._by_document.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class QdrantAnswerStore:
+    """Answers as points of a local Qdrant collection, so every worker shares them"""
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, name: str = ANSWER_CACHE_COLLECTION):
+        self.maxsize = maxsize
+        self.name = name
+        self.evictions = 0
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _ensure(self, dim: int):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            if not client.collection_exists(self.name):
+                client.create_collection(collection_name=self.name, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
+                client.create_payload_index(self.name, "chunk_set", PayloadSchemaType.KEYWORD)
+                client.create_payload_index(self.name, "document_ids", PayloadSchemaType.KEYWORD)
+                # Needed to order by insertion time when evicting
+                client.create_payload_index(self.name, "created_at", PayloadSchemaType.FLOAT)
+            self._ready = True
+
+    def lookup(self, vector: np.ndarray, chunk_set: str, threshold: float) -> Optional[str]:
+        self._ensure(len(vector))
+        hits = client.query_points(
+            collection_name=self.name,
+            query=vector.tolist(),
+            query_filter=Filter(must=[FieldCondition(key="chunk_set", match=MatchValue(value=chunk_set))]),
+            score_threshold=threshold,
+            limit=1,
+            with_payload=["answer"]
+        ).points
+        return hits[0].payload["answer"] if hits else None
+
+    def add(self, vector: np.ndarray, chunk_set: str, answer: str, document_ids: List[str]):
+        self._ensure(len(vector))
+        client.upsert(collection_name=self.name, points=[PointStruct(
+            id=str(uuid.uuid4()),
+            vector=vector.tolist(),
+            payload={"chunk_set": chunk_set, "answer": answer, "document_ids": document_ids, "created_at": time.time()}
+        )])
+        excess = client.count(self.name, exact=True).count - self.maxsize
+        if excess > 0:
+            oldest, _ = client.scroll(self.name, limit=excess, order_by=OrderBy(key="created_at"), with_payload=False)
+            client.delete(collection_name=self.name, points_selector=PointIdsList(points=[p.id for p in oldest]))
+            self.evictions += len(oldest)
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        document_ids = [str(d) for d in document_ids]
+        if not document_ids or not client.collection_exists(self.name):
+            return 0
+        cited = Filter(must=[FieldCondition(key="document_ids", match=MatchAny(any=document_ids))])
+        removed = client.count(self.name, count_filter=cited, exact=True).count
+        client.delete(collection_name=self.name, points_selector=FilterSelector(filter=cited))
+        return removed
+
+    def clear(self):
+        if client.collection_exists(self.name):
+            client.delete_collection(self.name)
+        self._ready = False
+
+    def __len__(self) -> int:
+        if not client.collection_exists(self.name):
+            return 0
+        return client.count(self.name, exact=True).count
+
+
+class AnswerCache:
+    """Semantic cache of LLM answers.
+
+    A cached answer is served when the new query embedding is within the similarity
+    threshold of an earlier query, retrieval returned the same chunk set and the
+    conversation history, summary and tenant match.
+    """
+
+    def __init__(self, store=None, threshold: float = ANSWER_CACHE_THRESHOLD):
+        self.store = store
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    @traced("answer_cache_lookup")
+    def get(
+        self,
+        query: str,
+        chunks: List[Dict],
+        history: Optional[List[Dict[str, str]]] = None,
+        summary: Optional[str] = None,
+        tenant_id: Optional[str] = None
+    ) -> Optional[str]:
+        if not self.enabled or not _document_ids(chunks):
+            return None
+        try:
+            answer = self.store.lookup(_normalize(get_query_embedding(query)), context_key(chunks, history, summary, tenant_id), self.threshold)
+        except Exception:
+            # The cache must never fail a request
+            self.errors += 1
+            return None
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    @traced("answer_cache_store")
+    def set(
+        self,
+        query: str,
+        chunks: List[Dict],
+        answer: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        summary: Optional[str] = None,
+        tenant_id: Optional[str] = None
+    ):
+        document_ids = _document_ids(chunks)
+        if not self.enabled or not document_ids or not answer:
+            return
+        try:
+            self.store.add(_normalize(get_query_embedding(query)), context_key(chunks, history, summary, tenant_id), answer, document_ids)
+        except Exception:
+            self.errors += 1
+
+    def invalidate_document(self, document_id: str):
+        if self.enabled:
+            try:
+                self.invalidations += self.store.invalidate_documents([document_id])
+            except Exception:
+                self.errors += 1
+
+    def clear(self):
+        if self.enabled:
+            self.store.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": ANSWER_CACHE_BACKEND,
+            "size": len(self.store) if self.enabled else 0,
+            "maxsize": self.store.maxsize if self.enabled else 0,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.store.evictions if self.enabled else 0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+def _make_store(backend: str):
+    if backend == "memory":
+        return InMemoryAnswerStore()
+    if backend == "qdrant":
+        return QdrantAnswerStore()
+    return None
+
+
+answer_cache = AnswerCache(_make_store(ANSWER_CACHE_BACKEND))
@@ -0,0 +1,65 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+from .cache import LRUCache
+
+CHUNK_CACHE_SIZE = int(os.getenv("CHUNK_CACHE_SIZE", "10000"))
+# Bounds how long other workers can serve a chunk after it changed
+CHUNK_CACHE_TTL = float(os.getenv("CHUNK_CACHE_TTL", "300"))
+
+
+class ChunkCache:
+    """Hot chunk records keyed by Qdrant point id, invalidated per document"""
+
+    def __init__(self, maxsize: int = CHUNK_CACHE_SIZE, ttl: float = CHUNK_CACHE_TTL):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl, on_evict=self._forget)
+        self._by_document: Dict[str, Set[str]] = {}
+        # Reentrant, evictions caused by put call back into _forget on the same thread
+        self._lock = threading.RLock()
+
+    def get_many(self, point_ids: Iterable[str]) -> Tuple[Dict[str, Dict], List[str]]:
+        """Cached records and the point ids that were not cached"""
+        found: Dict[str, Dict] = {}
+        missing: List[str] = []
+        for point_id in point_ids:
+            record = self.cache.get(point_id)
+            if record is None:
+                missing.append(point_id)
+            else:
+                found[point_id] = record
+        return found, missing
+
+    def put(self, point_id: str, record: Dict):
+        with self._lock:
+            self._by_document.setdefault(record["document"]["id"], set()).add(point_id)
+            self.cache.set(point_id, record)
+
+    def _forget(self, point_id: str, record: Dict):
+        """Drop an evicted or expired point from the document index"""
+        with self._lock:
+            # Put again since it was evicted
+            if point_id in self.cache:
+                return
+            document_id = record["document"]["id"]
+            point_ids = self._by_document.get(document_id)
+            if point_ids is not None:
+                point_ids.discard(point_id)
+                if not point_ids:
+                    del self._by_document[document_id]
+
+    def invalidate_document(self, document_id: str):
+        with self._lock:
+            point_ids = self._by_document.pop(str(document_id), set())
+        for point_id in point_ids:
+            self.cache.pop(point_id)
+
+    def clear(self):
+        with self._lock:
+            self._by_document.clear()
+        self.cache.clear()
+
+    def stats(self) -> Dict:
+        return self.cache.stats()
+
+
+chunk_cache = ChunkCache()
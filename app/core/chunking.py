@@ -1,3 +1,5 @@
+from bisect import bisect_right
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 from langchain.text_splitter import RecursiveCharacterTextSplitter, CharacterTextSplitter
 
 def fixed_chunking(text: str, chunk_size: int = 800, overlap: int = 200):
@@ -19,4 +21,111 @@ def recursive_chunking(text: str, chunk_size: int = 800, overlap: int = 200):
         separators=["\n\n", "\n", " ", ""]
     )
     chunks = splitter.split_text(text)
-    return chunks
\ No newline at end of file
+    return chunks
+
+
+class ChunkRecord:
+    """A chunk with its character offsets in the document and the pages it spans"""
+    __slots__ = ("text", "start", "end", "page_start", "page_end")
+
+    def __init__(self, text: str, start: int, end: int, page_start: int, page_end: int):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.page_start = page_start
+        self.page_end = page_end
+
+    @property
+    def chunk_length(self) -> int:
+        return len(self.text)
+
+    def provenance(self) -> Dict[str, int]:
+        return {
+            "start_offset": self.start,
+            "end_offset": self.end,
+            "page_start": self.page_start,
+            "page_end": self.page_end
+        }
+
+    def __repr__(self) -> str:
+        return f"ChunkRecord(start={self.start}, end={self.end}, pages={self.page_start}-{self.page_end}, length={len(self.text)})"
+
+
+def _find_cut(buf: str, limit: int, floor: int, separators: Tuple[str, ...]) -> int:
+    """Position to end a chunk at, the last separator before limit or limit itself"""
+    for separator in separators:
+        pos = buf.rfind(separator, floor, limit)
+        if pos > floor:
+            return pos + len(separator)
+    return limit
+
+
+def stream_chunks(
+    segments: Iterable[Union[str, Tuple[int, str]]],
+    chunk_size: int = 800,
+    overlap: int = 200,
+    separators: Tuple[str, ...] = ("\n\n", "\n", " ")
+) -> Iterator[ChunkRecord]:
+    """Incrementally split text segments (pages) into overlapping ChunkRecords.
+
+    Segments are strings or (page number, text) pairs and are joined with a newline,
+    the same way PDF pages are joined by extraction. Only the text not yet chunked
+    plus the current segment is held in memory.
+    """
+    overlap = min(overlap, chunk_size // 2)
+    buf = ""
+    buf_start = 0                         # document offset of buf[0]
+    page_offsets: List[int] = []          # document offset where each buffered page starts
+    page_numbers: List[int] = []
+    last_end = 0
+
+    def page_at(offset: int) -> int:
+        return page_numbers[max(0, bisect_right(page_offsets, offset) - 1)]
+
+    def emit(start: int, end: int):
+        # Trim surrounding whitespace but keep offsets pointing at the kept text
+        text = buf[start:end]
+        stripped = text.lstrip()
+        start += len(text) - len(stripped)
+        text = stripped.rstrip()
+        if not text:
+            return None
+        doc_start = buf_start + start
+        doc_end = doc_start + len(text)
+        return ChunkRecord(text, doc_start, doc_end, page_at(doc_start), page_at(doc_end - 1))
+
+    for index, segment in enumerate(segments):
+        page_number, text = segment if isinstance(segment, tuple) else (index + 1, segment)
+        if page_offsets:
+            buf += "\n"
+        page_offsets.append(buf_start + len(buf))
+        page_numbers.append(page_number)
+        buf += text
+
+        pos = 0
+        while len(buf) - pos > chunk_size:
+            # Prefer a separator in the second half of the window to keep chunks full
+            cut = _find_cut(buf, pos + chunk_size, pos + chunk_size // 2, separators)
+            record = emit(pos, cut)
+            if record:
+                last_end = record.end
+                yield record
+
+            # Start the next chunk overlap characters back, on a separator when possible
+            next_start = max(pos + 1, cut - overlap)
+            space = buf.find(" ", next_start, cut)
+            if space != -1:
+                next_start = space + 1
+            pos = next_start
+
+        # Drop chunked text and the pages that ended before it
+        buf = buf[pos:]
+        buf_start += pos
+        keep = max(0, bisect_right(page_offsets, buf_start) - 1)
+        del page_offsets[:keep]
+        del page_numbers[:keep]
+
+    if buf and buf_start + len(buf.rstrip()) > last_end:
+        record = emit(0, len(buf))
+        if record:
+            yield record
@@ -0,0 +1,152 @@
+import os
+from typing import Dict, List, Tuple
+from .tokens import count_tokens, truncate_to_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Shortest suffix/prefix match treated as chunker overlap when merging neighbours
+MIN_MERGE_OVERLAP = 20
+MAX_MERGE_OVERLAP = 1000
+# Leftover budget worth filling with the start of a segment that did not fit
+MIN_FILL_TOKENS = 50
+
+
+def _usable(chunk: Dict) -> bool:
+    return bool(chunk.get("text")) and chunk.get("text") != "Content not found in database"
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    for k in range(min(len(left), len(right), MAX_MERGE_OVERLAP), MIN_MERGE_OVERLAP - 1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+
+def merge_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Join hits that are neighbours in the same document into one segment.
+
+    Chunks are adjacent when their chunk ids follow each other, the overlap the
+    chunker repeated between them is only kept once. A segment scores as its best chunk.
+    """
+    by_document: Dict[str, List[Dict]] = {}
+    for chunk in chunks:
+        if not _usable(chunk):
+            continue
+        document = chunk.get("document") or {}
+        key = str(document.get("id") or document.get("filename") or chunk.get("qdrant_id"))
+        by_document.setdefault(key, []).append(chunk)
+
+    segments = []
+    for hits in by_document.values():
+        # Duplicates can come back when two points share a chunk position
+        unique = {}
+        for chunk in hits:
+            chunk_id = chunk.get("chunk_id")
+            if chunk_id not in unique or chunk.get("score", 0.0) > unique[chunk_id].get("score", 0.0):
+                unique[chunk_id] = chunk
+        ordered = sorted(unique.values(), key=lambda c: (c.get("chunk_id") is None, c.get("chunk_id") or 0))
+
+        current = None
+        for chunk in ordered:
+            text = " ".join(chunk["text"].split())
+            chunk_id = chunk.get("chunk_id")
+            if current and chunk_id is not None and current["last_id"] is not None and chunk_id == current["last_id"] + 1:
+                k = _overlap(current["text"], text)
+                current["text"] = current["text"] + (text[k:] if k else " " + text)
+                current["last_id"] = chunk_id
+                current["score"] = max(current["score"], chunk.get("score", 0.0))
+                current["chunks"].append(chunk)
+                continue
+            if current:
+                segments.append(current)
+            current = {
+                "filename": (chunk.get("document") or {}).get("filename", "Unknown"),
+                "first_id": chunk_id,
+                "last_id": chunk_id,
+                "text": text,
+                "score": chunk.get("score", 0.0),
+                "chunks": [chunk]
+            }
+        if current:
+            segments.append(current)
+
+    for segment in segments:
+        span = segment["first_id"] if segment["first_id"] == segment["last_id"] else f"{segment['first_id']}-{segment['last_id']}"
+        segment["label"] = f"[{segment['filename']}#{span if span is not None else 0}]"
+    return segments
+
+
+def _knapsack(weights: List[int], values: List[float], budget: int) -> List[int]:
+    """Indices of the items with the highest total value within the budget (0/1 knapsack)"""
+    best = [0.0] * (budget + 1)
+    keep = [[False] * (budget + 1) for _ in weights]
+    for i, (weight, value) in enumerate(zip(weights, values)):
+        for b in range(budget, weight - 1, -1):
+            candidate = best[b - weight] + value
+            if candidate > best[b]:
+                best[b] = candidate
+                keep[i][b] = True
+
+    chosen = []
+    b = budget
+    for i in range(len(weights) - 1, -1, -1):
+        if keep[i][b]:
+            chosen.append(i)
+            b -= weights[i]
+    return chosen[::-1]
+
+
+def _truncated_piece(segment: Dict, max_tokens: int) -> Tuple[str, int]:
+    """Label and the start of the segment text within max_tokens, ("", 0) if nothing fits"""
+    label_tokens = count_tokens(segment["label"] + " ")
+    text = truncate_to_tokens(segment["text"], max_tokens - label_tokens - 1)
+    if not text:
+        return "", 0
+    piece = f"{segment['label']} {text}..."
+    tokens = count_tokens(piece)
+    return (piece, tokens) if tokens <= max_tokens else ("", 0)
+
+
+def pack_context(chunks: List[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[List[str], Dict]:
+    """Context pieces chosen by score to fill the token budget, and packing stats"""
+    segments = merge_chunks(chunks)
+
+    pieces, weights, values, sources = [], [], [], []
+    for segment in segments:
+        piece = f"{segment['label']} {segment['text']}"
+        tokens = count_tokens(piece)
+        if tokens > token_budget:
+            # A single oversized segment is cut down instead of being dropped
+            piece, tokens = _truncated_piece(segment, token_budget)
+            if not piece:
+                continue
+        pieces.append(piece)
+        weights.append(tokens)
+        # Every piece is worth something, better ranked ones more
+        values.append(max(segment["score"], 0.0) + 1e-3)
+        sources.append(segment)
+
+    # Pieces are joined by a blank line, roughly one token each
+    chosen = _knapsack([w + 1 for w in weights], values, token_budget) if pieces else []
+
+    # The best segment left out may still fit partly into what remains
+    left = token_budget - sum(weights[i] + 1 for i in chosen)
+    for i in sorted(set(range(len(pieces))) - set(chosen), key=lambda i: values[i], reverse=True):
+        if left < MIN_FILL_TOKENS:
+            break
+        piece, tokens = _truncated_piece(sources[i], left - 1)
+        if piece:
+            pieces[i], weights[i] = piece, tokens
+            chosen.append(i)
+            left -= tokens + 1
+    chosen.sort(key=lambda i: values[i], reverse=True)
+
+    stats = {
+        "token_budget": token_budget,
+        "tokens_used": sum(weights[i] + 1 for i in chosen),
+        "chunks_in": sum(1 for c in chunks if _usable(c)),
+        "segments": len(segments),
+        "segments_packed": len(chosen),
+        "segments_dropped": len(segments) - len(chosen)
+    }
+    return [pieces[i] for i in chosen], stats
@@ -0,0 +1,73 @@
+import hashlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from sqlalchemy.orm import Session
+from .models import Chunk
+from .embedding_engine import embed_texts
+from .vector_db import retrieve_vectors, collection_name
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_file(source: Union[bytes, str, Path]) -> str:
+    """sha256 of file bytes or of a file on disk, read in blocks"""
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_chunks_by_hash(chunk_hashes: List[str], db: Session) -> Dict[str, Chunk]:
+    """One stored chunk row per known hash"""
+    if not chunk_hashes:
+        return {}
+    rows = db.query(Chunk).filter(Chunk.chunk_hash.in_(set(chunk_hashes))).all()
+    return {row.chunk_hash: row for row in rows}
+
+
+def embed_with_reuse(
+    chunks: List[str],
+    chunk_hashes: List[str],
+    db: Session,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    name: str = collection_name
+) -> Tuple[np.ndarray, int]:
+    """Embed chunks, reusing stored vectors of chunks whose hash already exists.
+
+    Vectors are looked up in collection name, chunks stored elsewhere are embedded again.
+    Returns the float32 matrix in chunk order and how many chunks were reused.
+    """
+    if not chunks:
+        return np.empty((0, 0), dtype=np.float32), 0
+
+    known = find_chunks_by_hash(chunk_hashes, db)
+    stored = retrieve_vectors(list({str(row.qdrant_point_id) for row in known.values()}), name)
+
+    reused: Dict[int, List[float]] = {}
+    for i, chunk_hash in enumerate(chunk_hashes):
+        row = known.get(chunk_hash)
+        vector = stored.get(str(row.qdrant_point_id)) if row else None
+        if vector is not None:
+            reused[i] = vector
+
+    missing = [i for i in range(len(chunks)) if i not in reused]
+    fresh = None
+    if missing:
+        progress = (lambda done, total: on_progress(len(reused) + done, len(chunks))) if on_progress else None
+        fresh = embed_texts([chunks[i] for i in missing], on_progress=progress)
+
+    dim = fresh.shape[1] if fresh is not None else len(next(iter(reused.values())))
+    embeddings = np.empty((len(chunks), dim), dtype=np.float32)
+    if missing:
+        embeddings[missing] = fresh
+    for i, vector in reused.items():
+        embeddings[i] = vector
+    if on_progress:
+        on_progress(len(chunks), len(chunks))
+    return embeddings, len(reused)
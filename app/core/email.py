@@ -1,4 +1,5 @@
 import os
+import asyncio
 import smtplib
 from email.message import EmailMessage
 from typing import Optional
@@ -33,4 +34,8 @@ def send_booking_email(to_email: str, subject: str, body_text: str, body_html: O
                 server.login(SMTP_USER, SMTP_PASS)
             server.send_message(msg)
     except Exception as e:
-        raise EmailSendError(f"Failed to send email: {e}")
\ No newline at end of file
+        raise EmailSendError(f"Failed to send email: {e}")
+
+async def asend_booking_email(to_email: str, subject: str, body_text: str, body_html: Optional[str] = None):
+    """Send without blocking the event loop, smtplib itself is synchronous"""
+    await asyncio.to_thread(send_booking_email, to_email, subject, body_text, body_html)
\ No newline at end of file
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Optional
+import numpy as np
+from fastapi import HTTPException
+from .embeddings import EMBEDDING_MODEL, get_embeddings_model, _record_encode
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# 0 keeps encoding in the current process
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "0"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+# Calls currently submitting to _pool, it is only replaced or shut down when there are none
+_pool_users = 0
+_pool_changed = threading.Condition(threading.Lock())
+
+
+def _init_worker(model_name: str, threads: int):
+    """Load the model once in every pool process"""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    get_embeddings_model(model_name)
+
+
+def _encode_batch(model_name: str, texts: List[str]) -> np.ndarray:
+    model = get_embeddings_model(model_name)
+    return np.asarray(model.embed_documents(texts), dtype=np.float32)
+
+
+@contextmanager
+def _using_pool(workers: int, model_name: str) -> Iterator[ProcessPoolExecutor]:
+    """Shared pool with the given worker count, a pool of another size is replaced once idle"""
+    global _pool, _pool_workers, _pool_users
+    with _pool_changed:
+        while _pool is not None and _pool_workers != workers and _pool_users:
+            _pool_changed.wait()
+        if _pool is None or _pool_workers != workers:
+            _shutdown_locked()
+            # spawn avoids forking a process that already holds torch threads
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_name, threads)
+            )
+            _pool_workers = workers
+        _pool_users += 1
+        pool = _pool
+    try:
+        yield pool
+    finally:
+        with _pool_changed:
+            _pool_users -= 1
+            _pool_changed.notify_all()
+
+
+def _shutdown_locked():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+    _pool = None
+    _pool_workers = 0
+
+
+def shutdown_pool():
+    """Shut the pool down after the calls using it are done"""
+    with _pool_changed:
+        while _pool_users:
+            _pool_changed.wait()
+        _shutdown_locked()
+
+
+def length_sorted_batches(texts: List[str], batch_size: int) -> List[List[int]]:
+    """Group indices of texts with similar length so each batch pads less"""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def embed_texts(
+    texts: List[str],
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    workers: int = EMBEDDING_WORKERS,
+    model_name: str = EMBEDDING_MODEL,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> np.ndarray:
+    """Embed texts in length sorted batches, returns a (len(texts), dim) float32 matrix in input order"""
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    try:
+        batches = length_sorted_batches(texts, max(1, batch_size))
+        start = time.perf_counter()
+        result: Optional[np.ndarray] = None
+        done = 0
+
+        def place(indices: List[int], vectors: np.ndarray):
+            nonlocal result, done
+            if result is None:
+                result = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[indices] = vectors
+            done += len(indices)
+            if on_progress:
+                on_progress(done, len(texts))
+
+        if workers and workers > 0 and len(batches) > 1:
+            with _using_pool(workers, model_name) as pool:
+                futures = {
+                    pool.submit(_encode_batch, model_name, [texts[i] for i in indices]): indices
+                    for indices in batches
+                }
+                for future in as_completed(futures):
+                    place(futures[future], future.result())
+        else:
+            for indices in batches:
+                place(indices, _encode_batch(model_name, [texts[i] for i in indices]))
+
+        _record_encode(model_name, len(texts), time.perf_counter() - start)
+        return np.ascontiguousarray(result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating embeddings: {str(e)}")
@@ -1,16 +1,99 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
 from langchain_huggingface import HuggingFaceEmbeddings
 from fastapi import HTTPException
 
-def create_embeddings(chunks: list):
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+
+# Models loaded and warmed up at startup (comma separated)
+EMBEDDING_MODELS = [m.strip() for m in os.getenv("EMBEDDING_MODELS", EMBEDDING_MODEL).split(",") if m.strip()]
+
+# Process wide registry, each model is loaded once per worker
+_models: Dict[str, HuggingFaceEmbeddings] = {}
+_models_lock = threading.Lock()
+
+_metrics: Dict[str, Dict[str, float]] = {}
+_metrics_lock = threading.Lock()
+
+
+def _model_metrics(model_name: str) -> Dict[str, float]:
+    metrics = _metrics.get(model_name)
+    if metrics is None:
+        metrics = _metrics.setdefault(model_name, {
+            "load_seconds": 0.0,
+            "encode_calls": 0,
+            "encoded_texts": 0,
+            "encode_seconds_total": 0.0,
+            "encode_seconds_last": 0.0,
+            "encode_seconds_max": 0.0,
+        })
+    return metrics
+
+
+def _record_encode(model_name: str, num_texts: int, elapsed: float):
+    with _metrics_lock:
+        metrics = _model_metrics(model_name)
+        metrics["encode_calls"] += 1
+        metrics["encoded_texts"] += num_texts
+        metrics["encode_seconds_total"] += elapsed
+        metrics["encode_seconds_last"] = elapsed
+        metrics["encode_seconds_max"] = max(metrics["encode_seconds_max"], elapsed)
+
+
+def get_embeddings_model(model_name: str = EMBEDDING_MODEL) -> HuggingFaceEmbeddings:
+    """Return the shared embeddings model, loading it on first use"""
+    model = _models.get(model_name)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            start = time.perf_counter()
+            model = HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={'device': EMBEDDING_DEVICE},
+                encode_kwargs={'normalize_embeddings': True}
+            )
+            elapsed = time.perf_counter() - start
+            _models[model_name] = model
+            with _metrics_lock:
+                _model_metrics(model_name)["load_seconds"] = elapsed
+            print(f"Loaded embedding model {model_name} in {elapsed:.2f}s")
+    return model
+
+
+def warm_up_models(model_names: Optional[List[str]] = None):
+    """Load configured models and run one encode so the first request is not slow"""
+    for model_name in model_names or EMBEDDING_MODELS:
+        model = get_embeddings_model(model_name)
+        start = time.perf_counter()
+        model.embed_documents(["warm up"])
+        _record_encode(model_name, 1, time.perf_counter() - start)
+
+
+def get_embedding_metrics() -> Dict[str, Dict[str, float]]:
+    """Snapshot of load time and encode time metrics per model"""
+    with _metrics_lock:
+        snapshot = {}
+        for model_name, metrics in _metrics.items():
+            snapshot[model_name] = dict(metrics)
+            calls = metrics["encode_calls"]
+            snapshot[model_name]["encode_seconds_avg"] = metrics["encode_seconds_total"] / calls if calls else 0.0
+            snapshot[model_name]["loaded"] = model_name in _models
+        return snapshot
+
+
+def create_embeddings(chunks: list, model_name: str = EMBEDDING_MODEL):
     """Creating embeddings for text chunks"""
     try:
-        embeddings_model = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={'device':'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        embeddings_model = get_embeddings_model(model_name)
+        start = time.perf_counter()
         embeddings = embeddings_model.embed_documents(chunks)
+        _record_encode(model_name, len(chunks), time.perf_counter() - start)
         return embeddings
     except Exception as e:
         raise HTTPException(status_code=500, detail= f"Error creating embeddings: {str(e)}")
-    
\ No newline at end of file
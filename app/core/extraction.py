@@ -1,23 +1,89 @@
 from PyPDF2 import PdfReader
 from fastapi import HTTPException
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Tuple, Union
 import io
+import os
+import mmap
+import multiprocessing
+import shutil
+import tarfile
+import tempfile
+import zipfile
 
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
 
-#Extracat text content from pdf
-def extract_text_from_pdf(file_content: bytes) -> str:
+# Process pool for large PDFs, 0 or 1 extracts pages sequentially
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+PdfSource = Union[bytes, str, Path, BinaryIO]
+
+
+def save_to_tempfile(fileobj: BinaryIO, suffix: str = "") -> str:
+    """Copy an upload stream to a temp file on disk and return its path"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(fileobj, tmp, length=1024 * 1024)
+        return tmp.name
+
+
+@contextmanager
+def open_pdf_source(source: PdfSource):
+    """Binary stream for PdfReader, files on disk are memory mapped instead of copied"""
+    if isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+    elif isinstance(source, (str, Path)):
+        with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+    else:
+        yield source
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    with open_pdf_source(path) as stream:
+        pages = PdfReader(stream).pages
+        return [pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _iter_pages_parallel(path: str, num_pages: int, workers: int) -> Iterator[Tuple[int, str]]:
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, num_pages)) for start in range(0, num_pages, PDF_PAGES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_extract_page_range, path, start, end) for start, end in ranges]
+        # Yield in page order while later ranges are still being extracted
+        for (start, _), future in zip(ranges, futures):
+            for offset, text in enumerate(future.result()):
+                yield start + offset + 1, text
+
+
+def iter_pdf_pages(source: PdfSource, workers: int = PDF_EXTRACT_WORKERS) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for each page of a PDF, starting at page 1"""
     try:
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PdfReader(pdf_file)
-        text_content = ''
-        for i, page in enumerate(pdf_reader.pages):
-            text_content += page.extract_text() +"\n"
-        return text_content.strip()
+        with open_pdf_source(source) as stream:
+            pdf_reader = PdfReader(stream)
+            num_pages = len(pdf_reader.pages)
+            if workers > 1 and isinstance(source, (str, Path)) and num_pages >= PDF_PARALLEL_MIN_PAGES:
+                yield from _iter_pages_parallel(str(source), num_pages, workers)
+                return
+            for i, page in enumerate(pdf_reader.pages):
+                yield i + 1, page.extract_text() or ""
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
+
+
+#Extracat text content from pdf
+def extract_text_from_pdf(file_content: PdfSource) -> str:
+    return "\n".join(text for _, text in iter_pdf_pages(file_content)).strip()
     
 
-def extract_text_from_txt(file_content: bytes) -> str:
-    """Extract text content from TXT bytes"""
+def extract_text_from_txt(file_content: Union[bytes, str, Path]) -> str:
+    """Extract text content from TXT bytes or a file path"""
+    if isinstance(file_content, (str, Path)):
+        file_content = Path(file_content).read_bytes()
     try:
         return file_content.decode('utf-8')
     except UnicodeDecodeError:
@@ -25,4 +91,35 @@ def extract_text_from_txt(file_content: bytes) -> str:
             return file_content.decode('latin-1')
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Error reading TXT file: {str(e)}")
-            
\ No newline at end of file
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def iter_archive_members(filename: str, fileobj: BinaryIO, max_member_bytes: int) -> Iterator[Tuple[str, BinaryIO]]:
+    """Yield (member name, stream) for each regular file in a zip or tar archive.
+
+    A stream is only readable until the next member is requested.
+    """
+    try:
+        if filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(fileobj) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    if info.file_size > max_member_bytes:
+                        raise HTTPException(status_code=413, detail=f"Archive member too large: {info.filename}")
+                    with archive.open(info) as member:
+                        yield info.filename, member
+        else:
+            # Stream mode reads the tar sequentially without seeking
+            with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+                for info in archive:
+                    if not info.isfile():
+                        continue
+                    if info.size > max_member_bytes:
+                        raise HTTPException(status_code=413, detail=f"Archive member too large: {info.name}")
+                    yield info.name, archive.extractfile(info)
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"Error reading archive {filename}: {str(e)}")
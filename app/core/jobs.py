@@ -0,0 +1,177 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+from fastapi import HTTPException
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+# Finished jobs kept around for the progress endpoint
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+
+class StageProgress:
+    def __init__(self, name: str):
+        self.name = name
+        self.status = JobStatus.queued
+        self.done = 0
+        self.total: Optional[int] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.started_at is None:
+            seconds = None
+        else:
+            seconds = (self.finished_at or time.time()) - self.started_at
+        return {
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "seconds": seconds
+        }
+
+
+class IngestionJob:
+    """Tracks status and per stage progress of one ingestion"""
+
+    STAGES = ["extract", "chunk", "embed", "store"]
+
+    def __init__(self, filename: str, stages: Optional[List[str]] = None):
+        self.id = str(uuid.uuid4())
+        self.filename = filename
+        self.status = JobStatus.queued
+        self.stages: Dict[str, StageProgress] = {name: StageProgress(name) for name in (stages or self.STAGES)}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @contextmanager
+    def stage(self, name: str, total: Optional[int] = None):
+        progress = self.stages.setdefault(name, StageProgress(name))
+        progress.status = JobStatus.running
+        progress.total = total
+        progress.started_at = time.time()
+        try:
+            yield progress
+        except Exception:
+            progress.status = JobStatus.failed
+            raise
+        finally:
+            progress.finished_at = time.time()
+        progress.status = JobStatus.completed
+        if progress.total is None:
+            progress.total = progress.done
+
+    def advance(self, name: str, done: int, total: Optional[int] = None):
+        progress = self.stages[name]
+        progress.done = done
+        if total is not None:
+            progress.total = total
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.started_at is None:
+            seconds = None
+        else:
+            seconds = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stages": {name: s.to_dict() for name, s in self.stages.items()},
+            "queued_seconds": (self.started_at or time.time()) - self.created_at,
+            "seconds": seconds,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class IngestionJobQueue:
+    """In process job queue served by a bounded pool of worker threads"""
+
+    def __init__(self, workers: int = INGEST_WORKERS, max_queue: int = INGEST_QUEUE_SIZE, history: int = INGEST_JOB_HISTORY):
+        self.workers = workers
+        self.history = history
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, job: IngestionJob, func: Callable[..., Dict[str, Any]], *args, **kwargs) -> IngestionJob:
+        """Queue func(*args, job=job, **kwargs), raises 503 when the queue is full"""
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim_history()
+        try:
+            self._queue.put_nowait((job, func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise HTTPException(status_code=503, detail="Ingestion queue is full, retry later")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def join(self):
+        """Block until every queued job has finished"""
+        self._queue.join()
+
+    def _trim_history(self):
+        finished = [j.id for j in self._jobs.values() if j.status in (JobStatus.completed, JobStatus.failed)]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            job, func, args, kwargs = item
+            job.status = JobStatus.running
+            job.started_at = time.time()
+            try:
+                job.result = func(*args, job=job, **kwargs)
+                job.status = JobStatus.completed
+            except HTTPException as e:
+                job.error = str(e.detail)
+                job.status = JobStatus.failed
+            except Exception as e:
+                job.error = str(e)
+                job.status = JobStatus.failed
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+
+ingestion_queue = IngestionJobQueue()
@@ -0,0 +1,456 @@
+import os
+import re
+import json
+import math
+import time
+import fcntl
+import threading
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from .models import Chunk
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "data/lexical_index")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Seconds between checks for changes written by another worker
+LEXICAL_INDEX_REFRESH = float(os.getenv("LEXICAL_INDEX_REFRESH", "5"))
+# Log size at which it is folded into a new base generation
+LEXICAL_LOG_COMPACT_BYTES = int(os.getenv("LEXICAL_LOG_COMPACT_BYTES", str(64 * 1024 * 1024)))
+
+# Keeps clause numbers like 4.2 and names like wi-fi together
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _rows(base: Optional[np.ndarray], offsets: np.ndarray, counts: np.ndarray, delta: Dict[int, array], term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Docs and term frequencies of one term. Unsaved postings are copied, they may grow"""
+    parts = []
+    if base is not None and term_id < len(offsets):
+        start = offsets[term_id]
+        parts.append(base[start:start + counts[term_id]])
+    postings = delta.get(term_id)
+    if postings:
+        parts.append(np.frombuffer(postings, dtype=np.uint32).reshape(-1, 2).copy())
+    if not parts:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    rows = parts[0] if len(parts) == 1 else np.concatenate(parts)
+    return rows[:, 0], rows[:, 1]
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk texts keyed by Qdrant point id.
+
+    Postings are uint32 (doc, term frequency) arrays. The base generation is memory
+    mapped from one file, chunks indexed since then live in small per term arrays.
+    Removed chunks are tombstoned.
+
+    Workers share the index through an append only log next to the base. flush()
+    appends the chunks added and removed since the last flush under a file lock, after
+    replaying what other workers appended, and refresh() replays the others' entries.
+    Once the log outgrows LEXICAL_LOG_COMPACT_BYTES a background thread folds it into a
+    new base generation.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_DIR):
+        self.path = path
+        self._lock = threading.RLock()
+        # Local changes not in the log yet, ("add", [(point id, text)]) or ("remove", [point id])
+        self._pending: List[Tuple[str, list]] = []
+        self._compacting = False
+        self.compactions = 0
+        self._reset()
+
+    def _reset(self):
+        self.point_ids: List[str] = []
+        self._doc_of: Dict[str, int] = {}
+        self.doc_lengths = array("I")
+        self.deleted: set = set()
+        self.total_length = 0
+        self.vocab: Dict[str, int] = {}
+        # Memory mapped postings of the base generation, rows of (doc, tf)
+        self._base: Optional[np.ndarray] = None
+        self._base_offsets = np.zeros(0, dtype=np.int64)
+        self._base_counts = np.zeros(0, dtype=np.int64)
+        # Postings added since the base was written, doc and tf interleaved per term
+        self._delta: Dict[int, array] = {}
+        self.generation = 0
+        self._files: Tuple[str, ...] = ()
+        self._log: Optional[str] = None
+        self._log_offset = 0
+        self._meta_mtime = None
+        self._checked_at = time.monotonic()
+        self.load_seconds = 0.0
+
+    @property
+    def live_docs(self) -> int:
+        return len(self.point_ids) - len(self.deleted)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending)
+
+    def __len__(self) -> int:
+        return self.live_docs
+
+    def add(self, point_id: str, text: str):
+        self.add_many([(point_id, text)])
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        """Index (point id, text) pairs, replacing earlier texts of the same points"""
+        items = [(str(point_id), text or "") for point_id, text in items]
+        with self._lock:
+            self._add(items)
+            self._pending.append(("add", items))
+
+    def remove(self, point_ids: Iterable[str]):
+        point_ids = [str(point_id) for point_id in point_ids]
+        with self._lock:
+            self._remove(point_ids)
+            self._pending.append(("remove", point_ids))
+
+    def _add(self, items: Iterable[Tuple[str, str]]):
+        for point_id, text in items:
+            if point_id in self._doc_of:
+                self._tombstone(self._doc_of[point_id])
+            terms = Counter(tokenize(text))
+            doc = len(self.point_ids)
+            self.point_ids.append(point_id)
+            self._doc_of[point_id] = doc
+            length = sum(terms.values())
+            self.doc_lengths.append(length)
+            self.total_length += length
+            for term, tf in terms.items():
+                term_id = self.vocab.setdefault(term, len(self.vocab))
+                postings = self._delta.get(term_id)
+                if postings is None:
+                    postings = self._delta[term_id] = array("I")
+                postings.append(doc)
+                postings.append(tf)
+
+    def _remove(self, point_ids: Iterable[str]):
+        for point_id in point_ids:
+            doc = self._doc_of.pop(point_id, None)
+            if doc is not None:
+                self._tombstone(doc)
+
+    def _tombstone(self, doc: int):
+        if doc not in self.deleted:
+            self.deleted.add(doc)
+            self.total_length -= self.doc_lengths[doc]
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        return _rows(self._base, self._base_offsets, self._base_counts, self._delta, term_id)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """(point id, BM25 score) of the best matching chunks"""
+        terms = set(tokenize(query))
+        # Only the postings of the query terms are gathered under the lock, scoring runs outside it
+        with self._lock:
+            n = self.live_docs
+            if not n:
+                return []
+            avg_length = self.total_length / n if self.total_length else 1.0
+            point_ids = self.point_ids
+            num_docs = len(point_ids)
+            doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+            dead = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted)) if self.deleted else None
+            matches = []
+            for term in terms:
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    continue
+                docs, tfs = self._postings(term_id)
+                if dead is not None:
+                    alive = ~np.isin(docs, dead)
+                    docs, tfs = docs[alive], tfs[alive]
+                if len(docs):
+                    matches.append((docs, tfs, doc_lengths[docs]))
+            # The array cannot grow while a view of it exists
+            del doc_lengths
+
+        scores = np.zeros(num_docs, dtype=np.float32)
+        for docs, tfs, lengths in matches:
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            tfs = tfs.astype(np.float32)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length)
+            # A doc appears once per term, so plain fancy indexing is enough
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(point_ids[d], float(scores[d])) for d in matched]
+
+    @contextmanager
+    def _file_lock(self):
+        """Serializes log appends and compactions of all workers"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.path, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_base(self, meta: Dict):
+        """Map a base generation, its log is replayed from the start"""
+        # Open the files before touching any state, a compaction may have removed them
+        doc_lengths = np.fromfile(os.path.join(self.path, meta["doc_lengths"]), dtype=np.uint32)
+        postings_path = os.path.join(self.path, meta["postings"])
+        base = np.memmap(postings_path, dtype=np.uint32, mode="r").reshape(-1, 2) if os.path.getsize(postings_path) else None
+        self._reset()
+        self.generation = meta["generation"]
+        # Generations written before the log existed have none, the next flush writes a new one
+        self._log = meta.get("log")
+        self._files = tuple(name for name in (meta["postings"], meta["doc_lengths"], self._log) if name)
+        self._meta_mtime = os.stat(os.path.join(self.path, "meta.json")).st_mtime
+        self.point_ids = meta["point_ids"]
+        self._doc_of = {point_id: doc for doc, point_id in enumerate(self.point_ids)}
+        self.doc_lengths = array("I", doc_lengths.tobytes())
+        self.total_length = int(doc_lengths.sum())
+        self.vocab = {term: term_id for term_id, term in enumerate(meta["terms"])}
+        self._base_offsets = np.asarray(meta["offsets"], dtype=np.int64)
+        self._base_counts = np.asarray(meta["counts"], dtype=np.int64)
+        self._base = base
+
+    def _replay(self) -> bool:
+        """Apply log entries written since the last read, True when there were any"""
+        if self._log is None:
+            return False
+        try:
+            with open(os.path.join(self.path, self._log), "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except OSError:
+            return False
+        # A line still being written by another worker is read next time
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return False
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Left behind by a worker that died mid write
+                continue
+            if "add" in entry:
+                self._add(entry["add"])
+            else:
+                self._remove(entry["remove"])
+        self._log_offset += end
+        return True
+
+    def _sync(self) -> bool:
+        """Catch up with the files on disk, keeping local changes that are not in the log yet"""
+        meta = self._read_meta()
+        if meta is None:
+            return False
+        changed = False
+        if meta["generation"] != self.generation:
+            try:
+                self._load_base(meta)
+            except OSError:
+                return False
+            changed = True
+        changed = self._replay() or changed
+        if changed:
+            # Local changes come after everything already in the log
+            for op, items in self._pending:
+                self._add(items) if op == "add" else self._remove(items)
+        return changed
+
+    def _write_generation(self, generation: int, point_ids, doc_lengths, deleted, vocab, base, offsets, counts, delta) -> Dict:
+        """Write a base generation with an empty log, dropping removed chunks"""
+        live = np.ones(len(point_ids), dtype=bool)
+        if deleted:
+            live[list(deleted)] = False
+        remap = np.cumsum(live, dtype=np.int64) - 1
+
+        suffix = f"{generation}-{os.getpid()}"
+        postings_file, lengths_file, log_file = f"postings-{suffix}.bin", f"doc_lengths-{suffix}.bin", f"log-{suffix}.jsonl"
+        terms, term_offsets, term_counts = [], [], []
+        offset = 0
+        with open(os.path.join(self.path, postings_file), "wb") as f:
+            for term, term_id in vocab.items():
+                docs, tfs = _rows(base, offsets, counts, delta, term_id)
+                keep = live[docs]
+                if not keep.any():
+                    continue
+                rows = np.empty((int(keep.sum()), 2), dtype=np.uint32)
+                rows[:, 0] = remap[docs[keep]]
+                rows[:, 1] = tfs[keep]
+                f.write(rows.tobytes())
+                terms.append(term)
+                term_offsets.append(offset)
+                term_counts.append(len(rows))
+                offset += len(rows)
+        np.frombuffer(doc_lengths, dtype=np.uint32)[live].tofile(os.path.join(self.path, lengths_file))
+        open(os.path.join(self.path, log_file), "wb").close()
+
+        meta = {
+            "generation": generation,
+            "postings": postings_file,
+            "doc_lengths": lengths_file,
+            "log": log_file,
+            "point_ids": [p for p, alive in zip(point_ids, live) if alive],
+            "terms": terms,
+            "offsets": term_offsets,
+            "counts": term_counts
+        }
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        # Readers only ever see a complete generation
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+        return meta
+
+    def _compact_locked(self):
+        """Fold the log into a new base generation, the caller holds the file lock"""
+        with self._lock:
+            self._sync()
+            # Copies of the growing parts, searches and local adds go on while the files are written
+            snapshot = (
+                self.generation + 1, list(self.point_ids), array("I", self.doc_lengths), set(self.deleted), dict(self.vocab),
+                self._base, self._base_offsets, self._base_counts, {t: array("I", p) for t, p in self._delta.items()}
+            )
+            written = len(self._pending)
+            previous = self._files
+        meta = self._write_generation(*snapshot)
+        with self._lock:
+            self._load_base(meta)
+            # Changes made while writing are not in the new base
+            self._pending = self._pending[written:]
+            for op, items in self._pending:
+                self._add(items) if op == "add" else self._remove(items)
+            self.compactions += 1
+        for name in previous:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+    def _compact(self):
+        try:
+            with self._file_lock():
+                self._compact_locked()
+        finally:
+            self._compacting = False
+
+    def flush(self):
+        """Append local changes to the shared log, compacting it in the background once it is large"""
+        if not self._pending:
+            return
+        with self._file_lock():
+            with self._lock:
+                self._sync()
+                if self._log is not None:
+                    lines = b"".join(json.dumps({op: items}).encode("utf-8") + b"\n" for op, items in self._pending)
+                    with open(os.path.join(self.path, self._log), "ab") as f:
+                        if f.tell() > self._log_offset:
+                            # End the partial line of a worker that died mid write
+                            f.write(b"\n")
+                        f.write(lines)
+                        self._log_offset = f.tell()
+                    self._pending = []
+            if self._log is None:
+                # Nothing on disk yet, the first flush writes the base
+                self._compact_locked()
+                return
+        if self._log_offset >= LEXICAL_LOG_COMPACT_BYTES and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self._compact, name="lexical-compaction", daemon=True).start()
+
+    def save(self):
+        """Write everything into a new base generation now"""
+        with self._file_lock():
+            self._compact_locked()
+
+    def load(self) -> bool:
+        """Map the base generation and replay its log, False when there is none"""
+        start = time.perf_counter()
+        with self._lock:
+            meta = self._read_meta()
+            if meta is None:
+                return False
+            self._load_base(meta)
+            self._replay()
+            self.load_seconds = time.perf_counter() - start
+        return True
+
+    def refresh(self):
+        """Pick up log entries and generations of other workers, checked at most every few seconds"""
+        now = time.monotonic()
+        if now - self._checked_at < LEXICAL_INDEX_REFRESH:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(os.path.join(self.path, "meta.json")).st_mtime
+        except OSError:
+            return
+        try:
+            log_size = os.path.getsize(os.path.join(self.path, self._log)) if self._log else None
+        except OSError:
+            # Removed by a compaction, the new meta.json is picked up instead
+            log_size = None
+        if mtime != self._meta_mtime or (log_size is not None and log_size != self._log_offset):
+            with self._lock:
+                self._sync()
+
+    def rebuild(self, db: Session, batch_size: int = 2000):
+        """Index every chunk stored in Postgres and save"""
+        with self._file_lock():
+            with self._lock:
+                self._reset()
+                self._pending = []
+                rows = db.query(Chunk.qdrant_point_id, Chunk.text_content).yield_per(batch_size)
+                self._add((str(point_id), text or "") for point_id, text in rows)
+                # Continue after the generation on disk so its files get replaced
+                meta = self._read_meta()
+                if meta is not None:
+                    self.generation = meta["generation"]
+                    self._files = tuple(name for name in (meta["postings"], meta["doc_lengths"], meta.get("log")) if name)
+            self._compact_locked()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "documents": self.live_docs,
+                "deleted": len(self.deleted),
+                "terms": len(self.vocab),
+                "mapped_postings": int(self._base_counts.sum()) if len(self._base_counts) else 0,
+                "pending_postings": sum(len(p) // 2 for p in self._delta.values()),
+                "unflushed_changes": len(self._pending),
+                "log_bytes": self._log_offset,
+                "generation": self.generation,
+                "compactions": self.compactions,
+                "load_seconds": self.load_seconds
+            }
+
+
+lexical_index = LexicalIndex()
+
+
+def load_or_rebuild(db: Session):
+    """Startup: map the saved index, or build it from Postgres the first time"""
+    if not lexical_index.load():
+        lexical_index.rebuild(db)
@@ -1,8 +1,11 @@
 import os
-from typing import List, Dict
-from groq import Groq
+import time
+import threading
+from typing import AsyncIterator, List, Dict, Optional
+from groq import Groq, AsyncGroq
 from dotenv import load_dotenv
-from core.memory import save_chat_history
+from core.memory import save_chat_messages, asave_chat_messages
+from core.tracing import span, traced
 
 load_dotenv()
 
@@ -10,28 +13,153 @@ GROQ_MODEL = os.getenv("GROQ_MODEL")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
 client = Groq(api_key=GROQ_API_KEY)
+async_client = AsyncGroq(api_key=GROQ_API_KEY)
 
+_metrics = {
+    "requests": 0,
+    "streamed_requests": 0,
+    "completion_tokens": 0,
+    "ttft_seconds_total": 0.0,
+    "ttft_seconds_last": 0.0,
+    "ttft_seconds_max": 0.0,
+    "generation_seconds_total": 0.0,
+    "tokens_per_sec_last": 0.0
+}
+_metrics_lock = threading.Lock()
+
+def _record_generation(ttft: float, elapsed: float, tokens: int, streamed: bool) -> Dict[str, float]:
+    """Record one completion. Without streaming the first token arrives with the last one"""
+    stats = {
+        "ttft_seconds": ttft,
+        "generation_seconds": elapsed,
+        "completion_tokens": tokens,
+        "tokens_per_sec": tokens / elapsed if elapsed else 0.0
+    }
+    with _metrics_lock:
+        _metrics["requests"] += 1
+        _metrics["streamed_requests"] += int(streamed)
+        _metrics["completion_tokens"] += tokens
+        _metrics["ttft_seconds_total"] += ttft
+        _metrics["ttft_seconds_last"] = ttft
+        _metrics["ttft_seconds_max"] = max(_metrics["ttft_seconds_max"], ttft)
+        _metrics["generation_seconds_total"] += elapsed
+        _metrics["tokens_per_sec_last"] = stats["tokens_per_sec"]
+    return stats
+
+def get_generation_metrics() -> Dict[str, float]:
+    """Snapshot of time to first token and token throughput"""
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    requests = snapshot["requests"]
+    snapshot["ttft_seconds_avg"] = snapshot["ttft_seconds_total"] / requests if requests else 0.0
+    seconds = snapshot["generation_seconds_total"]
+    snapshot["tokens_per_sec_avg"] = snapshot["completion_tokens"] / seconds if seconds else 0.0
+    return snapshot
+
+def _completion_kwargs(messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Dict:
+    return dict(
+        model=GROQ_MODEL,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        top_p=1.0,
+        frequency_penalty=0.0,
+        presence_penalty=0.0
+    )
+
+def _user_question(messages: List[Dict[str, str]]) -> str:
+    """The question part of the last user message, without the context block"""
+    if messages and messages[-1]["role"] == "user":
+        return messages[-1]["content"].split("Question:")[-1].split("Context:")[0].strip()
+    return ""
+
+def _turn(messages: List[Dict[str, str]], answer: str):
+    """Last user question and the answer, as saved into memory"""
+    turn = []
+    if messages and messages[-1]["role"] == "user":
+        turn.append(("user", _user_question(messages)))
+    turn.append(("assistant", answer))
+    return turn
+
+@traced("llm")
 def generate_response(session_id: str, messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 800) -> str:
     try:
-        response = client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=1.0,
-            frequency_penalty=0.0,
-            presence_penalty=0.0
-        )
+        start = time.perf_counter()
+        response = client.chat.completions.create(**_completion_kwargs(messages, temperature, max_tokens))
+        elapsed = time.perf_counter() - start
+        _record_generation(elapsed, elapsed, response.usage.completion_tokens if response.usage else 0, streamed=False)
         
         answer = response.choices[0].message.content.strip()
 
         # Save last user + assistant messages into memory
-        if messages and messages[-1]["role"] == "user":
-            user_question = messages[-1]["content"].split("Question:")[-1].split("Context:")[0].strip()
-            save_chat_history(session_id, "user", user_question)
-        save_chat_history(session_id, "assistant", answer)
+        save_chat_messages(session_id, _turn(messages, answer))
 
         return answer
         
     except Exception as e:
-        raise Exception(f"Failed to generate response: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Failed to generate response: {str(e)}")
+
+@traced("llm")
+async def agenerate_response(session_id: Optional[str], messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 800) -> str:
+    """Chat history is only saved when there is a session"""
+    try:
+        start = time.perf_counter()
+        response = await async_client.chat.completions.create(**_completion_kwargs(messages, temperature, max_tokens))
+        elapsed = time.perf_counter() - start
+        _record_generation(elapsed, elapsed, response.usage.completion_tokens if response.usage else 0, streamed=False)
+
+        answer = response.choices[0].message.content.strip()
+
+        if session_id:
+            await asave_chat_messages(session_id, _turn(messages, answer))
+
+        return answer
+
+    except Exception as e:
+        raise Exception(f"Failed to generate response: {str(e)}")
+
+async def astream_response(
+    session_id: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.2,
+    max_tokens: int = 800,
+    stats: Optional[Dict[str, float]] = None
+) -> AsyncIterator[str]:
+    """Yield answer tokens as Groq produces them.
+
+    Chat history is saved once the stream completes, stats is filled with the
+    time to first token and tokens/sec of this request.
+    """
+    try:
+        start = time.perf_counter()
+        ttft = None
+        tokens = 0
+        usage_tokens = None
+        parts = []
+        with span("llm"):
+            stream = await async_client.chat.completions.create(stream=True, **_completion_kwargs(messages, temperature, max_tokens))
+            async for chunk in stream:
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and getattr(x_groq, "usage", None):
+                    usage_tokens = x_groq.usage.completion_tokens
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if not token:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                tokens += 1
+                parts.append(token)
+                yield token
+        elapsed = time.perf_counter() - start
+
+    except Exception as e:
+        raise Exception(f"Failed to generate response: {str(e)}")
+
+    # Usage from the last chunk is exact, content deltas are about one token each
+    result = _record_generation(ttft if ttft is not None else elapsed, elapsed, usage_tokens or tokens, streamed=True)
+    if stats is not None:
+        stats.update(result)
+
+    await asave_chat_messages(session_id, _turn(messages, "".join(parts).strip()))
\ No newline at end of file
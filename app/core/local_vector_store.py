@@ -0,0 +1,755 @@
+import os
+import math
+import json
+import shutil
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, HasIdCondition, FilterSelector, PointIdsList,
+    ScoredPoint, Record, CountResult, OrderBy, SetPayloadOperation, ScalarQuantization, BinaryQuantization,
+    ScalarQuantizationConfig, ScalarType, BinaryQuantizationConfig, SearchParams
+)
+# qdrant_client.models re-exports a fastembed QueryResponse under the same name
+from qdrant_client.http.models import QueryResponse
+
+# "exact" scans the whole matrix, "hnsw" adds an approximate index once a collection is large
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "exact")
+LOCAL_ANN_MIN_POINTS = int(os.getenv("LOCAL_ANN_MIN_POINTS", "20000"))
+LOCAL_ANN_M = int(os.getenv("LOCAL_ANN_M", "16"))
+LOCAL_ANN_EF_CONSTRUCTION = int(os.getenv("LOCAL_ANN_EF_CONSTRUCTION", "200"))
+LOCAL_ANN_EF = int(os.getenv("LOCAL_ANN_EF", "64"))
+# Appended points after which the ANN index is written to disk again
+LOCAL_ANN_SAVE_EVERY = int(os.getenv("LOCAL_ANN_SAVE_EVERY", "10000"))
+# Share of deleted rows that triggers rewriting a collection
+LOCAL_COMPACT_RATIO = float(os.getenv("LOCAL_COMPACT_RATIO", "0.3"))
+# Rows scored per step on quantized vectors, bounds the float32 copy made for the matmul
+QUANTIZED_BLOCK_ROWS = 4096
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _values(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def _match_condition(condition: FieldCondition, payload: Dict) -> bool:
+    value = payload.get(condition.key)
+    if condition.match is not None:
+        match = condition.match
+        if value is None:
+            return False
+        if hasattr(match, "value"):
+            return match.value in _values(value)
+        if hasattr(match, "any"):
+            return any(v in match.any for v in _values(value))
+        if hasattr(match, "except_"):
+            return not any(v in match.except_ for v in _values(value))
+        raise ValueError(f"Unsupported match {type(match).__name__}")
+    if condition.range is not None:
+        if value is None:
+            return False
+        r = condition.range
+        return (
+            (r.gt is None or value > r.gt)
+            and (r.gte is None or value >= r.gte)
+            and (r.lt is None or value < r.lt)
+            and (r.lte is None or value <= r.lte)
+        )
+    raise ValueError("Unsupported field condition")
+
+
+def _matches(flt: Optional[Filter], payload: Dict, point_id: str) -> bool:
+    """Qdrant filter semantics for must / should / must_not over field and id conditions"""
+    if flt is None:
+        return True
+
+    def check(condition) -> bool:
+        if isinstance(condition, Filter):
+            return _matches(condition, payload, point_id)
+        if isinstance(condition, HasIdCondition):
+            return point_id in {str(i) for i in condition.has_id}
+        return _match_condition(condition, payload)
+
+    must = flt.must if isinstance(flt.must, list) else ([flt.must] if flt.must else [])
+    should = flt.should if isinstance(flt.should, list) else ([flt.should] if flt.should else [])
+    must_not = flt.must_not if isinstance(flt.must_not, list) else ([flt.must_not] if flt.must_not else [])
+    return (
+        all(check(c) for c in must)
+        and (not should or any(check(c) for c in should))
+        and not any(check(c) for c in must_not)
+    )
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _quantization_name(config) -> Optional[str]:
+    if config is None:
+        return None
+    if isinstance(config, ScalarQuantization):
+        return "int8"
+    if isinstance(config, BinaryQuantization):
+        return "binary"
+    raise ValueError(f"Unsupported quantization {type(config).__name__}")
+
+
+def _quantization_config(name: Optional[str]):
+    if name == "int8":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8))
+    if name == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig())
+    return None
+
+
+def _select(payload: Optional[Dict], with_payload) -> Optional[Dict]:
+    if not with_payload:
+        return None
+    # Deleted after the search took its snapshot
+    payload = payload or {}
+    if with_payload is True:
+        return dict(payload)
+    return {k: payload[k] for k in with_payload if k in payload}
+
+
+def _point(row_ids: List[str], payloads: List[Optional[Dict]], matrix: np.ndarray, row: int, with_payload, with_vectors) -> Dict:
+    return {
+        "id": row_ids[row],
+        "payload": _select(payloads[row], with_payload),
+        "vector": np.asarray(matrix[row]).tolist() if with_vectors else None
+    }
+
+
+class _LocalCollection:
+    """One collection: an append-only float32 matrix on disk plus a point log.
+
+    vectors.f32 holds one row per upserted point and is memory mapped for search.
+    points.jsonl records upserts, payload updates and deletes and is replayed on load.
+    Replaced or deleted rows are tombstoned until the collection is compacted.
+    A quantized collection also appends int8 or sign bit codes of every row to codes.bin,
+    searches those and only reads the float32 rows of the best candidates to rescore.
+    """
+
+    def __init__(self, path: str, size: Optional[int] = None, distance: Optional[str] = None, quantization: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        if size is not None:
+            os.makedirs(path, exist_ok=True)
+            self.config = {"size": size, "distance": distance, "quantization": quantization, "scale": None}
+            self._save_config()
+        with open(self._config_path) as f:
+            self.config = json.load(f)
+        self.size = self.config["size"]
+        self.distance = self.config["distance"]
+        self.quantization = self.config.get("quantization")
+        if self.distance not in (Distance.COSINE, Distance.DOT):
+            raise ValueError(f"Local vector store supports cosine and dot distance, not {self.distance}")
+        self._load_state()
+
+    def _load_state(self):
+        """Read the collection files into fresh objects, searches keep the ones they started with"""
+        self.row_ids: List[str] = []
+        self.payloads: List[Optional[Dict]] = []
+        self.row_of: Dict[str, int] = {}
+        self.indexed_fields: Dict[str, Dict[Any, set]] = {}
+        self._matrix = np.empty((0, self.size), dtype=np.float32)
+        self._codes = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._ann = None
+        self._ann_saved_rows = 0
+        self._load()
+
+    @property
+    def _config_path(self) -> str:
+        return os.path.join(self.path, "config.json")
+
+    @property
+    def _codes_path(self) -> str:
+        return os.path.join(self.path, "codes.bin")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "points.jsonl")
+
+    @property
+    def _ann_path(self) -> str:
+        return os.path.join(self.path, "hnsw.bin")
+
+    def _load(self):
+        if os.path.exists(self._log_path):
+            with open(self._log_path, "rb") as f:
+                logged = 0
+                for line in f:
+                    # A torn last line is a write that crashed, cut it so the next entry starts clean
+                    if not line.endswith(b"\n"):
+                        f.close()
+                        os.truncate(self._log_path, logged)
+                        break
+                    logged += len(line)
+                    entry = json.loads(line)
+                    op = entry["op"]
+                    if op == "index":
+                        self.indexed_fields.setdefault(entry["key"], {})
+                    elif op == "upsert":
+                        self._apply_upsert(entry["id"], entry["row"], entry["payload"])
+                    elif op == "set_payload":
+                        self._apply_set_payload(entry["id"], entry["payload"])
+                    elif op == "delete":
+                        self._apply_delete(entry["id"])
+        self._truncate_rows()
+        self._remap()
+        self._alive = np.zeros(len(self.row_ids), dtype=bool)
+        for row in self.row_of.values():
+            self._alive[row] = True
+        for key in self.indexed_fields:
+            self._build_field_index(key)
+        self._load_ann()
+
+    def _remap(self):
+        rows = len(self.row_ids)
+        if rows and os.path.exists(self._vectors_path):
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.size))
+        else:
+            self._matrix = np.empty((0, self.size), dtype=np.float32)
+        if self.quantization and rows and os.path.exists(self._codes_path):
+            self._codes = np.memmap(self._codes_path, dtype=self._code_dtype, mode="r", shape=(rows, self._code_width))
+
+    def _save_config(self):
+        tmp = self._config_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.config, f)
+        os.replace(tmp, self._config_path)
+
+    # ---- quantization ----
+
+    @property
+    def _code_dtype(self):
+        return np.uint8 if self.quantization == "binary" else np.int8
+
+    @property
+    def _code_width(self) -> int:
+        return (self.size + 7) // 8 if self.quantization == "binary" else self.size
+
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        if self.quantization == "binary":
+            return np.packbits(vectors > 0, axis=-1)
+        if self.config["scale"] is None:
+            # Like Qdrant, the 0.99 quantile sets the range so outliers do not waste it
+            self.config["scale"] = float(np.quantile(np.abs(vectors), 0.99)) / 127 or 1.0
+            self._save_config()
+        return np.clip(np.rint(vectors / self.config["scale"]), -127, 127).astype(np.int8)
+
+    def _quantized_scores(self, codes: np.ndarray, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Approximate scores of rows from their codes, on the scale of the exact ones"""
+        scores = np.empty(len(rows), dtype=np.float32)
+        # Without tombstones rows is every row, slicing avoids a gather copy
+        everything = len(rows) == len(codes)
+
+        def blocks():
+            for start in range(0, len(rows), QUANTIZED_BLOCK_ROWS):
+                end = start + QUANTIZED_BLOCK_ROWS
+                yield start, codes[start:end] if everything else codes[rows[start:end]]
+
+        if self.quantization == "binary":
+            bits = np.packbits(query > 0)
+            for start, block in blocks():
+                scores[start:start + len(block)] = self.size - 2 * _POPCOUNT[block ^ bits].sum(axis=1, dtype=np.int32)
+            # Matching sign bits approximate the angle between the vectors
+            return scores / self.size
+        # The query stays in float32, only the stored side carries quantization error
+        for start, block in blocks():
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores * self.config["scale"]
+
+    def _append_log(self, entries: Iterable[Dict]):
+        with open(self._log_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_rows(self, path: str, row_bytes: int, start: int, data: np.ndarray):
+        """Write rows from `start` on, cutting off rows a crashed upsert left past the log"""
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.truncate(start * row_bytes)
+            f.seek(start * row_bytes)
+            f.write(np.ascontiguousarray(data).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncate_rows(self):
+        """Drop rows written to the vector and code files that never made it into the log"""
+        rows = len(self.row_ids)
+        for path, row_bytes in ((self._vectors_path, self.size * 4), (self._codes_path, self._code_width)):
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_bytes:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_bytes)
+
+    def _apply_upsert(self, point_id: str, row: int, payload: Optional[Dict]):
+        old = self.row_of.get(point_id)
+        if old is not None:
+            self.payloads[old] = None
+        while len(self.row_ids) <= row:
+            self.row_ids.append("")
+            self.payloads.append(None)
+        self.row_ids[row] = point_id
+        self.payloads[row] = payload or {}
+        self.row_of[point_id] = row
+        return old
+
+    def _apply_set_payload(self, point_id: str, payload: Dict):
+        row = self.row_of.get(point_id)
+        if row is not None:
+            self.payloads[row] = {**self.payloads[row], **payload}
+        return row
+
+    def _apply_delete(self, point_id: str):
+        row = self.row_of.pop(point_id, None)
+        if row is not None:
+            self.payloads[row] = None
+        return row
+
+    # ---- payload indexes ----
+
+    def _build_field_index(self, key: str):
+        index: Dict[Any, set] = {}
+        for point_id, row in self.row_of.items():
+            for value in _values(self.payloads[row].get(key)) if key in self.payloads[row] else []:
+                index.setdefault(value, set()).add(row)
+        self.indexed_fields[key] = index
+
+    def _index_row(self, row: int, payload: Dict, add: bool):
+        for key, index in self.indexed_fields.items():
+            if key not in payload:
+                continue
+            for value in _values(payload[key]):
+                if add:
+                    index.setdefault(value, set()).add(row)
+                else:
+                    rows = index.get(value)
+                    if rows is not None:
+                        rows.discard(row)
+
+    def create_payload_index(self, key: str):
+        with self._lock:
+            if key not in self.indexed_fields:
+                self._append_log([{"op": "index", "key": key}])
+                self._build_field_index(key)
+
+    def _candidate_rows(self, flt: Optional[Filter]) -> Optional[np.ndarray]:
+        """Rows matching a filter, narrowed by payload indexes of must match conditions"""
+        if flt is None:
+            return None
+        narrowed: Optional[set] = None
+        must = flt.must if isinstance(flt.must, list) else ([flt.must] if flt.must else [])
+        for condition in must:
+            if isinstance(condition, HasIdCondition):
+                rows = {self.row_of[str(i)] for i in condition.has_id if str(i) in self.row_of}
+                narrowed = rows if narrowed is None else narrowed & rows
+            elif isinstance(condition, FieldCondition) and condition.key in self.indexed_fields and condition.match is not None:
+                index = self.indexed_fields[condition.key]
+                if hasattr(condition.match, "value"):
+                    rows = set(index.get(condition.match.value, ()))
+                elif hasattr(condition.match, "any"):
+                    rows = set().union(*(index.get(v, set()) for v in condition.match.any)) if condition.match.any else set()
+                else:
+                    continue
+                narrowed = rows if narrowed is None else narrowed & rows
+        candidates = narrowed if narrowed is not None else self.row_of.values()
+        return np.fromiter(
+            (row for row in candidates if self._alive[row] and _matches(flt, self.payloads[row], self.row_ids[row])),
+            dtype=np.int64
+        )
+
+    # ---- ANN index ----
+
+    def _ann_wanted(self) -> bool:
+        return LOCAL_VECTOR_INDEX == "hnsw" and len(self.row_of) >= LOCAL_ANN_MIN_POINTS
+
+    def _ann_space(self) -> str:
+        return "cosine" if self.distance == Distance.COSINE else "ip"
+
+    def _load_ann(self):
+        if LOCAL_VECTOR_INDEX != "hnsw":
+            return
+        try:
+            import hnswlib
+        except ImportError:
+            print("hnswlib is not installed, local vector search stays exact")
+            return
+        if os.path.exists(self._ann_path):
+            ann = hnswlib.Index(space=self._ann_space(), dim=self.size)
+            ann.load_index(self._ann_path, max_elements=max(len(self.row_ids), 1), allow_replace_deleted=False)
+            self._ann = ann
+            self._ann_saved_rows = ann.get_current_count()
+            # Rows appended and deleted since the index was saved
+            if self._ann_saved_rows < len(self.row_ids):
+                self._ann_add(range(self._ann_saved_rows, len(self.row_ids)))
+            for row in np.flatnonzero(~self._alive):
+                self._ann_delete(int(row))
+        elif self._ann_wanted():
+            self._build_ann()
+
+    def _build_ann(self):
+        import hnswlib
+        ann = hnswlib.Index(space=self._ann_space(), dim=self.size)
+        ann.init_index(max_elements=max(len(self.row_ids), 1024), M=LOCAL_ANN_M, ef_construction=LOCAL_ANN_EF_CONSTRUCTION)
+        ann.set_ef(LOCAL_ANN_EF)
+        self._ann = ann
+        self._ann_add(range(len(self.row_ids)))
+        for row in np.flatnonzero(~self._alive):
+            self._ann_delete(int(row))
+        self._save_ann()
+
+    def _ann_add(self, rows):
+        rows = np.asarray(list(rows), dtype=np.int64)
+        if not len(rows):
+            return
+        needed = int(rows.max()) + 1
+        if needed > self._ann.get_max_elements():
+            self._ann.resize_index(max(needed, self._ann.get_max_elements() * 2))
+        self._ann.add_items(np.asarray(self._matrix[rows]), rows)
+        self._ann.set_ef(LOCAL_ANN_EF)
+
+    def _ann_delete(self, row: int):
+        try:
+            self._ann.mark_deleted(row)
+        except RuntimeError:
+            # Already marked
+            pass
+
+    def _save_ann(self):
+        if self._ann is not None:
+            self._ann.save_index(self._ann_path)
+            self._ann_saved_rows = self._ann.get_current_count()
+
+    # ---- writes ----
+
+    def upsert(self, points: List[PointStruct]):
+        with self._lock:
+            if not points:
+                return
+            vectors = np.asarray([p.vector for p in points], dtype=np.float32)
+            if vectors.shape[1] != self.size:
+                raise ValueError(f"Vector size mismatch: collection={self.size}, points={vectors.shape[1]}")
+            if self.distance == Distance.COSINE:
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                vectors = vectors / np.where(norms == 0, 1, norms)
+
+            # Rows reach disk before the log entries pointing at them, and both before readers see them
+            start = len(self.row_ids)
+            self._write_rows(self._vectors_path, self.size * 4, start, vectors)
+            if self.quantization:
+                self._write_rows(self._codes_path, self._code_width, start, self._quantize(vectors))
+            entries = [
+                {"op": "upsert", "id": str(point.id), "row": start + i, "payload": point.payload or {}}
+                for i, point in enumerate(points)
+            ]
+            self._append_log(entries)
+
+            replaced = []
+            for entry in entries:
+                point_id = entry["id"]
+                if point_id in self.row_of:
+                    self._index_row(self.row_of[point_id], self.payloads[self.row_of[point_id]], add=False)
+                old = self._apply_upsert(point_id, entry["row"], entry["payload"])
+                if old is not None:
+                    replaced.append(old)
+
+            self._remap()
+            alive = np.ones(len(self.row_ids), dtype=bool)
+            alive[:len(self._alive)] = self._alive
+            alive[replaced] = False
+            self._alive = alive
+            for i, point in enumerate(points):
+                self._index_row(start + i, point.payload or {}, add=True)
+
+            if self._ann is not None:
+                self._ann_add(range(start, len(self.row_ids)))
+                for row in replaced:
+                    self._ann_delete(row)
+                if len(self.row_ids) - self._ann_saved_rows >= LOCAL_ANN_SAVE_EVERY:
+                    self._save_ann()
+            elif self._ann_wanted():
+                self._build_ann()
+
+    def set_payload(self, point_ids: List[str], payload: Dict):
+        with self._lock:
+            entries = []
+            for point_id in point_ids:
+                point_id = str(point_id)
+                row = self.row_of.get(point_id)
+                if row is None:
+                    continue
+                self._index_row(row, self.payloads[row], add=False)
+                self._apply_set_payload(point_id, payload)
+                self._index_row(row, self.payloads[row], add=True)
+                entries.append({"op": "set_payload", "id": point_id, "payload": payload})
+            self._append_log(entries)
+
+    def delete(self, point_ids: Iterable[str]):
+        with self._lock:
+            entries = []
+            for point_id in point_ids:
+                point_id = str(point_id)
+                payload = self.payloads[self.row_of[point_id]] if point_id in self.row_of else None
+                row = self._apply_delete(point_id)
+                if row is None:
+                    continue
+                self._index_row(row, payload, add=False)
+                self._alive[row] = False
+                if self._ann is not None:
+                    self._ann_delete(row)
+                entries.append({"op": "delete", "id": point_id})
+            self._append_log(entries)
+            dead = len(self.row_ids) - len(self.row_of)
+            if dead > 1000 and dead > LOCAL_COMPACT_RATIO * len(self.row_ids):
+                self.compact()
+
+    def compact(self):
+        """Rewrite vectors and log without tombstoned rows"""
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            tmp = self.path + ".compact"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            shutil.copy(os.path.join(self.path, "config.json"), tmp)
+            np.asarray(self._matrix[rows]).tofile(os.path.join(tmp, "vectors.f32"))
+            if self._codes is not None:
+                np.asarray(self._codes[rows]).tofile(os.path.join(tmp, "codes.bin"))
+            with open(os.path.join(tmp, "points.jsonl"), "w") as f:
+                for key in self.indexed_fields:
+                    f.write(json.dumps({"op": "index", "key": key}) + "\n")
+                for new_row, row in enumerate(rows):
+                    f.write(json.dumps({"op": "upsert", "id": self.row_ids[row], "row": new_row, "payload": self.payloads[row]}) + "\n")
+            old = self.path + ".old"
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(self.path, old)
+            os.replace(tmp, self.path)
+            shutil.rmtree(old, ignore_errors=True)
+            # Same object and lock, callers waiting on the lock see the compacted state
+            self._load_state()
+
+    # ---- reads ----
+
+    def _snapshot(self, flt: Optional[Filter]):
+        """State a search reads, candidate rows are resolved while writers are held off"""
+        with self._lock:
+            return self._matrix, self._codes, self._alive.copy(), self._ann, self.row_ids, self.payloads, self._candidate_rows(flt)
+
+    def search(
+        self,
+        vector,
+        limit: int,
+        flt: Optional[Filter] = None,
+        score_threshold: Optional[float] = None,
+        params: Optional[SearchParams] = None,
+        with_payload=False,
+        with_vectors=False
+    ) -> List[Tuple[Dict, float]]:
+        """(point, score) of the nearest points, best first.
+
+        Quantized collections honor params.quantization like Qdrant: ignore, rescore and oversampling.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        if self.distance == Distance.COSINE:
+            norm = np.linalg.norm(query)
+            query = query / norm if norm else query
+        matrix, codes, alive, ann, row_ids, payloads, candidates = self._snapshot(flt)
+        if not len(matrix):
+            return []
+
+        if ann is not None and candidates is None:
+            k = min(limit, int(alive.sum()))
+            if not k:
+                return []
+            labels, distances = ann.knn_query(query, k=k)
+            # hnswlib returns distances, 1 - cosine or 1 - inner product
+            hits = [(int(row), float(1 - d)) for row, d in zip(labels[0], distances[0])]
+        else:
+            rows = candidates if candidates is not None else np.flatnonzero(alive)
+            if not len(rows):
+                return []
+            quantization = params.quantization if params is not None else None
+            if codes is not None and not (quantization and quantization.ignore):
+                rescore = quantization is None or quantization.rescore is not False
+                oversampling = quantization.oversampling if quantization and quantization.oversampling else 1.0
+                scores = self._quantized_scores(codes, rows, query)
+                top = _top(scores, min(math.ceil(limit * oversampling) if rescore else limit, len(rows)))
+                rows, scores = rows[top], scores[top]
+                if rescore:
+                    # Only the candidates' float32 rows are read from disk
+                    scores = np.asarray(matrix[rows]) @ query
+            elif candidates is not None or len(rows) < len(matrix):
+                scores = matrix[rows] @ query
+            else:
+                scores = np.asarray(matrix @ query)
+            top = _top(scores, min(limit, len(rows)))
+            hits = [(int(rows[i]), float(scores[i])) for i in top]
+        if score_threshold is not None:
+            hits = [(row, score) for row, score in hits if score >= score_threshold]
+        # Rows are numbered per snapshot, a compaction since then renumbers them
+        return [(_point(row_ids, payloads, matrix, row, with_payload, with_vectors), score) for row, score in hits]
+
+    def point(self, row: int, with_payload, with_vectors) -> Dict:
+        return _point(self.row_ids, self.payloads, self._matrix, row, with_payload, with_vectors)
+
+    def matching_rows(self, flt: Optional[Filter]) -> List[int]:
+        with self._lock:
+            if flt is None:
+                return sorted(self.row_of.values())
+            return sorted(int(r) for r in self._candidate_rows(flt))
+
+
+class LocalVectorStore:
+    """Embedded vector store answering the subset of the QdrantClient API this app uses.
+
+    Collections live under one directory, so vector_db, retrieval and the answer cache
+    work against it unchanged when VECTOR_STORE=local.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._collections: Dict[str, _LocalCollection] = {}
+        self._lock = threading.Lock()
+
+    def _collection_path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _get(self, name: str) -> _LocalCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.get(name)
+                if collection is None:
+                    if not os.path.exists(os.path.join(self._collection_path(name), "config.json")):
+                        raise ValueError(f"Collection {name} not found")
+                    collection = self._collections[name] = _LocalCollection(self._collection_path(name))
+        return collection
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self._collections or os.path.exists(os.path.join(self._collection_path(collection_name), "config.json"))
+
+    def create_collection(self, collection_name: str, vectors_config: VectorParams, quantization_config=None, **kwargs):
+        with self._lock:
+            if self.collection_exists(collection_name):
+                raise ValueError(f"Collection {collection_name} already exists")
+            self._collections[collection_name] = _LocalCollection(
+                self._collection_path(collection_name), vectors_config.size, vectors_config.distance,
+                _quantization_name(quantization_config)
+            )
+        return True
+
+    def delete_collection(self, collection_name: str):
+        with self._lock:
+            self._collections.pop(collection_name, None)
+            shutil.rmtree(self._collection_path(collection_name), ignore_errors=True)
+        return True
+
+    def get_collection(self, collection_name: str):
+        collection = self._get(collection_name)
+        vectors = VectorParams(size=collection.size, distance=collection.distance)
+        return SimpleNamespace(
+            points_count=len(collection.row_of),
+            config=SimpleNamespace(params=SimpleNamespace(vectors=vectors), quantization_config=_quantization_config(collection.quantization))
+        )
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, **kwargs):
+        self._get(collection_name).create_payload_index(field_name)
+
+    def upsert(self, collection_name: str, points: List[PointStruct], wait: bool = True, **kwargs):
+        self._get(collection_name).upsert(points)
+
+    def query_points(
+        self,
+        collection_name: str,
+        query,
+        limit: int = 10,
+        with_payload=False,
+        with_vectors=False,
+        query_filter: Optional[Filter] = None,
+        score_threshold: Optional[float] = None,
+        search_params: Optional[SearchParams] = None,
+        **kwargs
+    ) -> QueryResponse:
+        hits = self._get(collection_name).search(query, limit, query_filter, score_threshold, search_params, with_payload, with_vectors)
+        return QueryResponse(points=[ScoredPoint(version=0, score=score, **point) for point, score in hits])
+
+    def query_batch_points(self, collection_name: str, requests: List, **kwargs) -> List[QueryResponse]:
+        return [
+            self.query_points(
+                collection_name, request.query, limit=request.limit or 10, with_payload=request.with_payload or False,
+                with_vectors=request.with_vector or False, query_filter=request.filter,
+                score_threshold=request.score_threshold, search_params=request.params
+            )
+            for request in requests
+        ]
+
+    def retrieve(self, collection_name: str, ids: List, with_payload=True, with_vectors=False, **kwargs) -> List[Record]:
+        collection = self._get(collection_name)
+        with collection._lock:
+            rows = [collection.row_of.get(str(i)) for i in ids]
+            return [Record(**collection.point(row, with_payload, with_vectors)) for row in rows if row is not None]
+
+    def _selected_ids(self, collection: _LocalCollection, points_selector) -> List[str]:
+        if isinstance(points_selector, PointIdsList):
+            return [str(p) for p in points_selector.points]
+        if isinstance(points_selector, (FilterSelector, Filter)):
+            flt = points_selector.filter if isinstance(points_selector, FilterSelector) else points_selector
+            with collection._lock:
+                return [collection.row_ids[row] for row in collection.matching_rows(flt)]
+        return [str(p) for p in points_selector]
+
+    def delete(self, collection_name: str, points_selector, **kwargs):
+        collection = self._get(collection_name)
+        collection.delete(self._selected_ids(collection, points_selector))
+
+    def set_payload(self, collection_name: str, payload: Dict, points, **kwargs):
+        collection = self._get(collection_name)
+        collection.set_payload(self._selected_ids(collection, points), payload)
+
+    def batch_update_points(self, collection_name: str, update_operations: List, **kwargs):
+        for operation in update_operations:
+            if not isinstance(operation, SetPayloadOperation):
+                raise ValueError(f"Unsupported update operation {type(operation).__name__}")
+            self.set_payload(collection_name, operation.set_payload.payload, operation.set_payload.points)
+
+    def count(self, collection_name: str, count_filter: Optional[Filter] = None, exact: bool = True, **kwargs) -> CountResult:
+        return CountResult(count=len(self._get(collection_name).matching_rows(count_filter)))
+
+    def scroll(
+        self,
+        collection_name: str,
+        scroll_filter: Optional[Filter] = None,
+        limit: int = 10,
+        offset=None,
+        with_payload=True,
+        with_vectors=False,
+        order_by: Optional[OrderBy] = None,
+        **kwargs
+    ):
+        collection = self._get(collection_name)
+        # Row numbers are only stable while the lock keeps compaction out
+        with collection._lock:
+            rows = collection.matching_rows(scroll_filter)
+            if order_by is not None:
+                key = order_by.key if isinstance(order_by, OrderBy) else order_by
+                reverse = isinstance(order_by, OrderBy) and str(order_by.direction).lower().endswith("desc")
+                rows = sorted(
+                    (r for r in rows if collection.payloads[r].get(key) is not None),
+                    key=lambda r: collection.payloads[r][key], reverse=reverse
+                )
+            elif offset is not None:
+                start = collection.row_of.get(str(offset))
+                rows = [r for r in rows if start is None or r >= start]
+            page = rows[:limit]
+            next_offset = collection.row_ids[rows[limit]] if len(rows) > limit and order_by is None else None
+            return [Record(**collection.point(row, with_payload, with_vectors)) for row in page], next_offset
@@ -1,16 +1,125 @@
+import os
 import redis
+import redis.asyncio as aioredis
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence, Tuple
+from .tokens import count_tokens
+from .tracing import traced
+
+# Sessions expire after this many seconds without activity
+CHAT_HISTORY_TTL = int(os.getenv("CHAT_HISTORY_TTL", "86400"))
+# Recent turns kept verbatim, older ones are rolled into the running summary
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "20"))
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1200"))
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "2000"))
+CHAT_SUMMARY_LINE_CHARS = 200
 
 #Connect to redis
 memory = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+async_memory = aioredis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+
+
+def summary_key(session_id: str) -> str:
+    return f"{session_id}:summary"
+
+
+def _overflow(messages: List[Dict[str, str]]) -> int:
+    """How many of the oldest messages have to leave the window.
+
+    The window holds at most CHAT_HISTORY_MAX_MESSAGES messages and
+    CHAT_HISTORY_TOKEN_BUDGET tokens, the newest message always stays.
+    """
+    keep = 0
+    tokens = 0
+    for m in reversed(messages):
+        tokens += count_tokens(m["message"])
+        if keep and (keep >= CHAT_HISTORY_MAX_MESSAGES or tokens > CHAT_HISTORY_TOKEN_BUDGET):
+            break
+        keep += 1
+    return len(messages) - keep
+
+
+def _roll_summary(summary: Optional[str], rolled: List[Dict[str, str]]) -> str:
+    """Append rolled turns to the summary, dropping its oldest lines past the size cap"""
+    lines = summary.split("\n") if summary else []
+    for m in rolled:
+        text = " ".join(m["message"].split())
+        if len(text) > CHAT_SUMMARY_LINE_CHARS:
+            text = text[:CHAT_SUMMARY_LINE_CHARS] + "..."
+        lines.append(f"{'User asked' if m['role'] == 'user' else 'Assistant answered'}: {text}")
+    while len(lines) > 1 and sum(len(l) + 1 for l in lines) > CHAT_SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _entries(messages: Sequence[Tuple[str, str]]) -> List[str]:
+    return [json.dumps({"role": role, "message": message}) for role, message in messages]
+
+
+def _queue_save(pipe, session_id: str, messages: Sequence[Tuple[str, str]], stored: List[str], summary: Optional[str]):
+    """Queue the append, trim and summary update of one save as a MULTI block"""
+    history = [json.loads(m) for m in stored] + [{"role": role, "message": message} for role, message in messages]
+    overflow = _overflow(history)
+    pipe.multi()
+    pipe.rpush(session_id, *_entries(messages))
+    pipe.expire(session_id, CHAT_HISTORY_TTL)
+    if overflow:
+        pipe.ltrim(session_id, overflow, -1)
+        pipe.set(summary_key(session_id), _roll_summary(summary, history[:overflow]), ex=CHAT_HISTORY_TTL)
+    elif summary:
+        pipe.expire(summary_key(session_id), CHAT_HISTORY_TTL)
+
+
+# Append messages to chat history, rolling old turns into the summary.
+# History and summary are WATCHed, a concurrent save to the session makes this one retry
+# on the new state instead of trimming turns the summary never saw.
+@traced("chat_history_save")
+def save_chat_messages(session_id: str, messages: Sequence[Tuple[str, str]]):
+    def save(pipe):
+        stored = pipe.lrange(session_id, 0, -1)
+        summary = pipe.get(summary_key(session_id))
+        _queue_save(pipe, session_id, messages, stored, summary)
+
+    memory.transaction(save, session_id, summary_key(session_id))
 
 # Append a message to chat history
 def save_chat_history(session_id: str, role: str, message: str):
-    chat_entry = json.dumps({"role": role, "message": message})
-    memory.rpush(session_id, chat_entry)
+    save_chat_messages(session_id, [(role, message)])
 
-# Retrive chat history 
+# Retrive chat history
 def get_chat_history(session_id: str) -> List[Dict[str, str]]:
     messages = memory.lrange(session_id, 0, -1)
-    return [json.loads(m) for m in messages]
\ No newline at end of file
+    return [json.loads(m) for m in messages]
+
+@traced("chat_history")
+def get_chat_context(session_id: str) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    """Running summary and the recent message window, in one round trip"""
+    pipe = memory.pipeline()
+    pipe.get(summary_key(session_id))
+    pipe.lrange(session_id, 0, -1)
+    summary, messages = pipe.execute()
+    return summary, [json.loads(m) for m in messages]
+
+@traced("chat_history_save")
+async def asave_chat_messages(session_id: str, messages: Sequence[Tuple[str, str]]):
+    async def save(pipe):
+        stored = await pipe.lrange(session_id, 0, -1)
+        summary = await pipe.get(summary_key(session_id))
+        _queue_save(pipe, session_id, messages, stored, summary)
+
+    await async_memory.transaction(save, session_id, summary_key(session_id))
+
+async def asave_chat_history(session_id: str, role: str, message: str):
+    await asave_chat_messages(session_id, [(role, message)])
+
+async def aget_chat_history(session_id: str) -> List[Dict[str, str]]:
+    messages = await async_memory.lrange(session_id, 0, -1)
+    return [json.loads(m) for m in messages]
+
+@traced("chat_history")
+async def aget_chat_context(session_id: str) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    async with async_memory.pipeline() as pipe:
+        pipe.get(summary_key(session_id))
+        pipe.lrange(session_id, 0, -1)
+        summary, messages = await pipe.execute()
+    return summary, [json.loads(m) for m in messages]
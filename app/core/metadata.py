@@ -1,36 +1,166 @@
+import os
+import io
+import csv
+import uuid
+from typing import Dict, List, Optional
 from fastapi import HTTPException
+from sqlalchemy import insert, delete
 from .models import Document, Chunk
+from .embeddings import EMBEDDING_MODEL
+from .tracing import traced
 
-def store_metadata_in_postgres(filename: str, file_type: str, file_size: int, chunking_strategy: str, chunks: list, point_ids: list, db):
+# "executemany" uses a multi row INSERT, "copy" streams rows with COPY on psycopg2
+METADATA_INSERT_MODE = os.getenv("METADATA_INSERT_MODE", "executemany")
+
+CHUNK_COLUMNS = ["id", "document_id", "chunk_id", "qdrant_point_id", "text_content", "chunk_length", "chunk_hash"]
+
+def _chunk_row(document_id, chunk_id: int, chunk: str, point_id, chunk_hash: Optional[str]) -> Dict:
+    return {
+        "id": uuid.uuid4(),
+        "document_id": document_id,
+        "chunk_id": chunk_id,
+        "qdrant_point_id": uuid.UUID(str(point_id)),
+        "text_content": chunk,
+        "chunk_length": len(chunk),
+        "chunk_hash": chunk_hash
+    }
+
+def _copy_chunk_rows(rows: List[Dict], db):
+    """Load rows with COPY FROM STDIN inside the session transaction"""
+    buffer = io.StringIO()
+    # Unquoted empty fields are read as NULL, quoted ones as empty strings
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL)
+    for row in rows:
+        writer.writerow([None if row[c] is None else str(row[c]) for c in CHUNK_COLUMNS])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {Chunk.__tablename__} ({', '.join(CHUNK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def insert_chunk_rows(rows: List[Dict], db, mode: str = METADATA_INSERT_MODE):
+    """Insert chunk rows in bulk without building ORM objects"""
+    if not rows:
+        return
+    if mode == "copy" and db.get_bind().dialect.driver == "psycopg2":
+        _copy_chunk_rows(rows, db)
+    else:
+        db.execute(insert(Chunk), rows)
+
+def _add_document(
+    filename: str,
+    file_type: str,
+    file_size: int,
+    chunking_strategy: str,
+    chunks: list,
+    point_ids: list,
+    db,
+    content_hash: Optional[str] = None,
+    chunk_hashes: Optional[List[str]] = None,
+    document_id: Optional[uuid.UUID] = None,
+    tenant_id: Optional[str] = None
+) -> Document:
+    """Add a document and its chunk rows to the session without committing"""
+    document = Document(
+        id=document_id or uuid.uuid4(),
+        filename=filename,
+        file_type=file_type,
+        file_size=file_size,
+        chunking_strategy=chunking_strategy,
+        total_chunks=len(chunks),
+        embedding_model=EMBEDDING_MODEL,
+        content_hash=content_hash,
+        tenant_id=tenant_id
+    )
+    db.add(document)
+    # Document row has to exist before its chunks reference it
+    db.flush()
+
+    insert_chunk_rows([
+        _chunk_row(document.id, i, chunk, point_id, chunk_hashes[i] if chunk_hashes else None)
+        for i, (chunk, point_id) in enumerate(zip(chunks, point_ids))
+    ], db)
+    return document
+
+@traced("postgres_write")
+def store_metadata_in_postgres(
+    filename: str,
+    file_type: str,
+    file_size: int,
+    chunking_strategy: str,
+    chunks: list,
+    point_ids: list,
+    db,
+    content_hash: Optional[str] = None,
+    chunk_hashes: Optional[List[str]] = None,
+    document_id: Optional[uuid.UUID] = None,
+    tenant_id: Optional[str] = None
+):
     """Store document and chunk metadata in PostgreSQL"""
     try:
-        # Store document metadata
-        document = Document(
-            filename=filename,
-            file_type=file_type,
-            file_size=file_size,
-            chunking_strategy=chunking_strategy,
-            total_chunks=len(chunks),
-            embedding_model="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        db.add(document)
+        document = _add_document(filename, file_type, file_size, chunking_strategy, chunks, point_ids, db, content_hash, chunk_hashes, document_id, tenant_id)
         db.commit()
-        db.refresh(document)
-
-
-        #Store chunk metadata
-        for i, (chunk, point_id) in enumerate(zip(chunks, point_ids)):
-            chunk_record = Chunk(
-                document_id=document.id,
-                chunk_id=i,
-                qdrant_point_id=point_id,
-                text_content=chunk,
-                chunk_length=len(chunk)
-            )
-            db.add(chunk_record)
+        return document.id
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error storing metadata in PostgreSQL: {str(e)}")
+
+@traced("postgres_write")
+def store_documents_in_postgres(documents: List[Dict], db) -> List:
+    """Store several documents and their chunks in one transaction.
+
+    Each entry has filename, file_type, file_size, chunking_strategy, chunks and point_ids,
+    and optionally content_hash, chunk_hashes, document_id and tenant_id.
+    """
+    try:
+        stored = [_add_document(db=db, **entry) for entry in documents]
+        db.commit()
+        return [document.id for document in stored]
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error storing metadata in PostgreSQL: {str(e)}")
+
+@traced("postgres_write")
+def store_document_revision(
+    document: Document,
+    file_size: int,
+    chunking_strategy: str,
+    content_hash: str,
+    chunks: list,
+    chunk_hashes: List[str],
+    kept: Dict[int, Chunk],
+    new_point_ids: Dict[int, str],
+    stale: List[Chunk],
+    db
+):
+    """Update an existing document to a new revision in one transaction.
+
+    kept maps new chunk positions to existing rows that are reused, new_point_ids maps
+    the remaining positions to freshly stored Qdrant points and stale rows are deleted.
+    """
+    try:
+        if stale:
+            db.execute(delete(Chunk).where(Chunk.id.in_([row.id for row in stale])).execution_options(synchronize_session=False))
+            for row in stale:
+                db.expunge(row)
+        for i, row in kept.items():
+            row.chunk_id = i
+        db.flush()
+        insert_chunk_rows([
+            _chunk_row(document.id, i, chunks[i], point_id, chunk_hashes[i])
+            for i, point_id in new_point_ids.items()
+        ], db)
+        document.file_size = file_size
+        document.chunking_strategy = chunking_strategy
+        document.total_chunks = len(chunks)
+        document.embedding_model = EMBEDDING_MODEL
+        document.content_hash = content_hash
         db.commit()
         return document.id
-    
+
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error storing metadata in PostgreSQL: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error storing metadata in PostgreSQL: {str(e)}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index, func
 from sqlalchemy.orm import declarative_base, relationship, declarative_mixin
 from .db import Base
 from sqlalchemy.dialects.postgresql import UUID
@@ -8,14 +8,22 @@ from datetime import datetime
 class Document(Base):
     __tablename__= "documents"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    filename = Column(String, unique=True, nullable=False)
+    # Unique per tenant, see uq_documents_tenant_filename
+    filename = Column(String, nullable=False)
     file_type = Column(String)
     file_size = Column(Integer)
     chunking_strategy = Column(String)
     total_chunks = Column(Integer)
     embedding_model = Column(String)
+    content_hash = Column(String(64), index=True)
+    tenant_id = Column(String(64), index=True)
     chunks = relationship("Chunk", back_populates="document")
 
+    __table_args__ = (
+        # coalesce makes documents without a tenant collide as well, NULLs never do in a unique index
+        Index("uq_documents_tenant_filename", func.coalesce(tenant_id, ""), filename, unique=True),
+    )
+
 class Chunk(Base):
     __tablename__= "chunks"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -24,6 +32,7 @@ class Chunk(Base):
     qdrant_point_id = Column(UUID(as_uuid=True))
     text_content = Column(String)
     chunk_length = Column(Integer)
+    chunk_hash = Column(String(64), index=True)
     document = relationship("Document", back_populates="chunks")
 
 @declarative_mixin
@@ -0,0 +1,400 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+from uuid import UUID, uuid4
+from .extraction import extract_text_from_txt, iter_pdf_pages
+from .chunking import fixed_chunking, recursive_chunking, stream_chunks
+from .vector_db import store_in_qdrant, ensure_collection, build_points, upsert_points, set_payloads, delete_points, tenant_collection, check_tenant
+from .metadata import store_metadata_in_postgres, store_documents_in_postgres, store_document_revision
+from .models import Document, Chunk
+from .dedup import hash_file, hash_text, embed_with_reuse
+from .chunk_cache import chunk_cache
+from .answer_cache import answer_cache
+from .lexical_index import lexical_index
+from .embeddings import EMBEDDING_MODEL
+from .jobs import IngestionJob
+from .db import SessionLocal
+from .tracing import span
+
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 200
+# Processes used to extract and chunk files of a bulk upload in parallel
+INGEST_EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+@contextmanager
+def _stage(job: Optional[IngestionJob], name: str, total: Optional[int] = None):
+    # Job progress for the status endpoint, the span for /metrics
+    with span(f"ingest_{name}"), (job.stage(name, total) if job else nullcontext()) as progress:
+        yield progress
+
+
+def document_payload(document_id, file_extension: str, chunking_strategy: str, tenant_id: Optional[str] = None) -> Dict[str, str]:
+    """Document fields stored with every Qdrant point of the document"""
+    payload = {
+        "document_id": str(document_id),
+        "file_type": file_extension,
+        "chunking_strategy": chunking_strategy,
+        "embedding_model": EMBEDDING_MODEL
+    }
+    if tenant_id:
+        payload["tenant_id"] = tenant_id
+    return payload
+
+
+def _iter_segments(file_extension: str, source: Union[bytes, str], job: Optional[IngestionJob] = None) -> Iterator[Tuple[int, str]]:
+    """(page number, text) pairs of a file, PDFs page by page"""
+    if file_extension == ".pdf":
+        for page_number, text in iter_pdf_pages(source):
+            if job:
+                job.advance("extract", page_number)
+            yield page_number, text
+    else:
+        yield 1, extract_text_from_txt(source)
+        if job:
+            job.advance("extract", 1)
+
+
+def extract_and_chunk(
+    file_extension: str,
+    file_content: Union[bytes, str],
+    chunking_strategy: str,
+    job: Optional[IngestionJob] = None
+) -> Tuple[List[str], Optional[List[Dict[str, int]]]]:
+    """Extract text from one file and split it into chunks.
+
+    Returns the chunk texts and, for the streaming strategy, the offsets and pages of each chunk.
+    """
+    segments = _iter_segments(file_extension, file_content, job)
+
+    if chunking_strategy == "streaming":
+        # Chunks are cut while later pages are still being extracted
+        with _stage(job, "extract"), _stage(job, "chunk"):
+            records = list(stream_chunks(segments, CHUNK_SIZE, CHUNK_OVERLAP))
+            if job:
+                job.advance("chunk", len(records), len(records))
+        return [r.text for r in records], [r.provenance() for r in records]
+
+    with _stage(job, "extract"):
+        text_content = "\n".join(text for _, text in segments).strip()
+
+    with _stage(job, "chunk"):
+        if chunking_strategy == "fixed":
+            chunks = fixed_chunking(text_content, CHUNK_SIZE, CHUNK_OVERLAP)
+        else:
+            chunks = recursive_chunking(text_content, CHUNK_SIZE, CHUNK_OVERLAP)
+        if job:
+            job.advance("chunk", len(chunks), len(chunks))
+    return chunks, None
+
+
+def _tenant_documents(query, tenant_id: Optional[str]):
+    """Limit a Document query to one tenant, filenames are only unique within a tenant"""
+    return query.filter(Document.tenant_id.is_(None) if tenant_id is None else Document.tenant_id == tenant_id)
+
+
+def _extract_and_chunk_worker(file_extension: str, file_content: Union[bytes, str], chunking_strategy: str):
+    # HTTPException does not survive pickling back from the pool
+    try:
+        return extract_and_chunk(file_extension, file_content, chunking_strategy)
+    except HTTPException as e:
+        raise ValueError(e.detail)
+
+
+def ingest_document(
+    filename: str,
+    file_extension: str,
+    file_content: Union[bytes, str],
+    chunking_strategy: str,
+    db: Session,
+    job: Optional[IngestionJob] = None,
+    tenant_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Run extract -> chunk -> embed -> store for one file given as bytes or a path on disk.
+
+    Re-uploading a file under the same name updates the document in place: unchanged chunks
+    keep their Qdrant points, only new chunks are embedded and stale chunks are deleted.
+    """
+    name = tenant_collection(check_tenant(tenant_id))
+    file_size = len(file_content) if isinstance(file_content, bytes) else os.path.getsize(file_content)
+    content_hash = hash_file(file_content)
+
+    document = _tenant_documents(db.query(Document), tenant_id).filter(Document.filename == filename).one_or_none()
+    if document and document.content_hash == content_hash and document.chunking_strategy == chunking_strategy:
+        return {"document_id": str(document.id), "total_chunks": document.total_chunks, "status": "unchanged", "embedded_chunks": 0}
+
+    chunks, provenance = extract_and_chunk(file_extension, file_content, chunking_strategy, job)
+    chunk_hashes = [hash_text(chunk) for chunk in chunks]
+
+    # Chunks of the previous revision that are still present keep their points and rows
+    kept: Dict[int, Chunk] = {}
+    stale: List[Chunk] = []
+    if document:
+        previous: Dict[str, List[Chunk]] = {}
+        for row in document.chunks:
+            previous.setdefault(row.chunk_hash, []).append(row)
+        for i, chunk_hash in enumerate(chunk_hashes):
+            rows = previous.get(chunk_hash)
+            if rows:
+                kept[i] = rows.pop()
+        stale = [row for rows in previous.values() for row in rows]
+
+    new_indices = [i for i in range(len(chunks)) if i not in kept]
+    new_chunks = [chunks[i] for i in new_indices]
+
+    #Embeddings the new chunks, reusing vectors of identical chunks in other documents
+    with _stage(job, "embed", len(new_chunks)):
+        on_progress = (lambda done, total: job.advance("embed", done, total)) if job else None
+        embeddings, reused = embed_with_reuse(new_chunks, [chunk_hashes[i] for i in new_indices], db, on_progress, name)
+
+    document_id = document.id if document else uuid4()
+    doc_payload = document_payload(document_id, file_extension, chunking_strategy, tenant_id)
+
+    with _stage(job, "store", len(chunks)):
+        #Store in Qdrant vector database
+        point_ids = []
+        if new_chunks:
+            new_provenance = [provenance[i] for i in new_indices] if provenance else None
+            point_ids = store_in_qdrant(new_chunks, embeddings, filename, new_provenance, chunk_ids=new_indices, document_payload=doc_payload, name=name)
+
+        #Store metedata in postgres database
+        if document:
+            strategy_changed = document.chunking_strategy != chunking_strategy
+            moved = {
+                str(row.qdrant_point_id): {"chunk_id": i, **doc_payload, **(provenance[i] if provenance else {})}
+                for i, row in kept.items() if row.chunk_id != i or provenance or strategy_changed
+            }
+            try:
+                set_payloads(moved, name)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error storing in Qdrant: {str(e)}")
+            doc_id = store_document_revision(
+                document, file_size, chunking_strategy, content_hash, chunks, chunk_hashes,
+                kept, dict(zip(new_indices, point_ids)), stale, db
+            )
+            chunk_cache.invalidate_document(doc_id)
+            answer_cache.invalidate_document(doc_id)
+            lexical_index.remove(str(row.qdrant_point_id) for row in stale)
+            try:
+                delete_points([str(row.qdrant_point_id) for row in stale], name)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error deleting stale chunks from Qdrant: {str(e)}")
+        else:
+            doc_id = store_metadata_in_postgres(
+                filename, file_extension, file_size, chunking_strategy, chunks, point_ids, db,
+                content_hash, chunk_hashes, document_id, tenant_id
+            )
+        # Kept chunks are already indexed under their point ids
+        lexical_index.add_many(zip(point_ids, new_chunks))
+        lexical_index.flush()
+        if job:
+            job.advance("store", len(chunks))
+
+    return {
+        "document_id": str(doc_id),
+        "total_chunks": len(chunks),
+        "status": "updated" if document else "created",
+        "embedded_chunks": len(new_chunks) - reused,
+        "reused_chunks": len(kept) + reused,
+        "deleted_chunks": len(stale)
+    }
+
+
+def delete_document(document_id: str, db: Session, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+    """Remove a document, its chunks and their Qdrant points.
+
+    With a tenant_id only documents of that tenant can be deleted.
+    """
+    try:
+        document = db.get(Document, UUID(document_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid document id")
+    if document is None or (tenant_id is not None and document.tenant_id != tenant_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    point_ids = [str(row.qdrant_point_id) for row in document.chunks]
+    name = tenant_collection(document.tenant_id)
+    try:
+        db.execute(delete(Chunk).where(Chunk.document_id == document.id))
+        db.delete(document)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error deleting document from PostgreSQL: {str(e)}")
+
+    chunk_cache.invalidate_document(document_id)
+    answer_cache.invalidate_document(document_id)
+    lexical_index.remove(point_ids)
+    lexical_index.flush()
+    try:
+        delete_points(point_ids, name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting chunks from Qdrant: {str(e)}")
+    return {"document_id": document_id, "deleted_chunks": len(point_ids)}
+
+
+def run_ingestion_job(
+    filename: str,
+    file_extension: str,
+    file_path: str,
+    chunking_strategy: str,
+    job: IngestionJob,
+    tenant_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Job queue entry point, each job gets its own database session and removes its spooled upload"""
+    db = SessionLocal()
+    try:
+        return ingest_document(filename, file_extension, file_path, chunking_strategy, db, job=job, tenant_id=tenant_id)
+    finally:
+        db.close()
+        os.remove(file_path)
+
+
+
+def ingest_documents_bulk(
+    files: List[Tuple[str, str, Union[bytes, str]]],
+    chunking_strategy: str,
+    db: Session,
+    job: Optional[IngestionJob] = None,
+    workers: int = INGEST_EXTRACT_WORKERS,
+    tenant_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Ingest many (filename, extension, content) files with shared embedding batches and batched writes.
+
+    Contents are bytes or paths on disk, paths are read by the extraction workers themselves.
+    Files whose name is already stored are reported as unchanged or updated by the revision path.
+    """
+    name = tenant_collection(check_tenant(tenant_id))
+    report: Dict[str, Dict[str, Any]] = {}
+    pending: Dict[str, Tuple[str, Union[bytes, str]]] = {}
+    # Later files with a name already in the batch, e.g. the same path in two archives
+    duplicates: List[Dict[str, Any]] = []
+    for filename, file_extension, file_content in files:
+        if filename in report:
+            duplicates.append({"filename": filename, "status": "skipped", "document_id": None, "total_chunks": 0, "error": "Duplicate filename in batch"})
+            continue
+        report[filename] = {"filename": filename, "status": "pending", "document_id": None, "total_chunks": 0, "error": None}
+        pending[filename] = (file_extension, file_content)
+
+    # One query finds the files stored before, those are updated in place like a single upload
+    existing = {
+        row[0] for row in _tenant_documents(db.query(Document.filename), tenant_id).filter(Document.filename.in_(list(pending))).all()
+    } if pending else set()
+    for filename in existing:
+        file_extension, file_content = pending.pop(filename)
+        try:
+            result = ingest_document(filename, file_extension, file_content, chunking_strategy, db, tenant_id=tenant_id)
+        except HTTPException as e:
+            report[filename].update(status="failed", error=str(e.detail))
+            continue
+        report[filename].update(status=result["status"], document_id=result["document_id"], total_chunks=result["total_chunks"])
+
+    #Extract and chunk files in parallel
+    chunks_by_file: Dict[str, List[str]] = {}
+    provenance_by_file: Dict[str, Optional[List[Dict[str, int]]]] = {}
+    with _stage(job, "extract", len(pending)), _stage(job, "chunk"):
+        def collect(filename: str, result: Optional[Tuple], error: Optional[str]):
+            if error is not None:
+                report[filename].update(status="failed", error=error)
+            elif not result[0]:
+                report[filename].update(status="failed", error="No text extracted")
+            else:
+                chunks_by_file[filename], provenance_by_file[filename] = result
+            if job:
+                job.advance("extract", len(chunks_by_file) + sum(r["status"] == "failed" for r in report.values()))
+                job.advance("chunk", sum(len(c) for c in chunks_by_file.values()))
+
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending)), mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {
+                    pool.submit(_extract_and_chunk_worker, ext, content, chunking_strategy): filename
+                    for filename, (ext, content) in pending.items()
+                }
+                for future in as_completed(futures):
+                    try:
+                        collect(futures[future], future.result(), None)
+                    except Exception as e:
+                        collect(futures[future], None, str(e))
+        else:
+            for filename, (ext, content) in pending.items():
+                try:
+                    collect(filename, extract_and_chunk(ext, content, chunking_strategy), None)
+                except HTTPException as e:
+                    collect(filename, None, str(e.detail))
+
+    # Embed chunks of all files together so batches span file boundaries
+    filenames = list(chunks_by_file)
+    all_chunks = [chunk for filename in filenames for chunk in chunks_by_file[filename]]
+    if not all_chunks:
+        return {"files": list(report.values()) + duplicates}
+
+    all_hashes = [hash_text(chunk) for chunk in all_chunks]
+    with _stage(job, "embed", len(all_chunks)):
+        on_progress = (lambda done, total: job.advance("embed", done, total)) if job else None
+        embeddings, _ = embed_with_reuse(all_chunks, all_hashes, db, on_progress, name)
+
+    with _stage(job, "store", len(all_chunks)):
+        try:
+            ensure_collection(embeddings.shape[1], name)
+            points = []
+            documents = []
+            offset = 0
+            for filename in filenames:
+                chunks = chunks_by_file[filename]
+                ext, content = pending[filename]
+                document_id = uuid4()
+                file_points, point_ids = build_points(
+                    chunks, embeddings[offset:offset + len(chunks)], filename, provenance_by_file[filename],
+                    document_payload=document_payload(document_id, ext, chunking_strategy, tenant_id)
+                )
+                points.extend(file_points)
+                documents.append({
+                    "filename": filename,
+                    "file_type": ext,
+                    "file_size": len(content) if isinstance(content, bytes) else os.path.getsize(content),
+                    "chunking_strategy": chunking_strategy,
+                    "chunks": chunks,
+                    "point_ids": point_ids,
+                    "content_hash": hash_file(content),
+                    "chunk_hashes": all_hashes[offset:offset + len(chunks)],
+                    "document_id": document_id,
+                    "tenant_id": tenant_id
+                })
+                offset += len(chunks)
+            upsert_points(points, name=name)
+            doc_ids = store_documents_in_postgres(documents, db)
+        except Exception as e:
+            error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+            for filename in filenames:
+                report[filename].update(status="failed", error=error)
+            return {"files": list(report.values()) + duplicates}
+        for filename, doc_id in zip(filenames, doc_ids):
+            report[filename].update(status="stored", document_id=str(doc_id), total_chunks=len(chunks_by_file[filename]))
+        for document in documents:
+            lexical_index.add_many(zip(document["point_ids"], document["chunks"]))
+        lexical_index.flush()
+        if job:
+            job.advance("store", len(all_chunks))
+
+    return {"files": list(report.values()) + duplicates}
+
+
+def run_bulk_ingestion_job(
+    files: List[Tuple[str, str, str]],
+    chunking_strategy: str,
+    job: IngestionJob,
+    tenant_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Job queue entry point for bulk uploads, removes the spooled files when done"""
+    db = SessionLocal()
+    try:
+        return ingest_documents_bulk(files, chunking_strategy, db, job=job, tenant_id=tenant_id)
+    finally:
+        db.close()
+        for _, _, file_path in files:
+            os.remove(file_path)
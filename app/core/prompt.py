@@ -1,5 +1,7 @@
-from typing import List, Dict
-from core.memory import get_chat_history, save_chat_history
+from typing import List, Dict, Optional
+from core.memory import get_chat_context
+from core.context_packing import pack_context, CONTEXT_TOKEN_BUDGET
+from core.tracing import traced
 
 SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions based on provided context and conversation history.
 
@@ -7,46 +9,43 @@ Instructions:
 - Use BOTH the provided context (retrieved documents) and conversation history (previous user and assistant messages) to answer questions.
 - If the answer is in history but not in the context, you may still use history.
 - If the answer is not in either context or history, clearly state "I don't have enough information to answer this question."
-- Cite your sources using the format [filename#chunk_id] when referencing specific information
+- Cite your sources using the label in front of each context passage, [filename#chunk_id] for a single chunk or [filename#first-last] for neighbouring chunks merged into one passage
 - Be concise and accurate
 - If multiple sources support your answer, cite all relevant sources
 """
 
 # Build chat messages for LLM
-def build_messages(session_id: str, query: str, chunks: List[Dict], max_context_chars: int = 6000) -> List[Dict[str, str]]:
-    context_pieces = []
-    total_chars = 0
-
-    for chunk in chunks:
-
-        if not chunk.get("text") or chunk.get("text") == "Content not found in database":
-            continue
-
-        # Getting document information
-        doc_info = chunk.get("document", {})
-        filename = doc_info.get("filename", "Unknown")
-        chunk_id = chunk.get("chunk_id", "0")
-        text = chunk.get("text", "").strip()
-        text = " ".join(text.split())
-        if len(text)> 1000:
-            text = text[:1000] + "..."
-        context_piece = f"[{filename}#{chunk_id}] {text}"
-        if total_chars + len(context_piece) > max_context_chars:
-            break
-        context_pieces.append(context_piece)
-        total_chars += len(context_piece)
+@traced("build_prompt")
+def build_messages(
+    session_id: str,
+    query: str,
+    chunks: List[Dict],
+    max_context_tokens: int = CONTEXT_TOKEN_BUDGET,
+    history: Optional[List[Dict[str, str]]] = None,
+    summary: Optional[str] = None,
+    pack_stats: Optional[Dict] = None
+) -> List[Dict[str, str]]:
+    # Fit the best evidence into the token budget, neighbouring chunks are merged
+    context_pieces, stats = pack_context(chunks, max_context_tokens)
+    if pack_stats is not None:
+        pack_stats.update(stats)
     
     if context_pieces:
         context_block = "\n\n".join(context_pieces)
     else:
         context_block = "No relevant context found."
 
-    # Fetch past conversation from memory
-    history = get_chat_history(session_id)
+    # Fetch past conversation from memory unless the caller already did
+    if history is None:
+        summary, history = get_chat_context(session_id)
 
     # Starting messages with system prompt
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
 
+    # Older turns only survive as the running summary
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+
     # Append past history
     for h in history:
         messages.append({"role":h["role"], "content": h["message"]})
@@ -0,0 +1,121 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+import numpy as np
+from .embeddings import EMBEDDING_MODEL, create_embeddings
+
+# Coalesce concurrent query embeddings into one encode call
+QUERY_BATCHING = os.getenv("QUERY_BATCHING", "true").lower() == "true"
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+# How long the first query of a batch waits for others to join
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "3"))
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+# Queueing delays kept for the percentiles
+DELAY_WINDOW = 2048
+
+
+class QueryEmbeddingBatcher:
+    """Dynamic micro-batcher for single query embeddings.
+
+    Callers block on a future while one worker thread per model drains the queue. The
+    worker takes the first waiting query, collects more until the batch is full or
+    max_wait has passed since that query arrived, and encodes them in one call. Queries
+    that queue up while a batch is encoding are picked up right away by the next one.
+    """
+
+    def __init__(self, max_size: int = QUERY_BATCH_MAX_SIZE, max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS):
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queues: Dict[str, "queue.Queue[Tuple[str, float, Future]]"] = {}
+        self._lock = threading.Lock()
+        self._delays: deque = deque(maxlen=DELAY_WINDOW)
+        self.histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS + [float("inf")]}
+        self.metrics = {"queries": 0, "batches": 0, "errors": 0, "encode_seconds_total": 0.0, "queue_seconds_total": 0.0}
+
+    def _queue(self, model_name: str) -> "queue.Queue":
+        q = self._queues.get(model_name)
+        if q is None:
+            with self._lock:
+                q = self._queues.get(model_name)
+                if q is None:
+                    q = self._queues[model_name] = queue.Queue()
+                    threading.Thread(target=self._run, args=(model_name, q), name=f"query-batcher-{model_name}", daemon=True).start()
+        return q
+
+    def encode(self, query: str, model_name: str = EMBEDDING_MODEL) -> np.ndarray:
+        """Embedding of one query, encoded together with the queries arriving around it"""
+        future: Future = Future()
+        self._queue(model_name).put((query, time.perf_counter(), future))
+        return future.result()
+
+    def _collect(self, q: "queue.Queue") -> List[Tuple[str, float, Future]]:
+        batch = [q.get()]
+        deadline = batch[0][1] + self.max_wait
+        while len(batch) < self.max_size:
+            try:
+                batch.append(q.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, model_name: str, q: "queue.Queue"):
+        while True:
+            batch = self._collect(q)
+            start = time.perf_counter()
+            # Identical questions asked at the same time are encoded once
+            texts = list(dict.fromkeys(query for query, _, _ in batch))
+            try:
+                vectors = dict(zip(texts, create_embeddings(texts, model_name)))
+            except Exception as e:
+                self._record(batch, start, time.perf_counter() - start, failed=True)
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self._record(batch, start, time.perf_counter() - start)
+            for query, _, future in batch:
+                future.set_result(np.asarray(vectors[query], dtype=np.float32))
+
+    def _record(self, batch: List[Tuple[str, float, Future]], start: float, elapsed: float, failed: bool = False):
+        delays = [start - enqueued for _, enqueued, _ in batch]
+        bucket = next(b for b in self.histogram if len(batch) <= b)
+        with self._lock:
+            self.histogram[bucket] += 1
+            self.metrics["queries"] += len(batch)
+            self.metrics["batches"] += 1
+            self.metrics["errors"] += int(failed)
+            self.metrics["encode_seconds_total"] += elapsed
+            self.metrics["queue_seconds_total"] += sum(delays)
+            self._delays.extend(delays)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            histogram = {("+Inf" if b == float("inf") else str(b)): n for b, n in self.histogram.items()}
+            delays = sorted(self._delays)
+        batches, queries = stats["batches"], stats["queries"]
+        stats["batch_size_avg"] = queries / batches if batches else 0.0
+        stats["batch_size_histogram"] = histogram
+        stats["queue_ms_avg"] = stats["queue_seconds_total"] / queries * 1000 if queries else 0.0
+        for p in (50, 99):
+            stats[f"queue_ms_p{p}"] = delays[min(len(delays) - 1, round(p / 100 * (len(delays) - 1)))] * 1000 if delays else 0.0
+        stats["enabled"] = QUERY_BATCHING
+        stats["max_size"] = self.max_size
+        stats["max_wait_ms"] = self.max_wait * 1000
+        return stats
+
+
+query_batcher = QueryEmbeddingBatcher()
@@ -0,0 +1,113 @@
+import os
+import base64
+import hashlib
+from typing import Any, Dict, List, Optional
+import numpy as np
+import redis
+from .cache import LRUCache
+from .embeddings import EMBEDDING_MODEL, create_embeddings
+from .memory import memory
+from .query_batcher import QUERY_BATCHING, query_batcher
+from .tracing import traced
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+# Share query embeddings between workers through the chat memory redis
+QUERY_CACHE_REDIS = os.getenv("QUERY_CACHE_REDIS", "false").lower() == "true"
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class QueryEmbeddingCache:
+    """Two tier cache of query embeddings keyed by model name and normalized query"""
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL, redis_client: Optional[redis.Redis] = None):
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.redis = redis_client
+        self.redis_hits = 0
+        self.redis_misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def key(query: str, model_name: str) -> str:
+        digest = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+        return f"qemb:{model_name}:{digest}"
+
+    def get(self, query: str, model_name: str = EMBEDDING_MODEL) -> Optional[np.ndarray]:
+        key = self.key(query, model_name)
+        vector = self.local.get(key)
+        if vector is not None or self.redis is None:
+            return vector
+
+        try:
+            encoded = self.redis.get(key)
+        except redis.RedisError:
+            self.redis_errors += 1
+            return None
+        if encoded is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        vector = np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+        self.local.set(key, vector)
+        return vector
+
+    def set(self, query: str, vector: np.ndarray, model_name: str = EMBEDDING_MODEL):
+        key = self.key(query, model_name)
+        vector = np.asarray(vector, dtype=np.float32)
+        self.local.set(key, vector)
+        if self.redis is not None:
+            try:
+                self.redis.set(key, base64.b64encode(vector.tobytes()).decode("ascii"), ex=int(self.ttl) or None)
+            except redis.RedisError:
+                self.redis_errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.local.stats()
+        if self.redis is not None:
+            stats.update({
+                "redis_hits": self.redis_hits,
+                "redis_misses": self.redis_misses,
+                "redis_errors": self.redis_errors
+            })
+        return stats
+
+
+query_cache = QueryEmbeddingCache(redis_client=memory if QUERY_CACHE_REDIS else None)
+
+
+@traced("embed_query")
+def get_query_embedding(query: str, model_name: str = EMBEDDING_MODEL) -> np.ndarray:
+    """Query embedding served from cache when the same question was asked before"""
+    vector = query_cache.get(query, model_name)
+    if vector is None:
+        if QUERY_BATCHING:
+            # Concurrent requests share one encode call
+            vector = query_batcher.encode(query, model_name)
+        else:
+            vector = np.asarray(create_embeddings([query], model_name)[0], dtype=np.float32)
+        query_cache.set(query, vector, model_name)
+    return vector
+
+
+@traced("embed_query")
+def get_query_embeddings(queries: List[str], model_name: str = EMBEDDING_MODEL) -> List[np.ndarray]:
+    """Embeddings of many queries, the uncached ones encoded in a single model call"""
+    vectors: List[Optional[np.ndarray]] = [query_cache.get(query, model_name) for query in queries]
+    # Repeated questions are only encoded once
+    missing: Dict[str, List[int]] = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(normalize_query(queries[i]), []).append(i)
+    if missing:
+        fresh = create_embeddings([queries[indices[0]] for indices in missing.values()], model_name)
+        for indices, vector in zip(missing.values(), fresh):
+            vector = np.asarray(vector, dtype=np.float32)
+            query_cache.set(queries[indices[0]], vector, model_name)
+            for i in indices:
+                vectors[i] = vector
+    return vectors
@@ -0,0 +1,151 @@
+import os
+import math
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional
+from .cache import LRUCache
+from .query_cache import normalize_query
+from .tracing import traced
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_DEVICE = os.getenv("RERANK_DEVICE", "cpu")
+# Candidates fetched from retrieval for every result kept
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+# Time the cross-encoder may take per request, fewer candidates are scored when it would not fit
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANK_CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", "3600"))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_reranker():
+    """Shared cross-encoder, loaded on first use"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                start = time.perf_counter()
+                _model = CrossEncoder(RERANK_MODEL, device=RERANK_DEVICE)
+                print(f"Loaded reranker {RERANK_MODEL} in {time.perf_counter() - start:.2f}s")
+    return _model
+
+
+def relevance(logit: float) -> float:
+    """Cross-encoder logit squashed to 0..1, the range retrieval scores and context packing expect"""
+    return 1 / (1 + math.exp(-max(min(float(logit), 50.0), -50.0)))
+
+
+class Reranker:
+    """Cross-encoder reranking with a per request latency budget and a score cache.
+
+    The cost per (query, chunk) pair is tracked as a moving average. A request only scores
+    as many uncached candidates as fit in the budget, shared by the reranks in flight, and
+    skips reranking when not even top_k fit.
+    """
+
+    def __init__(self, budget_ms: float = RERANK_BUDGET_MS, batch_size: int = RERANK_BATCH_SIZE):
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self.cache = LRUCache(maxsize=RERANK_CACHE_SIZE, ttl=RERANK_CACHE_TTL)
+        self.seconds_per_pair: Optional[float] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.metrics = {"requests": 0, "skipped": 0, "shortened": 0, "pairs_scored": 0, "seconds_total": 0.0}
+
+    @staticmethod
+    def _key(query_digest: str, qdrant_id: str) -> str:
+        return f"{RERANK_MODEL}:{query_digest}:{qdrant_id}"
+
+    def warm_up(self):
+        self._score([("warm up", "warm up")])
+
+    def _score(self, pairs) -> List[float]:
+        start = time.perf_counter()
+        scores = get_reranker().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        elapsed = time.perf_counter() - start
+        per_pair = elapsed / len(pairs)
+        with self._lock:
+            self.seconds_per_pair = per_pair if self.seconds_per_pair is None else 0.8 * self.seconds_per_pair + 0.2 * per_pair
+            self.metrics["pairs_scored"] += len(pairs)
+            self.metrics["seconds_total"] += elapsed
+        return [float(s) for s in scores]
+
+    @traced("rerank")
+    def rerank(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        """Results ordered by cross-encoder score, cut to top_k.
+
+        Reranked results carry the sigmoid of the cross-encoder logit in "score", the raw
+        logit in "rerank_score" and the retrieval score in "retrieval_score". Candidates
+        left unscored keep their retrieval order after the scored ones.
+        """
+        candidates = [r for r in results if r.get("text")]
+        if len(candidates) <= 1:
+            return results[:top_k]
+
+        digest = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+        scores: Dict[str, float] = {}
+        uncached = []
+        for r in candidates:
+            score = self.cache.get(self._key(digest, r["qdrant_id"]))
+            if score is None:
+                uncached.append(r)
+            else:
+                scores[r["qdrant_id"]] = score
+
+        with self._lock:
+            self.metrics["requests"] += 1
+            self.in_flight += 1
+            load = self.in_flight
+            per_pair = self.seconds_per_pair
+        try:
+            if uncached and per_pair:
+                # Concurrent reranks share the CPU, so each gets a slice of the budget
+                fits = int(self.budget / (per_pair * load))
+                if fits + len(scores) < min(top_k, len(candidates)):
+                    with self._lock:
+                        self.metrics["skipped"] += 1
+                    return results[:top_k]
+                if fits < len(uncached):
+                    # Retrieval order decides which candidates are worth scoring
+                    uncached = uncached[:fits]
+                    with self._lock:
+                        self.metrics["shortened"] += 1
+            if uncached:
+                fresh = self._score([(query, r["text"]) for r in uncached])
+                for r, score in zip(uncached, fresh):
+                    scores[r["qdrant_id"]] = score
+                    self.cache.set(self._key(digest, r["qdrant_id"]), score)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        scored = sorted((r for r in candidates if r["qdrant_id"] in scores), key=lambda r: scores[r["qdrant_id"]], reverse=True)
+        rest = [r for r in results if r.get("qdrant_id") not in scores]
+        reranked = []
+        for r in scored:
+            logit = float(scores[r["qdrant_id"]])
+            reranked.append({**r, "score": relevance(logit), "rerank_score": logit, "retrieval_score": r.get("score")})
+        return (reranked + rest)[:top_k]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["seconds_per_pair"] = self.seconds_per_pair or 0.0
+            stats["in_flight"] = self.in_flight
+        stats["budget_ms"] = self.budget * 1000
+        stats["enabled"] = RERANK_ENABLED
+        stats["cache"] = self.cache.stats()
+        return stats
+
+
+reranker = Reranker()
+
+
+def rerank_candidates(top_k: int) -> int:
+    return max(top_k, RERANK_CANDIDATES)
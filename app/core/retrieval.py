@@ -1,74 +1,438 @@
+import os
+import asyncio
 from fastapi import HTTPException
-from .embeddings import create_embeddings
-from .vector_db import client, collection_name
+from .query_cache import get_query_embedding, get_query_embeddings
+from .vector_db import client, collection_name, aquery_points, search_params, build_filter, tenant_collection, collection_dim, TENANT_MODE
 from .models import Document, Chunk
+from .chunk_cache import chunk_cache
+from .lexical_index import lexical_index
+from .reranker import reranker, rerank_candidates, RERANK_ENABLED
+from .tracing import span, traced
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from qdrant_client.models import Filter
+from sqlalchemy.ext.asyncio import AsyncSession
+from qdrant_client.models import Filter, HasIdCondition, QueryRequest
 from uuid import UUID
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, Tuple
 
+# "postgres" resolves hits from the chunks table, "payload" builds them from Qdrant payloads
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "postgres")
+RETRIEVAL_MODES = ("postgres", "payload")
+# "dense" is the Qdrant vector search, "lexical" the BM25 index, "hybrid" fuses both.
+# Hybrid scores are RRF values, not cosine similarities, so it stays opt in
+RETRIEVAL_SEARCH = os.getenv("RETRIEVAL_SEARCH", "dense")
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Candidates taken from each retriever per requested result before fusing
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))
+# The BM25 index spans all documents and tenants, filtered lexical search fetches this many
+# times more hits per round and keeps the ones Qdrant confirms match the filter
+LEXICAL_FILTER_OVERSAMPLING = int(os.getenv("LEXICAL_FILTER_OVERSAMPLING", "4"))
+LEXICAL_FILTER_ROUNDS = 3
+PAYLOAD_FIELDS = ["filename", "chunk_id", "chunk", "document_id", "file_type", "chunking_strategy", "embedding_model"]
 
-def search_documents(query:str, top_k: int = 5, db: Session= None):
-    try:
-        #Generate query embedding
-        query_embedding = create_embeddings([query])[0]
-        if len(query_embedding) != 384:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Query vector size mismatch: expected 384, got {len(query_embedding)}"
-            )
-
-        #Search in qdrant
-        hits = client.search(
-            collection_name=collection_name,
-            query_vector = query_embedding,
-            limit=top_k
-            # query_filter=Filter(must=[])
+
+def _chunk_record(chunk: Chunk, document: Document) -> Dict:
+    return {
+        "text": chunk.text_content,
+        "chunk_id": chunk.chunk_id,
+        "chunk_length": chunk.chunk_length,
+        "document": {
+            "id": str(document.id),
+            "filename": document.filename,
+            "file_type": document.file_type,
+            "chunking_strategy": document.chunking_strategy,
+            "embedding_model": document.embedding_model
+        }
+    }
+
+
+@traced("postgres_fetch")
+def fetch_chunk_records(qdrant_ids: List[str], db: Session = None) -> Dict[str, Dict]:
+    """Chunk and document data by Qdrant point id, from the hot chunk cache or one joined query"""
+    by_qid, missing = chunk_cache.get_many(qdrant_ids)
+    if db and missing:
+        rows = (
+            db.query(Chunk, Document)
+            .join(Document, Chunk.document_id == Document.id)
+            .filter(Chunk.qdrant_point_id.in_([UUID(x) for x in missing]))
+            .all()
+        )
+        for chunk, document in rows:
+            record = _chunk_record(chunk, document)
+            qdrant_id = str(chunk.qdrant_point_id)
+            chunk_cache.put(qdrant_id, record)
+            by_qid[qdrant_id] = record
+    return by_qid
+
+
+@traced("postgres_fetch")
+async def afetch_chunk_records(qdrant_ids: List[str], db: AsyncSession = None) -> Dict[str, Dict]:
+    """fetch_chunk_records on an async session"""
+    by_qid, missing = chunk_cache.get_many(qdrant_ids)
+    if db and missing:
+        result = await db.execute(
+            select(Chunk, Document)
+            .join(Document, Chunk.document_id == Document.id)
+            .where(Chunk.qdrant_point_id.in_([UUID(x) for x in missing]))
         )
-        if not hits:
+        for chunk, document in result.all():
+            record = _chunk_record(chunk, document)
+            qdrant_id = str(chunk.qdrant_point_id)
+            chunk_cache.put(qdrant_id, record)
+            by_qid[qdrant_id] = record
+    return by_qid
+
+
+def _payload_record(payload: Optional[Dict]) -> Optional[Dict]:
+    # Points stored before document fields were added to the payload need postgres
+    if not payload or "document_id" not in payload:
+        return None
+    text = payload.get("chunk")
+    return {
+        "text": text,
+        "chunk_id": payload.get("chunk_id"),
+        "chunk_length": len(text) if text is not None else None,
+        "document": {
+            "id": payload["document_id"],
+            "filename": payload.get("filename"),
+            "file_type": payload.get("file_type"),
+            "chunking_strategy": payload.get("chunking_strategy"),
+            "embedding_model": payload.get("embedding_model")
+        }
+    }
+
+
+def _check_mode(mode: Optional[str]) -> str:
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode {mode}, expected one of {', '.join(RETRIEVAL_MODES)}")
+    return mode
+
+
+def _check_search(search: Optional[str]) -> str:
+    search = search or RETRIEVAL_SEARCH
+    if search not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown search mode {search}, expected one of {', '.join(SEARCH_MODES)}")
+    return search
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion of ranked id lists, best first"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, qdrant_id in enumerate(ranking, start=1):
+            scores[qdrant_id] = scores.get(qdrant_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def _candidates(search: str, top_k: int) -> int:
+    return top_k if search != "hybrid" else top_k * HYBRID_CANDIDATES
+
+
+def _matching_ids(qdrant_ids: List[str], name: str, query_filter: Optional[Filter]) -> set:
+    """The point ids that are in collection name and match the filter"""
+    if not qdrant_ids or not client.collection_exists(name):
+        return set()
+    conditions = [HasIdCondition(has_id=qdrant_ids)] + (list(query_filter.must) if query_filter else [])
+    points, _ = client.scroll(collection_name=name, scroll_filter=Filter(must=conditions), limit=len(qdrant_ids), with_payload=False)
+    return {str(p.id) for p in points}
+
+
+@traced("lexical_search")
+def _lexical_search(query: str, limit: int, name: str = collection_name, query_filter: Optional[Filter] = None) -> List[Tuple[str, float]]:
+    lexical_index.refresh()
+    # With a collection per tenant even unfiltered hits may belong to another collection
+    if query_filter is None and TENANT_MODE == "payload":
+        return lexical_index.search(query, limit)
+    fetch = limit * LEXICAL_FILTER_OVERSAMPLING
+    for _ in range(LEXICAL_FILTER_ROUNDS):
+        hits = lexical_index.search(query, fetch)
+        allowed = _matching_ids([qdrant_id for qdrant_id, _ in hits], name, query_filter)
+        kept = [(qdrant_id, score) for qdrant_id, score in hits if qdrant_id in allowed][:limit]
+        if len(kept) == limit or len(hits) < fetch:
+            break
+        fetch *= LEXICAL_FILTER_OVERSAMPLING
+    return kept
+
+
+def _rank(search: str, hits, lexical: List[Tuple[str, float]], top_k: int) -> List[Tuple[str, float]]:
+    """(point id, score) of the final results, scores are cosine, BM25 or RRF by search mode"""
+    if search == "dense":
+        return [(str(h.id), h.score) for h in hits]
+    if search == "lexical":
+        return lexical
+    return rrf_fuse([[str(h.id) for h in hits], [qdrant_id for qdrant_id, _ in lexical]])[:top_k]
+
+
+@traced("payload_fetch")
+def _retrieve_payload_records(qdrant_ids: List[str], name: str = collection_name) -> Dict[str, Dict]:
+    """Payload records of lexical hits the vector search did not return"""
+    points = client.retrieve(collection_name=name, ids=qdrant_ids, with_payload=PAYLOAD_FIELDS, with_vectors=False)
+    by_qid = {}
+    for point in points:
+        record = _payload_record(point.payload)
+        if record:
+            by_qid[str(point.id)] = record
+    return by_qid
+
+
+def _check_vector(query_embedding: List[float], name: str = collection_name) -> List[float]:
+    # A collection filled by another embedding model cannot be searched with this one
+    expected = collection_dim(name)
+    if expected is not None and len(query_embedding) != expected:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Query vector size mismatch: expected {expected}, got {len(query_embedding)}"
+        )
+    return query_embedding
+
+
+def _query_vector(query: str, name: str = collection_name) -> List[float]:
+    #Generate query embedding (cached for repeated questions)
+    return _check_vector(get_query_embedding(query).tolist(), name)
+
+
+def _query_kwargs(
+    query_embedding: List[float],
+    top_k: int,
+    mode: str,
+    name: str = collection_name,
+    query_filter: Optional[Filter] = None
+) -> Dict:
+    #Search in qdrant, payload is only transferred when results are built from it
+    return dict(
+        collection_name=name,
+        query = query_embedding,
+        limit=top_k,
+        with_payload=PAYLOAD_FIELDS if mode == "payload" else False,
+        search_params=search_params(name=name),
+        # Keyword payload indexes let Qdrant narrow the search before scoring
+        query_filter=query_filter
+    )
+
+
+def _payload_records(hits) -> Dict[str, Dict]:
+    by_qid = {}
+    for h in hits:
+        record = _payload_record(h.payload)
+        if record:
+            by_qid[str(h.id)] = record
+    return by_qid
+
+
+def _resolve_records(qdrant_ids: List[str], hits, mode: str, search: str, name: str, db) -> Dict[str, Dict]:
+    """Chunk records of the ranked point ids"""
+    if mode == "payload":
+        by_qid = _payload_records(hits)
+        missing = [x for x in qdrant_ids if x not in by_qid]
+        if missing and search != "dense":
+            by_qid.update(_retrieve_payload_records(missing, name))
+        # Postgres only enriches hits whose payload is incomplete
+        missing = [x for x in qdrant_ids if x not in by_qid]
+        if missing:
+            by_qid.update(fetch_chunk_records(missing, db))
+        return by_qid
+    #Fetching chunk rows, hot chunks skip postgres
+    return fetch_chunk_records(qdrant_ids, db)
+
+
+def _build_results(scored: List[Tuple[str, float]], by_qid: Dict[str, Dict]) -> List[Dict]:
+    results: List[Dict] = []
+    for qdrant_id, score in scored:
+        record = by_qid.get(qdrant_id)
+
+        if record:
+            results.append({"score": score, "qdrant_id": qdrant_id, **record})
+        else:
+            results.append({
+                "score": score,
+                "qdrant_id": qdrant_id,
+                "text": None,
+                "chunk_index": None,
+                "chunk_length": None,
+                "document": None
+            })
+    return results
+
+
+def _scope(filters: Optional[Dict[str, Any]], tenant_id: Optional[str]) -> Tuple[Optional[str], Optional[Filter]]:
+    """Collection and filter of a search, None when the tenant has no collection yet"""
+    name = tenant_collection(tenant_id)
+    if name != collection_name and not client.collection_exists(name):
+        return None, None
+    return name, build_filter(filters, tenant_id)
+
+
+def search_documents(
+    query:str,
+    top_k: int = 5,
+    db: Session= None,
+    mode: Optional[str] = None,
+    search: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    tenant_id: Optional[str] = None
+):
+    """Chunks relevant to the query.
+
+    filters maps filename, document_id, file_type or chunking_strategy to a value or a
+    list of values, tenant_id limits the search to the chunks of one tenant.
+    """
+    mode = _check_mode(mode)
+    search = _check_search(search)
+    name, query_filter = _scope(filters, tenant_id)
+    if name is None:
+        return []
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    # Reranking picks top_k out of a larger candidate set
+    final_k = top_k
+    if rerank:
+        top_k = rerank_candidates(top_k)
+    try:
+        limit = _candidates(search, top_k)
+        hits = []
+        if search != "lexical":
+            query_embedding = _query_vector(query, name)
+            with span("vector_search"):
+                hits = client.query_points(**_query_kwargs(query_embedding, limit, mode, name, query_filter)).points
+        lexical = _lexical_search(query, limit, name, query_filter) if search != "dense" else []
+
+        scored = _rank(search, hits, lexical, top_k)
+        if not scored:
             return []
 
         # Extracting Qdrant Point ids    
-        qdrant_ids = [str(i.id) for i in hits]
-
-        #Fetching chunk row in postgres database
-        by_qid = {}
-        if db:
-            rows = db.query(Chunk).filter(Chunk.qdrant_point_id.in_([UUID(x) for x in qdrant_ids])).all()      
-            by_qid = {str(r.qdrant_point_id): r for r in rows}
-
-        results: List[Dict] = []
-        for h in hits:
-            qdrant_id = str(h.id)
-            chunk = by_qid.get(qdrant_id) if db else None
-
-            if chunk:
-                document: Document = chunk.document
-                results.append({
-                    "score": h.score,
-                    "qdrant_id": qdrant_id,
-                    "text": chunk.text_content,
-                    "chunk_id": chunk.chunk_id,
-                    "chunk_length": chunk.chunk_length,
-                    "document": {
-                        "id": str(document.id),
-                        "filename": document.filename,
-                        "file_type": document.file_type,
-                        "chunking_strategy": document.chunking_strategy,
-                        "embedding_model": document.embedding_model
-                    }
-                })
-            else:
-                results.append({
-                    "score": h.score,
-                    "qdrant_id": qdrant_id,
-                    "text": None,
-                    "chunk_index": None,
-                    "chunk_length": None,
-                    "document": None
-                })
+        qdrant_ids = [qdrant_id for qdrant_id, _ in scored]
+        by_qid = _resolve_records(qdrant_ids, hits, mode, search, name, db)
 
-        return results
+        results = _build_results(scored, by_qid)
+        return reranker.rerank(query, results, final_k) if rerank else results
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error in search : {str(e)}")
+
+
+def search_documents_batch(
+    queries: List[str],
+    top_k: int = 5,
+    db: Session = None,
+    mode: Optional[str] = None,
+    search: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    tenant_id: Optional[str] = None
+) -> List[List[Dict]]:
+    """search_documents for many queries, results in query order.
+
+    Queries are embedded in one model call and searched in one Qdrant batch request,
+    the chunks of all results are resolved with one Postgres query.
+    """
+    mode = _check_mode(mode)
+    search = _check_search(search)
+    name, query_filter = _scope(filters, tenant_id)
+    if name is None or not queries:
+        return [[] for _ in queries]
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    final_k = top_k
+    if rerank:
+        top_k = rerank_candidates(top_k)
+    try:
+        limit = _candidates(search, top_k)
+        hits = [[] for _ in queries]
+        if search != "lexical":
+            requests = [
+                QueryRequest(
+                    query=_check_vector(vector.tolist(), name),
+                    limit=limit,
+                    filter=query_filter,
+                    params=search_params(name=name),
+                    with_payload=PAYLOAD_FIELDS if mode == "payload" else False
+                )
+                for vector in get_query_embeddings(queries)
+            ]
+            with span("vector_search"):
+                hits = [response.points for response in client.query_batch_points(collection_name=name, requests=requests)]
+        lexical = [_lexical_search(query, limit, name, query_filter) if search != "dense" else [] for query in queries]
+
+        scored = [_rank(search, h, l, top_k) for h, l in zip(hits, lexical)]
+        qdrant_ids = list(dict.fromkeys(qdrant_id for ranked in scored for qdrant_id, _ in ranked))
+        by_qid = _resolve_records(qdrant_ids, [h for query_hits in hits for h in query_hits], mode, search, name, db) if qdrant_ids else {}
+
+        results = [_build_results(ranked, by_qid) for ranked in scored]
+        if rerank:
+            results = [reranker.rerank(query, r, final_k) for query, r in zip(queries, results)]
+        return results
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error in search : {str(e)}")
+
+
+async def _adense_hits(query: str, limit: int, mode: str, name: str, query_filter: Optional[Filter]):
+    # Encoding is CPU bound, cache hits return right away in the worker thread
+    query_embedding = await asyncio.to_thread(_query_vector, query, name)
+    with span("vector_search"):
+        return (await aquery_points(**_query_kwargs(query_embedding, limit, mode, name, query_filter))).points
+
+
+async def _no_hits():
+    return []
+
+
+async def asearch_documents(
+    query: str,
+    top_k: int = 5,
+    db: AsyncSession = None,
+    mode: Optional[str] = None,
+    search: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    tenant_id: Optional[str] = None
+):
+    """search_documents for the async path, nothing here blocks the event loop"""
+    mode = _check_mode(mode)
+    search = _check_search(search)
+    name, query_filter = await asyncio.to_thread(_scope, filters, tenant_id)
+    if name is None:
+        return []
+    rerank = RERANK_ENABLED if rerank is None else rerank
+    final_k = top_k
+    if rerank:
+        top_k = rerank_candidates(top_k)
+    try:
+        limit = _candidates(search, top_k)
+        # Vector and BM25 searches run concurrently
+        hits, lexical = await asyncio.gather(
+            _adense_hits(query, limit, mode, name, query_filter) if search != "lexical" else _no_hits(),
+            asyncio.to_thread(_lexical_search, query, limit, name, query_filter) if search != "dense" else _no_hits()
+        )
+
+        scored = _rank(search, hits, lexical, top_k)
+        if not scored:
+            return []
+
+        qdrant_ids = [qdrant_id for qdrant_id, _ in scored]
+
+        if mode == "payload":
+            by_qid = _payload_records(hits)
+            missing = [x for x in qdrant_ids if x not in by_qid]
+            if missing and search != "dense":
+                by_qid.update(await asyncio.to_thread(_retrieve_payload_records, missing, name))
+            missing = [x for x in qdrant_ids if x not in by_qid]
+            if missing:
+                by_qid.update(await afetch_chunk_records(missing, db))
+        else:
+            by_qid = await afetch_chunk_records(qdrant_ids, db)
+
+        results = _build_results(scored, by_qid)
+        # The cross-encoder is CPU bound
+        return await asyncio.to_thread(reranker.rerank, query, results, final_k) if rerank else results
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error in search : {str(e)}")
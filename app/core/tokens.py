@@ -0,0 +1,39 @@
+import os
+from functools import lru_cache
+from typing import Optional
+
+# BPE close to the Llama 3 vocabulary served by Groq
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "16384"))
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """Load the tokenizer once per process, None when it is not available (e.g. offline)"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(CONTEXT_TOKENIZER)
+    except Exception as e:
+        print(f"Tokenizer {CONTEXT_TOKENIZER} unavailable, estimating tokens from length: {e}")
+        return None
+
+
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    """Token count of a text, cached since the same hot chunks are counted over and over"""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        # About four characters per token for English text
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Optional[str]:
+    """Longest prefix of text within max_tokens"""
+    if max_tokens <= 0:
+        return None
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[:max_tokens * 4]
+    tokens = tokenizer.encode(text, disallowed_special=())
+    return tokenizer.decode(tokens[:max_tokens])
@@ -0,0 +1,200 @@
+import os
+import time
+import inspect
+import threading
+import functools
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from starlette.routing import compile_path
+from typing import Dict, List, Optional, Tuple
+
+# Stage spans cost a clock read and a locked counter update, cheap enough to leave on
+TRACING = os.getenv("TRACING", "true").lower() == "true"
+# Adds a Server-Timing header with the stage breakdown of each request
+TIMING_HEADER = os.getenv("TIMING_HEADER", "false").lower() == "true"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (stage, seconds) of the spans closed during the current request
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+class Histogram:
+    """Prometheus style latency histogram with labels"""
+
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [count per bucket (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float, int]]:
+        with self._lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.snapshot().items()):
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, n in zip(list(self.buckets) + [float("inf")], counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram("rag_stage_duration_seconds", "Time spent in each ingestion and retrieval stage", ("stage",))
+request_seconds = Histogram("http_request_duration_seconds", "Time to handle each request, streamed bodies included", ("method", "route", "status"))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one stage, nested spans are timed on their own as well"""
+    if not TRACING:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe((stage,), elapsed)
+        spans = _request_spans.get()
+        # Worker threads started with asyncio.to_thread share the list of their request
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def traced(stage: str):
+    """Decorator version of span for plain and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stage_stats() -> Dict[str, Dict[str, float]]:
+    """Count and average milliseconds per stage since start"""
+    return {
+        labels[0]: {"count": count, "avg_ms": total / count * 1000 if count else 0.0}
+        for labels, (_, total, count) in sorted(stage_seconds.snapshot().items())
+    }
+
+
+def render_metrics() -> str:
+    """All histograms in the Prometheus text exposition format"""
+    return "\n".join(stage_seconds.render() + request_seconds.render()) + "\n"
+
+
+def _server_timing(spans: List[Tuple[str, float]], total: float) -> bytes:
+    durations: Dict[str, float] = {}
+    for stage, elapsed in list(spans):
+        durations[stage] = durations.get(stage, 0.0) + elapsed
+    durations["total"] = total
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in durations.items()).encode("latin-1")
+
+
+def _route_templates(routes, prefix: str = "", templates: Optional[Dict[int, list]] = None) -> Dict[int, list]:
+    """Full path templates of every route by id, router prefixes included.
+
+    A router included twice lists its routes under each prefix, with the pattern telling them apart.
+    """
+    templates = {} if templates is None else templates
+    for route in routes:
+        path = getattr(route, "path_format", None)
+        if path is not None:
+            template = prefix + path
+            templates.setdefault(id(route), []).append((template, compile_path(template)[0]))
+        # Newer FastAPI versions keep an included router as one entry instead of copying
+        # its routes with the prefix applied, and report the original route in the scope
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            _route_templates(included.routes, prefix + getattr(route.include_context, "prefix", ""), templates)
+    return templates
+
+
+class TracingMiddleware:
+    """Times every HTTP request and collects the stage spans it runs.
+
+    Streamed responses send their headers before generation starts, so their
+    Server-Timing header only covers the stages that ran before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._templates: Dict[int, list] = {}
+
+    def _route_label(self, scope) -> str:
+        """Route template of a request, which keeps ids and unknown paths out of the label values"""
+        route = scope.get("route")
+        if route is None:
+            return "unmatched"
+        candidates = self._templates.get(id(route))
+        if candidates is None:
+            # Routes are registered before serving, so this runs once per route at most
+            app = scope.get("app")
+            self._templates = _route_templates(app.router.routes) if app is not None else {}
+            candidates = self._templates.setdefault(id(route), [])
+        if len(candidates) == 1:
+            return candidates[0][0]
+        for template, pattern in candidates:
+            if pattern.match(scope["path"]):
+                return template
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        spans: List[Tuple[str, float]] = []
+        token = _request_spans.set(spans)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if TIMING_HEADER:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(spans, time.perf_counter() - start)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+            request_seconds.observe((scope["method"], self._route_label(scope), str(status)), time.perf_counter() - start)
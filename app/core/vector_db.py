@@ -1,62 +1,362 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+import os
+import re
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, PointIdsList, SetPayload, SetPayloadOperation,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig,
+    QuantizationSearchParams, SearchParams, Filter, FieldCondition, MatchValue, MatchAny,
+    PayloadSchemaType, KeywordIndexParams
+)
 import uuid
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import HTTPException
-from .embeddings import create_embeddings
+from .local_vector_store import LocalVectorStore
+from .tracing import traced
+
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "8888"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+# ":memory:" or a local path runs Qdrant embedded, e.g. for tests
+QDRANT_LOCATION = os.getenv("QDRANT_LOCATION", "")
+# "local" keeps vectors in memory mapped files of this process instead of Qdrant
+VECTOR_STORE = os.getenv("VECTOR_STORE", "qdrant")
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "data/vectors")
+_EMBEDDED = bool(QDRANT_LOCATION) or VECTOR_STORE == "local"
+
+QDRANT_UPSERT_BATCH = int(os.getenv("QDRANT_UPSERT_BATCH", "256"))
+# Embedded stores are not meant for concurrent writers
+QDRANT_UPSERT_WORKERS = int(os.getenv("QDRANT_UPSERT_WORKERS", "1" if _EMBEDDED else "4"))
+QDRANT_UPSERT_RETRIES = int(os.getenv("QDRANT_UPSERT_RETRIES", "3"))
+
+# "int8" or "binary" keeps compressed vectors in RAM and the float32 originals on disk.
+# Only applies when the collection is created
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+VECTOR_QUANTIZATIONS = ("none", "int8", "binary")
+# Candidates searched on quantized vectors per result, rescored with the originals
+QUANTIZATION_OVERSAMPLING = float(os.getenv("QUANTIZATION_OVERSAMPLING", "2.0"))
+QUANTIZATION_RESCORE = os.getenv("QUANTIZATION_RESCORE", "true").lower() == "true"
+
+# "payload" keeps all tenants in one collection behind a tenant_id filter,
+# "collection" gives every tenant its own collection
+TENANT_MODE = os.getenv("TENANT_MODE", "payload")
+TENANT_MODES = ("payload", "collection")
+TENANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Payload fields search can filter on, each gets a keyword index
+FILTER_FIELDS = ("filename", "document_id", "file_type", "chunking_strategy", "tenant_id")
 
 
 #Initializing Qdrant Clint
-client = QdrantClient(host="localhost", port=8888)
+if VECTOR_STORE == "local":
+    client = LocalVectorStore(LOCAL_VECTOR_DIR)
+elif QDRANT_LOCATION:
+    client = QdrantClient(location=QDRANT_LOCATION)
+else:
+    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, grpc_port=QDRANT_GRPC_PORT, prefer_grpc=QDRANT_PREFER_GRPC)
+
+# Async client for the async request path, created on first use inside the event loop
+_async_client: Optional[AsyncQdrantClient] = None
+
+def get_async_client() -> Optional[AsyncQdrantClient]:
+    """None when the store runs embedded, its storage is not shared between clients"""
+    global _async_client
+    if _EMBEDDED:
+        return None
+    if _async_client is None:
+        _async_client = AsyncQdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, grpc_port=QDRANT_GRPC_PORT, prefer_grpc=QDRANT_PREFER_GRPC)
+    return _async_client
 
 #Setting collection name
 collection_name = "document_chunks"
 
 
-def store_in_qdrant(chunks: list, embeddings: list, filename: str):
-    """Store chunks and embeddings in Qdrant Vector Database"""
-    try:
-        embedding_dim = len(embeddings[0])
-        #Creating collection
+def check_tenant(tenant_id: Optional[str]) -> Optional[str]:
+    if tenant_id is not None and not TENANT_ID_PATTERN.match(tenant_id):
+        raise HTTPException(status_code=400, detail="tenant_id may only contain letters, digits, '-' and '_' (at most 64)")
+    return tenant_id
+
+
+def tenant_collection(tenant_id: Optional[str]) -> str:
+    """Collection holding the chunks of a tenant"""
+    if TENANT_MODE not in TENANT_MODES:
+        raise HTTPException(status_code=500, detail=f"Unknown TENANT_MODE {TENANT_MODE}, expected one of {TENANT_MODES}")
+    if TENANT_MODE == "collection" and check_tenant(tenant_id):
+        return f"{collection_name}__{tenant_id}"
+    return collection_name
+
+
+def build_filter(filters: Optional[Dict[str, Any]] = None, tenant_id: Optional[str] = None) -> Optional[Filter]:
+    """Qdrant filter from {field: value or list of values}, scoped to the tenant in payload mode"""
+    conditions = []
+    for field, value in (filters or {}).items():
+        if field not in FILTER_FIELDS or field == "tenant_id":
+            raise HTTPException(status_code=400, detail=f"Cannot filter on {field}, expected one of {', '.join(FILTER_FIELDS[:-1])}")
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(FieldCondition(key=field, match=MatchAny(any=[str(v) for v in value])))
+        else:
+            conditions.append(FieldCondition(key=field, match=MatchValue(value=str(value))))
+    if tenant_id is not None and TENANT_MODE == "payload":
+        conditions.append(FieldCondition(key="tenant_id", match=MatchValue(value=check_tenant(tenant_id))))
+    return Filter(must=conditions) if conditions else None
+
+# Vector size and quantization of collections already read by this process
+_collection_dims: Dict[str, int] = {}
+_collection_quantizations: Dict[str, str] = {}
+# Collections this process created or added the payload indexes to
+_prepared_collections = set()
+_collection_lock = threading.Lock()
+
+upsert_metrics = {"points": 0, "batches": 0, "retries": 0, "seconds": 0.0, "last_points_per_sec": 0.0}
+_metrics_lock = threading.Lock()
+
+
+def _vector_size(vectors) -> int:
+    # Unnamed vectors come back as VectorParams, named ones as a dict
+    if isinstance(vectors, dict):
+        return next(iter(vectors.values())).size
+    return vectors.size
+
+
+def quantization_config(quantization: str = VECTOR_QUANTIZATION):
+    if quantization not in VECTOR_QUANTIZATIONS:
+        raise HTTPException(status_code=500, detail=f"Unknown VECTOR_QUANTIZATION {quantization}, expected one of {VECTOR_QUANTIZATIONS}")
+    if quantization == "int8":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def search_params(quantization: Optional[str] = None, name: str = collection_name) -> Optional[SearchParams]:
+    """Search on quantized vectors, then rescore the oversampled candidates in full precision.
+
+    quantization defaults to the one the collection was created with, VECTOR_QUANTIZATION
+    only applies to collections created later.
+    """
+    if quantization is None:
+        quantization = collection_quantization(name)
+    if quantization in (None, "none"):
+        return None
+    return SearchParams(quantization=QuantizationSearchParams(rescore=QUANTIZATION_RESCORE, oversampling=QUANTIZATION_OVERSAMPLING))
+
+
+def _create_payload_indexes(name: str):
+    """Keyword indexes for the filter fields, Qdrant ignores ones that already exist"""
+    for field in FILTER_FIELDS:
+        if field == "tenant_id":
+            if TENANT_MODE != "payload":
+                continue
+            # Stores each tenant's points together so tenant filtered search stays fast
+            schema = KeywordIndexParams(type="keyword", is_tenant=True)
+        else:
+            schema = PayloadSchemaType.KEYWORD
+        client.create_payload_index(collection_name=name, field_name=field, field_schema=schema)
+
+
+def _quantization_name(config) -> str:
+    if config is None:
+        return "none"
+    return "binary" if isinstance(config, BinaryQuantization) else "int8"
+
+
+def _read_collection(name: str) -> bool:
+    """Cache vector size and quantization of a collection, False while it does not exist"""
+    if name in _collection_dims:
+        return True
+    with _collection_lock:
+        if name not in _collection_dims and client.collection_exists(name):
+            config = client.get_collection(name).config
+            _collection_quantizations[name] = _quantization_name(config.quantization_config)
+            _collection_dims[name] = _vector_size(config.params.vectors)
+    return name in _collection_dims
+
+
+def collection_dim(name: str = collection_name) -> Optional[int]:
+    """Vector size of a collection, read once per process, None while it does not exist"""
+    return _collection_dims[name] if _read_collection(name) else None
+
+
+def collection_quantization(name: str = collection_name) -> Optional[str]:
+    """Quantization a collection was created with, None while it does not exist"""
+    return _collection_quantizations[name] if _read_collection(name) else None
+
+
+def ensure_collection(embedding_dim: int, name: str = collection_name, quantization: str = VECTOR_QUANTIZATION):
+    """Create the collection if needed and check its vector size, once per process"""
+    if name not in _prepared_collections:
+        with _collection_lock:
+            if name not in _prepared_collections:
+                if not client.collection_exists(name):
+                    try:
+                        quantization_params = quantization_config(quantization)
+                        client.create_collection(
+                            collection_name = name,
+                            # Originals are only read for rescoring once quantized copies are in RAM
+                            vectors_config=VectorParams(size=embedding_dim, distance = Distance.COSINE, on_disk=quantization_params is not None), # Cosine Similarity
+                            # vectors_config=VectorParams(size=384, distance = Distance.DOT) # Dot Product
+                            quantization_config=quantization_params
+                        )
+                    except Exception:
+                        # Another worker may have created it in the meantime
+                        if not client.collection_exists(name):
+                            raise
+                _create_payload_indexes(name)
+                _prepared_collections.add(name)
+
+    cached = collection_dim(name)
+    if cached != embedding_dim:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Embedding dimension mismatch: collection={cached}, embeddings={embedding_dim}"
+        )
+
+
+def forget_collection(name: str = collection_name):
+    """Drop the cached schema check, e.g. after the collection was deleted"""
+    _collection_dims.pop(name, None)
+    _collection_quantizations.pop(name, None)
+    _prepared_collections.discard(name)
+
+
+def build_points(
+    chunks: list,
+    embeddings: list,
+    filename: str,
+    extra_payloads: Optional[List[Dict]] = None,
+    chunk_ids: Optional[List[int]] = None,
+    document_payload: Optional[Dict] = None
+) -> Tuple[List[PointStruct], List[str]]:
+    """Prepare Qdrant points for the chunks of one file.
+
+    document_payload holds document fields (id, file type, ...) copied into every point
+    so search results can be built without Postgres.
+    """
+    points = []
+    point_ids = []
+    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        point_id = str(uuid.uuid4())
+        payload = {
+            "filename": filename,
+            "chunk_id": chunk_ids[i] if chunk_ids else i,
+            "chunk": chunk
+        }
+        if document_payload:
+            payload.update(document_payload)
+        if extra_payloads:
+            payload.update(extra_payloads[i])
+        point = PointStruct(
+            id=point_id,
+            vector=embedding.tolist() if hasattr(embedding, "tolist") else embedding,
+            payload=payload
+        )
+        points.append(point)
+        point_ids.append(point_id)
+    return points, point_ids
+
+
+def _upsert_batch(points: List[PointStruct], retries: int, name: str) -> int:
+    """Upsert one batch, retrying with backoff. Returns the number of retries used"""
+    for attempt in range(retries + 1):
         try:
-            #If collection exist
-            info = client.get_collection(collection_name)
-            existing_dim = info.config.params.vectors["default"].size
-            if existing_dim != embedding_dim:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Embedding dimension mismatch: collection={existing_dim}, embeddings={embedding_dim}"
-                )
-        except:
-            client.create_collection(
-                collection_name = collection_name,
-                vectors_config=VectorParams(size=384, distance = Distance.COSINE) # Cosine Similarity
-                # vectors_config=VectorParams(size=384, distance = Distance.DOT) # Dot Product
-
-            )
-        #Prepareing points for insertion
-        points = []
-        point_ids = []  
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            point_id = str(uuid.uuid4())  
-            point = PointStruct(
-                id=point_id,
-                vector=embedding,
-                payload={
-                    "filename": filename,
-                    "chunk_id": i,
-                    "chunk": chunk
-                }
-            )
-            points.append(point)
-            point_ids.append(point_id)
-        
-        # Insert points in Qdrant
-        client.upsert(
-            collection_name=collection_name,
-            points=points
+            client.upsert(collection_name=name, points=points, wait=True)
+            return attempt
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(min(0.5 * 2 ** attempt, 5.0))
+
+
+@traced("vector_upsert")
+def upsert_points(
+    points: List[PointStruct],
+    batch_size: int = QDRANT_UPSERT_BATCH,
+    max_workers: int = QDRANT_UPSERT_WORKERS,
+    retries: int = QDRANT_UPSERT_RETRIES,
+    name: str = collection_name
+) -> Dict[str, float]:
+    """Insert points in Qdrant in batches sent concurrently, returns throughput stats"""
+    if not points:
+        return {"points": 0, "batches": 0, "retries": 0, "seconds": 0.0, "points_per_sec": 0.0}
+
+    batches = [points[i:i + batch_size] for i in range(0, len(points), batch_size)]
+    start = time.perf_counter()
+    if max_workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            retried = sum(pool.map(lambda batch: _upsert_batch(batch, retries, name), batches))
+    else:
+        retried = sum(_upsert_batch(batch, retries, name) for batch in batches)
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        "points": len(points),
+        "batches": len(batches),
+        "retries": retried,
+        "seconds": elapsed,
+        "points_per_sec": len(points) / elapsed if elapsed else 0.0
+    }
+    with _metrics_lock:
+        upsert_metrics["points"] += len(points)
+        upsert_metrics["batches"] += len(batches)
+        upsert_metrics["retries"] += retried
+        upsert_metrics["seconds"] += elapsed
+        upsert_metrics["last_points_per_sec"] = stats["points_per_sec"]
+    return stats
+
+
+def retrieve_vectors(point_ids: List[str], name: str = collection_name) -> Dict[str, List[float]]:
+    """Stored vectors by point id, used to reuse embeddings of identical chunks"""
+    if not point_ids or not client.collection_exists(name):
+        return {}
+    points = client.retrieve(collection_name=name, ids=point_ids, with_vectors=True, with_payload=False)
+    return {str(p.id): p.vector for p in points}
+
+
+def delete_points(point_ids: List[str], name: str = collection_name):
+    if point_ids:
+        client.delete(collection_name=name, points_selector=PointIdsList(points=point_ids))
+
+
+def set_payloads(payloads: Dict[str, Dict], name: str = collection_name):
+    """Update payload fields of existing points in one request"""
+    if payloads:
+        client.batch_update_points(
+            collection_name=name,
+            update_operations=[
+                SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id]))
+                for point_id, payload in payloads.items()
+            ]
         )
 
+
+def store_in_qdrant(
+    chunks: list,
+    embeddings: list,
+    filename: str,
+    extra_payloads: Optional[List[Dict]] = None,
+    chunk_ids: Optional[List[int]] = None,
+    document_payload: Optional[Dict] = None,
+    name: str = collection_name
+):
+    """Store chunks and embeddings in Qdrant Vector Database"""
+    try:
+        ensure_collection(len(embeddings[0]), name)
+        points, point_ids = build_points(chunks, embeddings, filename, extra_payloads, chunk_ids, document_payload)
+        upsert_points(points, name=name)
         return point_ids
-    
+
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error storing in Qdrant: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error storing in Qdrant: {str(e)}")
+
+
+async def aquery_points(**kwargs):
+    """query_points without blocking the event loop"""
+    async_client = get_async_client()
+    if async_client is None:
+        return await asyncio.to_thread(client.query_points, **kwargs)
+    return await async_client.query_points(**kwargs)
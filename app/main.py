@@ -1,15 +1,91 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
-from core.db import init_db
+from core.db import init_db, SessionLocal
+from core.embeddings import warm_up_models, get_embedding_metrics
+from core.query_cache import query_cache
+from core.query_batcher import query_batcher
+from core.jobs import ingestion_queue
+from core.vector_db import upsert_metrics
+from core.chunk_cache import chunk_cache
+from core.llm import get_generation_metrics
+from core.answer_cache import answer_cache
+from core.lexical_index import lexical_index, load_or_rebuild
+from core.reranker import reranker, RERANK_ENABLED
+from core.tracing import TracingMiddleware, render_metrics
 from routers import ingestion, rag
 
 # Create tables
 init_db()
 
-app = FastAPI(title="File Upload API")
+def load_lexical_index():
+    db = SessionLocal()
+    try:
+        load_or_rebuild(db)
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load embedding models once per worker before serving requests
+    await run_in_threadpool(warm_up_models)
+    # Maps the saved BM25 index, only the first start builds it from Postgres
+    await run_in_threadpool(load_lexical_index)
+    if RERANK_ENABLED:
+        # Also gives the latency budget a cost per pair before the first request
+        await run_in_threadpool(reranker.warm_up)
+    ingestion_queue.start()
+    yield
+    ingestion_queue.stop(timeout=30)
+
+app = FastAPI(title="File Upload API", lifespan=lifespan)
+# Request latency histograms and the optional Server-Timing header
+app.add_middleware(TracingMiddleware)
 
 app.include_router(ingestion.router, prefix="/ingest", tags=["ingestion"])
 app.include_router(rag.router, prefix="/rag", tags=["rag"])
 
+@app.get("/metrics", tags=["metrics"])
+def prometheus_metrics():
+    """Stage and request latency histograms in the Prometheus text format"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/embeddings", tags=["metrics"])
+def embedding_metrics():
+    return get_embedding_metrics()
+
+@app.get("/metrics/query-cache", tags=["metrics"])
+def query_cache_metrics():
+    return query_cache.stats()
+
+@app.get("/metrics/query-batcher", tags=["metrics"])
+def query_batcher_metrics():
+    return query_batcher.stats()
+
+@app.get("/metrics/vector-writer", tags=["metrics"])
+def vector_writer_metrics():
+    return upsert_metrics
+
+@app.get("/metrics/chunk-cache", tags=["metrics"])
+def chunk_cache_metrics():
+    return chunk_cache.stats()
+
+@app.get("/metrics/generation", tags=["metrics"])
+def generation_metrics():
+    return get_generation_metrics()
+
+@app.get("/metrics/answer-cache", tags=["metrics"])
+def answer_cache_metrics():
+    return answer_cache.stats()
+
+@app.get("/metrics/lexical-index", tags=["metrics"])
+def lexical_index_metrics():
+    return lexical_index.stats()
+
+@app.get("/metrics/reranker", tags=["metrics"])
+def reranker_metrics():
+    return reranker.stats()
+
 if __name__=="__main__":
     uvicorn.run("main:app",host="127.0.0.1",port=8000, reload=True)
\ No newline at end of file
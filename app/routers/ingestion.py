@@ -1,38 +1,41 @@
+import os
+from typing import List, Optional
 from fastapi import UploadFile, HTTPException, Form, APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
 from enum import Enum
-from core.extraction import extract_text_from_pdf, extract_text_from_txt
-from core.chunking import fixed_chunking, recursive_chunking
-from core.embeddings import create_embeddings
-from core.vector_db import store_in_qdrant
-from core.metadata import store_metadata_in_postgres
+from core.extraction import is_archive, iter_archive_members, save_to_tempfile
+from core.jobs import IngestionJob, ingestion_queue
+from core.pipeline import run_ingestion_job, run_bulk_ingestion_job, delete_document
 from core.db import get_db, SessionLocal
+from core.vector_db import check_tenant
 
 router = APIRouter()
 
 #Allowed File Types
 ALLOWED_EXTENSIONS = {".pdf", ".txt"}
+BULK_MAX_MEMBER_BYTES = int(os.getenv("BULK_MAX_MEMBER_BYTES", str(200 * 1024 * 1024)))
 
 class ChunkingStrategy(str, Enum):
     fixed = "fixed"
     recursive = "recursive"
+    streaming = "streaming"
 
-@router.post("/")
+@router.post("/", status_code=202)
 async def upload_file(
     uploaded_file: UploadFile,
     chunking_strategy: ChunkingStrategy = Form(description="Choose chunking strategy"),
-    db: SessionLocal = Depends(get_db)
+    tenant_id: Optional[str] = Form(None, description="Tenant owning the document")
 ):
-    chunk_size = 800
-    chunk_overlap = 200
-
     #Validata Chunking strategy
-    if chunking_strategy not in ["fixed", "recursive"]:
+    if chunking_strategy not in ["fixed", "recursive", "streaming"]:
         raise HTTPException(
             status_code=400,
-            detail="chunking_strategy must be either 'fixed' or 'recursive'"
+            detail="chunking_strategy must be one of 'fixed', 'recursive' or 'streaming'"
         )
 
+    check_tenant(tenant_id)
+
     # Validate file extension
     file_extension = Path(uploaded_file.filename).suffix.lower()
     if file_extension not in ALLOWED_EXTENSIONS:
@@ -41,38 +44,77 @@ async def upload_file(
             detail=f"File type not allowed. Only {', '.join(ALLOWED_EXTENSIONS)} files are accepted."
         )
     
-    #Reading content from uploaded documents
-    file_content = await uploaded_file.read()
+    # Spool the upload to disk, the job reads it from there page by page
+    file_path = await run_in_threadpool(save_to_tempfile, uploaded_file.file, file_extension)
 
+    # Extraction, chunking, embedding and storage run in the background
     try:
-        #Extracting content from file content
-        if file_extension == ".pdf":
-            text_content = extract_text_from_pdf(file_content)
-        elif file_extension == ".txt":
-            text_content = extract_text_from_txt(file_content)
-        
-        # Chunking the text contents
-        if chunking_strategy == "fixed":
-            chunks = fixed_chunking(text_content, chunk_size, chunk_overlap)
-            strategy_used = "Fixed Character text splitter"
-        else:
-            chunks = recursive_chunking(text_content, chunk_size, chunk_overlap)
-            strategy_used = "Recursive Character text splitter"
+        job = ingestion_queue.submit(
+            IngestionJob(uploaded_file.filename),
+            run_ingestion_job,
+            uploaded_file.filename, file_extension, file_path, chunking_strategy.value,
+            tenant_id=tenant_id
+        )
+    except HTTPException:
+        os.remove(file_path)
+        raise
+    return {"job_id": job.id, "status": job.status, "message": "Document queued for ingestion"}
+
+@router.post("/bulk", status_code=202)
+async def upload_files_bulk(
+    uploaded_files: List[UploadFile],
+    chunking_strategy: ChunkingStrategy = Form(description="Choose chunking strategy"),
+    tenant_id: Optional[str] = Form(None, description="Tenant owning the documents")
+):
+    """Ingest many .pdf/.txt files or zip/tar archives of them as one job"""
+    check_tenant(tenant_id)
+    files = []
+    rejected = []
 
-        #Embeddings the chunks
-        embeddings = create_embeddings(chunks)
+    # Files and archive members are spooled to disk one at a time, the job reads them from there
+    def add(filename: str, stream):
+        file_extension = Path(filename).suffix.lower()
+        if file_extension in ALLOWED_EXTENSIONS:
+            files.append((filename, file_extension, save_to_tempfile(stream, file_extension)))
+        else:
+            rejected.append({"filename": filename, "status": "skipped", "error": "File type not allowed"})
 
-        #Store in Qdrant vector database
-        point_ids = store_in_qdrant(chunks, embeddings, uploaded_file.filename)
+    def add_archive(uploaded_file: UploadFile):
+        for member_name, member in iter_archive_members(uploaded_file.filename, uploaded_file.file, BULK_MAX_MEMBER_BYTES):
+            add(member_name, member)
 
-        file_size = len(file_content)
+    try:
+        for uploaded_file in uploaded_files:
+            if is_archive(uploaded_file.filename):
+                await run_in_threadpool(add_archive, uploaded_file)
+            else:
+                await run_in_threadpool(add, uploaded_file.filename, uploaded_file.file)
 
-        #Store metedata in postgres database
-        doc_id = store_metadata_in_postgres(uploaded_file.filename, file_extension, file_size, chunking_strategy, chunks, point_ids, db)
+        if not files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"No files to ingest. Only {', '.join(ALLOWED_EXTENSIONS)} files are accepted."
+            )
 
-        return {"document_id": str(doc_id), "message": "Document and chunks stored sucessfully"}
-    
-    except HTTPException:
+        job = ingestion_queue.submit(
+            IngestionJob(f"bulk ({len(files)} files)"),
+            run_bulk_ingestion_job,
+            files, chunking_strategy.value,
+            tenant_id=tenant_id
+        )
+    except Exception:
+        for _, _, file_path in files:
+            os.remove(file_path)
         raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail = f"Internal server error: {str(e)}")
+    return {"job_id": job.id, "status": job.status, "files_queued": len(files), "rejected": rejected}
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.delete("/documents/{document_id}")
+def remove_document(document_id: str, tenant_id: Optional[str] = None, db: SessionLocal = Depends(get_db)):
+    return delete_document(document_id, db, tenant_id)
@@ -1,25 +1,55 @@
-from typing import List, Optional
+import os
+from typing import List, Optional, Union
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+import asyncio
+import json
 import re
 
-from core.db import SessionLocal, get_db
-from core.retrieval import search_documents
+from core.db import SessionLocal, get_db, get_async_db
+from core.retrieval import search_documents, asearch_documents, search_documents_batch
 from core.prompt import build_messages, SYSTEM_PROMPT
-from core.llm import generate_response
-from core.memory import save_chat_history, get_chat_history
+from core.llm import generate_response, agenerate_response, astream_response
+from core.memory import save_chat_history, save_chat_messages, get_chat_context, asave_chat_history, asave_chat_messages, aget_chat_context
 from core.models import InterviewBooking
-from core.email import send_booking_email, EmailSendError
+from core.answer_cache import answer_cache
+from core.email import send_booking_email, asend_booking_email, EmailSendError
 from core.booking import extract_booking_slots, is_booking_intent
 
 router = APIRouter()
 
+# LLM calls a batch request runs at the same time
+BATCH_ASK_CONCURRENCY = int(os.getenv("BATCH_ASK_CONCURRENCY", "8"))
+BATCH_ASK_MAX_ITEMS = int(os.getenv("BATCH_ASK_MAX_ITEMS", "500"))
+
+class SearchFilters(BaseModel):
+    """Restrict retrieval to chunks whose document matches every given field"""
+    filename: Optional[Union[str, List[str]]] = None
+    document_id: Optional[Union[str, List[str]]] = None
+    file_type: Optional[Union[str, List[str]]] = None
+    chunking_strategy: Optional[Union[str, List[str]]] = None
+
 class AskRequest(BaseModel):
     session_id: str = Field(..., description="Unique session ID for conversation")
     query: str = Field(..., description="User question")
     top_k: int = 5
+    filters: Optional[SearchFilters] = None
+    tenant_id: Optional[str] = Field(None, description="Only search documents of this tenant")
+
+class BatchAskItem(BaseModel):
+    query: str = Field(..., description="User question")
+    session_id: Optional[str] = Field(None, description="Conversation to continue, answered without history when empty")
+
+class BatchAskRequest(BaseModel):
+    items: List[BatchAskItem]
+    top_k: int = 5
+    filters: Optional[SearchFilters] = None
+    tenant_id: Optional[str] = Field(None, description="Only search documents of this tenant")
+    concurrency: Optional[int] = Field(None, ge=1, description="Concurrent LLM calls, capped by BATCH_ASK_CONCURRENCY")
 
 class Citation(BaseModel):
     filename: str
@@ -28,11 +58,96 @@ class Citation(BaseModel):
     qdrant_id: str
 
 
+class ContextUsage(BaseModel):
+    tokens_used: int
+    token_budget: int
+    segments_packed: int
+    segments_dropped: int
+
+
 class AskResponse(BaseModel):
     answer: str
     citations: List[Citation]
     context_found: bool
     query: str
+    # Not set when the answer came from the answer cache
+    context: Optional[ContextUsage] = None
+
+def _search_filters(payload: Union[AskRequest, BatchAskRequest]) -> Optional[dict]:
+    return payload.filters.model_dump(exclude_none=True) if payload.filters else None
+
+def _missing_booking_slots(name, email, event_date, event_time) -> List[str]:
+    missing = []
+    if not name:
+        missing.append("name")
+    if not email:
+        missing.append("email")
+    if not event_date:
+        missing.append("date")
+    if not event_time:
+        missing.append("time")
+    return missing
+
+def _missing_slots_answer(missing: List[str]) -> str:
+    return (
+        "I can help you book an interview. Please provide the following: "
+        f"{', '.join(missing)}. "
+        "Example: 'Book interview, name Diwash, email diwash@gmail.com, 2 sep 2025 3:30 PM'"
+    )
+
+def _booking_email(booking: InterviewBooking, human_time: str):
+    subject = "Interview Booking Confirmation"
+    body_text = (
+        f"Hi {booking.name},\n\n"
+        f"Your interview is confirmed for {human_time}.\n\n"
+        "If you need to reschedule, reply to this email.\n\nThanks!"
+    )
+    body_html = (
+        f"<p>Hi {booking.name},</p>"
+        f"<p>Your interview is <strong>confirmed</strong> for <strong>{human_time}</strong>.</p>"
+        "<p>If you need to reschedule, reply to this email.</p><p>Thanks!</p>"
+    )
+    return subject, body_text, body_html
+
+def _booking_answer(booking: InterviewBooking, human_time: str, email_status: str) -> str:
+    return f"Booked interview (ID {booking.id} for {booking.name} on {human_time}. Confirmation: {email_status}.)"
+
+def _no_context_response(answer: str, query: str) -> AskResponse:
+    return AskResponse(
+        answer=answer,
+        citations=[],
+        context_found=False,
+        query=query
+    )
+
+def _citations(chunks: List[dict]):
+    citations = []
+    context_found = False
+    for chunk in chunks:
+        if chunk.get("text") and chunk.get("text") != "Content not found in database":
+            context_found = True
+
+        doc_info = chunk.get("document") or {}
+        citations.append(Citation(
+            filename=doc_info.get("filename", "Unknown"),
+            chunk_id=chunk.get("chunk_id"),
+            score=chunk.get("score", 0.0),
+            qdrant_id=chunk.get("qdrant_id", "")
+        ))
+    return citations, context_found
+
+def _context_usage(pack_stats: Optional[dict]) -> Optional[dict]:
+    return {k: pack_stats[k] for k in ContextUsage.model_fields} if pack_stats else None
+
+def _rag_response(answer: str, chunks: List[dict], query: str, pack_stats: Optional[dict] = None) -> AskResponse:
+    citations, context_found = _citations(chunks)
+    return AskResponse(
+        answer=answer,
+        citations=citations,
+        context_found=context_found,
+        query=query,
+        context=_context_usage(pack_stats)
+    )
 
 @router.post("/ask", response_model=AskResponse)
 def ask(payload: AskRequest, db: Session = Depends(get_db)):
@@ -42,29 +157,12 @@ def ask(payload: AskRequest, db: Session = Depends(get_db)):
         # ------ Booking intent flow -----
         if is_booking_intent(user_text):
             name, email, event_date, event_time = extract_booking_slots(user_text)
-            missing = []
-            if not name:
-                missing.append("name")
-            if not email:
-                missing.append("email")
-            if not event_date:
-                missing.append("date")
-            if not event_time:
-                missing.append("time")
+            missing = _missing_booking_slots(name, email, event_date, event_time)
 
             if missing:
-                ask_str = (
-                    "I can help you book an interview. Please provide the following: "
-                    f"{', '.join(missing)}. "
-                    "Example: 'Book interview, name Diwash, email diwash@gmail.com, 2 sep 2025 3:30 PM'"
-                )
+                ask_str = _missing_slots_answer(missing)
                 save_chat_history(payload.session_id, "assistant", ask_str)
-                return AskResponse(
-                    answer=ask_str,
-                    citations=[],
-                    context_found=False,
-                    query=payload.query
-                )
+                return _no_context_response(ask_str, payload.query)
             
             interview_dt = datetime.combine(event_date, event_time)
             booking = InterviewBooking(
@@ -79,64 +177,223 @@ def ask(payload: AskRequest, db: Session = Depends(get_db)):
 
             human_time = interview_dt.strftime("%A, %d %B %Y at %I:%M %p")
 
-            subject = "Interview Booking Confirmation"
-            body_text = (
-                f"Hi {booking.name},\n\n"
-                f"Your interview is confirmed for {human_time}.\n\n"
-                "If you need to reschedule, reply to this email.\n\nThanks!"
-            )
-            body_html = (
-                f"<p>Hi {booking.name},</p>"
-                f"<p>Your interview is <strong>confirmed</strong> for <strong>{human_time}</strong>.</p>"
-                "<p>If you need to reschedule, reply to this email.</p><p>Thanks!</p>"
-            )
             email_status = "email_sent"
             try:
-                send_booking_email(booking.email, subject, body_text, body_html)
+                send_booking_email(booking.email, *_booking_email(booking, human_time))
             except EmailSendError as e:
                 email_status = f"email_failed: {e}"
-            answer = f"Booked interview (ID {booking.id} for {booking.name} on {human_time}. Confirmation: {email_status}.)"
+            answer = _booking_answer(booking, human_time, email_status)
 
-            save_chat_history(payload.session_id, "user", payload.query)
-            save_chat_history(payload.session_id, "assistant", answer)
+            save_chat_messages(payload.session_id, [("user", payload.query), ("assistant", answer)])
 
-            return AskResponse(
-                answer=answer,
-                citations=[],
-                context_found=False,
-                query=payload.query
-            )
+            return _no_context_response(answer, payload.query)
 
 
         #  -------Normal Rag Flow -----
         # Do retrieval
-        chunks = search_documents(payload.query, payload.top_k, db)
+        chunks = search_documents(payload.query, payload.top_k, db, filters=_search_filters(payload), tenant_id=payload.tenant_id)
+
+        # History is part of the answer cache key, read it before the lookup
+        summary, history = get_chat_context(payload.session_id)
 
-        # Build messages = combine history + context + new query
-        messages = build_messages(payload.session_id, payload.query, chunks)
+        pack_stats = {}
+        # Near duplicate question over the same chunks and conversation, skip the LLM
+        answer = answer_cache.get(payload.query, chunks, history, summary, payload.tenant_id)
+        if answer is not None:
+            save_chat_messages(payload.session_id, [("user", payload.query), ("assistant", answer)])
+        else:
+            # Build messages = combine history + context + new query
+            messages = build_messages(payload.session_id, payload.query, chunks, history=history, summary=summary, pack_stats=pack_stats)
 
-        answer = generate_response(payload.session_id, messages, temperature=0.2, max_tokens=800)
+            answer = generate_response(payload.session_id, messages, temperature=0.2, max_tokens=800)
+            answer_cache.set(payload.query, chunks, answer, history, summary, payload.tenant_id)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG failed: {e}")
 
-    citations = []
-    context_found = False
-    for chunk in chunks:
-        if chunk.get("text") and chunk.get("text") != "Content not found in database":
-            context_found = True
+    return _rag_response(answer, chunks, payload.query, pack_stats)
 
-        doc_info = chunk.get("document", {})
-        citations.append(Citation(
-            filename=doc_info.get("filename", "Unknown"),
-            chunk_id=chunk.get("chunk_id"),
-            score=chunk.get("score", 0.0),
-            qdrant_id=chunk.get("qdrant_id", "")
-        ))
-    
-    return AskResponse(
-        answer=answer,
-        citations=citations,
-        context_found=context_found,
-        query=payload.query
-    )
\ No newline at end of file
+async def _abook_interview(payload: AskRequest, user_text: str, db: AsyncSession) -> AskResponse:
+    """Booking intent flow of the async handlers"""
+    name, email, event_date, event_time = extract_booking_slots(user_text)
+    missing = _missing_booking_slots(name, email, event_date, event_time)
+
+    if missing:
+        ask_str = _missing_slots_answer(missing)
+        await asave_chat_history(payload.session_id, "assistant", ask_str)
+        return _no_context_response(ask_str, payload.query)
+
+    interview_dt = datetime.combine(event_date, event_time)
+    booking = InterviewBooking(
+        session_id=payload.session_id,
+        name=name.strip(),
+        email=str(email),
+        interview_at_utc=interview_dt
+    )
+    db.add(booking)
+    await db.commit()
+    await db.refresh(booking)
+
+    human_time = interview_dt.strftime("%A, %d %B %Y at %I:%M %p")
+
+    email_status = "email_sent"
+    try:
+        await asend_booking_email(booking.email, *_booking_email(booking, human_time))
+    except EmailSendError as e:
+        email_status = f"email_failed: {e}"
+    answer = _booking_answer(booking, human_time, email_status)
+
+    await asave_chat_messages(payload.session_id, [("user", payload.query), ("assistant", answer)])
+
+    return _no_context_response(answer, payload.query)
+
+@router.post("/ask/async", response_model=AskResponse)
+async def ask_async(payload: AskRequest, db: AsyncSession = Depends(get_async_db)):
+    """Same flow as /ask with async Redis, Postgres, Qdrant and Groq clients"""
+    try:
+        user_text = payload.query.strip()
+
+        if is_booking_intent(user_text):
+            return await _abook_interview(payload, user_text, db)
+
+        # History and retrieval do not depend on each other
+        (summary, history), chunks = await asyncio.gather(
+            aget_chat_context(payload.session_id),
+            asearch_documents(payload.query, payload.top_k, db, filters=_search_filters(payload), tenant_id=payload.tenant_id)
+        )
+
+        pack_stats = {}
+        answer = await asyncio.to_thread(answer_cache.get, payload.query, chunks, history, summary, payload.tenant_id)
+        if answer is not None:
+            await asave_chat_messages(payload.session_id, [("user", payload.query), ("assistant", answer)])
+        else:
+            messages = build_messages(payload.session_id, payload.query, chunks, history=history, summary=summary, pack_stats=pack_stats)
+
+            answer = await agenerate_response(payload.session_id, messages, temperature=0.2, max_tokens=800)
+            await asyncio.to_thread(answer_cache.set, payload.query, chunks, answer, history, summary, payload.tenant_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"RAG failed: {e}")
+
+    return _rag_response(answer, chunks, payload.query, pack_stats)
+
+@router.post("/ask/batch")
+async def ask_batch(payload: BatchAskRequest, db: Session = Depends(get_db)):
+    """Answer many questions in one request, as newline delimited JSON.
+
+    Retrieval runs once for the whole batch, LLM calls run concurrently and each result
+    line is sent as soon as its answer is ready, so lines arrive out of order and carry
+    the item index. Booking requests are not handled here.
+    """
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="No questions in the batch")
+    if len(payload.items) > BATCH_ASK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_ASK_MAX_ITEMS} questions per batch")
+    try:
+        queries = [item.query.strip() for item in payload.items]
+        # One embedding call, one Qdrant batch search and one Postgres query for every item
+        batch_chunks = await asyncio.to_thread(
+            search_documents_batch, queries, payload.top_k, db,
+            filters=_search_filters(payload), tenant_id=payload.tenant_id
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"RAG failed: {e}")
+
+    semaphore = asyncio.Semaphore(min(payload.concurrency or BATCH_ASK_CONCURRENCY, BATCH_ASK_CONCURRENCY))
+
+    async def answer(index: int, item: BatchAskItem, chunks: List[dict]) -> dict:
+        try:
+            pack_stats = {}
+            summary, history = await aget_chat_context(item.session_id) if item.session_id else (None, [])
+            answer = await asyncio.to_thread(answer_cache.get, item.query, chunks, history, summary, payload.tenant_id)
+            cached = answer is not None
+            if cached:
+                if item.session_id:
+                    await asave_chat_messages(item.session_id, [("user", item.query), ("assistant", answer)])
+            else:
+                messages = build_messages(item.session_id, item.query, chunks, history=history, summary=summary, pack_stats=pack_stats)
+                async with semaphore:
+                    answer = await agenerate_response(item.session_id, messages, temperature=0.2, max_tokens=800)
+                await asyncio.to_thread(answer_cache.set, item.query, chunks, answer, history, summary, payload.tenant_id)
+            return {"index": index, "cached": cached, **_rag_response(answer, chunks, item.query, pack_stats).model_dump()}
+        except Exception as e:
+            return {"index": index, "query": item.query, "error": f"RAG failed: {e}"}
+
+    async def results():
+        tasks = [asyncio.create_task(answer(i, item, chunks)) for i, (item, chunks) in enumerate(zip(payload.items, batch_chunks))]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task) + "\n"
+        finally:
+            # The client went away, drop the calls still waiting
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/ask/stream")
+async def ask_stream(payload: AskRequest, db: AsyncSession = Depends(get_async_db)):
+    """Server-sent events: citations once retrieval is done, then answer tokens, then timing"""
+    try:
+        user_text = payload.query.strip()
+
+        if is_booking_intent(user_text):
+            response = await _abook_interview(payload, user_text, db)
+            async def booking_events():
+                yield _sse("citations", {"citations": [], "context_found": False, "query": payload.query})
+                yield _sse("token", {"text": response.answer})
+                yield _sse("done", {})
+            return StreamingResponse(booking_events(), media_type="text/event-stream")
+
+        (summary, history), chunks = await asyncio.gather(
+            aget_chat_context(payload.session_id),
+            asearch_documents(payload.query, payload.top_k, db, filters=_search_filters(payload), tenant_id=payload.tenant_id)
+        )
+        pack_stats = {}
+        cached = await asyncio.to_thread(answer_cache.get, payload.query, chunks, history, summary, payload.tenant_id)
+        if cached is not None:
+            await asave_chat_messages(payload.session_id, [("user", payload.query), ("assistant", cached)])
+        else:
+            messages = build_messages(payload.session_id, payload.query, chunks, history=history, summary=summary, pack_stats=pack_stats)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"RAG failed: {e}")
+
+    citations, context_found = _citations(chunks)
+
+    async def events():
+        yield _sse("citations", {
+            "citations": [c.model_dump() for c in citations],
+            "context_found": context_found,
+            "query": payload.query,
+            "context": _context_usage(pack_stats)
+        })
+        if cached is not None:
+            yield _sse("token", {"text": cached})
+            yield _sse("done", {"cached": True})
+            return
+        stats = {}
+        parts = []
+        try:
+            async for token in astream_response(payload.session_id, messages, temperature=0.2, max_tokens=800, stats=stats):
+                parts.append(token)
+                yield _sse("token", {"text": token})
+        except Exception as e:
+            # Headers are already sent, report the failure in the stream
+            yield _sse("error", {"detail": f"RAG failed: {e}"})
+            return
+        await asyncio.to_thread(answer_cache.set, payload.query, chunks, "".join(parts).strip(), history, summary, payload.tenant_id)
+        yield _sse("done", {"cached": False, **stats})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
\ No newline at end of file
@@ -0,0 +1,62 @@
+import random
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+from app.core.chunking import fixed_chunking, recursive_chunking, stream_chunks
+
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 200
+PAGE_COUNTS = [100, 1000, 5000]
+
+WORDS = "the customer may return any product within seven days of delivery subject to the terms and conditions of dropit nepal".split()
+
+
+def make_pages(num_pages: int, seed: int = 42) -> List[Tuple[int, str]]:
+    """Synthetic pages of about 1k characters with paragraph breaks"""
+    rng = random.Random(seed)
+    pages = []
+    for page_number in range(1, num_pages + 1):
+        paragraphs = []
+        for _ in range(rng.randint(3, 6)):
+            lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 14))) for _ in range(rng.randint(2, 5))]
+            paragraphs.append("\n".join(lines))
+        pages.append((page_number, "\n\n".join(paragraphs)))
+    return pages
+
+
+def measure(name: str, func: Callable[[], int]):
+    tracemalloc.start()
+    start = time.perf_counter()
+    num_chunks = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"name": name, "chunks": num_chunks, "seconds": elapsed, "peak_mb": peak / (1024 * 1024)}
+
+
+def run_benchmark():
+    for num_pages in PAGE_COUNTS:
+        pages = make_pages(num_pages)
+        total_chars = sum(len(text) for _, text in pages)
+
+        def langchain_fixed():
+            # The LangChain splitters need the whole document as one string
+            return len(fixed_chunking("\n".join(text for _, text in pages), CHUNK_SIZE, CHUNK_OVERLAP))
+
+        def langchain_recursive():
+            return len(recursive_chunking("\n".join(text for _, text in pages), CHUNK_SIZE, CHUNK_OVERLAP))
+
+        def streaming():
+            # Only count records, a consumer like embedding batches would not keep them all
+            return sum(1 for _ in stream_chunks(iter(pages), CHUNK_SIZE, CHUNK_OVERLAP))
+
+        print(f"\n=== {num_pages} pages, {total_chars / 1e6:.1f}M chars ===")
+        for name, func in [("fixed (LangChain)", langchain_fixed), ("recursive (LangChain)", langchain_recursive), ("streaming", streaming)]:
+            m = measure(name, func)
+            print(f"{m['name']:<22} chunks={m['chunks']:<7} {total_chars / m['seconds'] / 1e6:7.2f}M chars/sec  peak={m['peak_mb']:.1f}MB")
+
+
+if __name__ == "__main__":
+    run_benchmark()
+
+# Run by:  uv run -m test.benchmark_chunking
@@ -0,0 +1,53 @@
+import random
+import time
+from typing import List
+from app.core.embeddings import warm_up_models
+from app.core.embedding_engine import embed_texts, shutdown_pool
+
+BATCH_SIZES = [8, 32, 64, 128]
+WORKER_COUNTS = [0, 2, 4]
+NUM_CHUNKS = 2000
+
+WORDS = "the customer may return any product within seven days of delivery subject to the terms and conditions of dropit nepal".split()
+
+
+def make_chunks(n: int, seed: int = 42) -> List[str]:
+    """Synthetic chunks with mixed lengths, similar to splitter output"""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 150))) for _ in range(n)]
+
+
+def run_benchmark(num_chunks: int = NUM_CHUNKS):
+    chunks = make_chunks(num_chunks)
+    warm_up_models()
+
+    results = []
+    for workers in WORKER_COUNTS:
+        for batch_size in BATCH_SIZES:
+            # First call starts the pool, keep it out of the timing
+            embed_texts(chunks[:batch_size * max(workers, 1)], batch_size=batch_size, workers=workers)
+
+            start = time.perf_counter()
+            matrix = embed_texts(chunks, batch_size=batch_size, workers=workers)
+            elapsed = time.perf_counter() - start
+
+            results.append({
+                "workers": workers,
+                "batch_size": batch_size,
+                "seconds": elapsed,
+                "chunks_per_sec": len(chunks) / elapsed,
+                "shape": matrix.shape
+            })
+            print(f"workers={workers} batch_size={batch_size}: {len(chunks) / elapsed:.1f} chunks/sec ({elapsed:.2f}s)")
+        shutdown_pool()
+
+    best = max(results, key=lambda r: r["chunks_per_sec"])
+    print("\n=== Best Configuration ===")
+    print(f"workers={best['workers']} batch_size={best['batch_size']}: {best['chunks_per_sec']:.1f} chunks/sec")
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark()
+
+# Run by:  uv run -m test.benchmark_embeddings
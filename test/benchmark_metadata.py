@@ -0,0 +1,76 @@
+import time
+import uuid
+from sqlalchemy import delete
+from app.core.db import SessionLocal, init_db
+from app.core.models import Document, Chunk
+from app.core.metadata import _chunk_row, insert_chunk_rows
+
+ROW_COUNTS = [1000, 10000]
+CHUNK_TEXT = "the customer may return any product within seven days of delivery " * 12
+
+
+def new_document(db, num_chunks: int) -> Document:
+    document = Document(
+        id=uuid.uuid4(),
+        filename=f"benchmark-{uuid.uuid4()}.txt",
+        file_type=".txt",
+        file_size=0,
+        chunking_strategy="fixed",
+        total_chunks=num_chunks,
+        embedding_model="benchmark"
+    )
+    db.add(document)
+    db.flush()
+    return document
+
+
+def per_object(db, num_chunks: int):
+    """The previous path, one ORM object per chunk"""
+    document = new_document(db, num_chunks)
+    for i in range(num_chunks):
+        db.add(Chunk(
+            document_id=document.id,
+            chunk_id=i,
+            qdrant_point_id=uuid.uuid4(),
+            text_content=CHUNK_TEXT,
+            chunk_length=len(CHUNK_TEXT)
+        ))
+    db.commit()
+    return document.id
+
+
+def bulk(mode: str):
+    def run(db, num_chunks: int):
+        document = new_document(db, num_chunks)
+        insert_chunk_rows([_chunk_row(document.id, i, CHUNK_TEXT, uuid.uuid4(), None) for i in range(num_chunks)], db, mode=mode)
+        db.commit()
+        return document.id
+    return run
+
+
+def cleanup(db, doc_id):
+    db.execute(delete(Chunk).where(Chunk.document_id == doc_id))
+    db.execute(delete(Document).where(Document.id == doc_id))
+    db.commit()
+
+
+def run_benchmark():
+    init_db()
+    db = SessionLocal()
+    try:
+        for num_chunks in ROW_COUNTS:
+            print(f"\n=== {num_chunks} chunks ===")
+            for name, func in [("per object (ORM)", per_object), ("executemany", bulk("executemany")), ("copy", bulk("copy"))]:
+                start = time.perf_counter()
+                doc_id = func(db, num_chunks)
+                elapsed = time.perf_counter() - start
+                cleanup(db, doc_id)
+                print(f"{name:<18} {num_chunks / elapsed:10.0f} rows/sec ({elapsed:.2f}s)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_benchmark()
+
+# Run by:  uv run -m test.benchmark_metadata  (needs the Postgres from docker-compose)
@@ -0,0 +1,124 @@
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct
+from app.core.local_vector_store import LocalVectorStore
+from app.core.vector_db import client, collection_name, quantization_config, search_params, QDRANT_HOST, QDRANT_PORT
+from test.benchmark_vector_store import make_vectors, exact_neighbours
+
+MODES = ["none", "int8", "binary"]
+OVERSAMPLING = [1.0, 2.0, 4.0]
+SYNTHETIC_SIZE = 50000
+MAX_CORPUS = 200000
+NUM_QUERIES = 200
+TOP_K = 10
+COLLECTION = "benchmark_quantization"
+
+
+def load_corpus() -> np.ndarray:
+    """Chunk embeddings of the app collection, random vectors when it is empty"""
+    try:
+        vectors, offset = [], None
+        while len(vectors) < MAX_CORPUS:
+            points, offset = client.scroll(collection_name, limit=1000, offset=offset, with_vectors=True, with_payload=False)
+            vectors.extend(p.vector for p in points)
+            if offset is None:
+                break
+        if len(vectors) > 10 * NUM_QUERIES:
+            print(f"Using {len(vectors)} chunk embeddings from {collection_name}")
+            corpus = np.asarray(vectors, dtype=np.float32)
+            return corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    except Exception:
+        pass
+    print(f"No chunk embeddings found, using {SYNTHETIC_SIZE} random vectors")
+    return make_vectors(SYNTHETIC_SIZE + NUM_QUERIES, seed=42)
+
+
+def qdrant_server() -> Optional[QdrantClient]:
+    """Embedded Qdrant ignores quantization, so only a server is worth measuring"""
+    try:
+        server = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, timeout=2)
+        server.get_collections()
+        return server
+    except Exception:
+        print("Qdrant server not reachable, measuring the local store only")
+        return None
+
+
+def ram_bytes(mode: str, n: int, dim: int) -> int:
+    """Vector bytes kept in RAM, originals stay on disk once quantized"""
+    return n * {"none": dim * 4, "int8": dim, "binary": (dim + 7) // 8}[mode]
+
+
+def measure(store, mode: str, corpus: np.ndarray, queries: np.ndarray, truth: List[set]) -> List[Dict]:
+    ids = [str(uuid.UUID(int=i)) for i in range(len(corpus))]
+    if store.collection_exists(COLLECTION):
+        store.delete_collection(COLLECTION)
+    store.create_collection(
+        collection_name=COLLECTION,
+        vectors_config=VectorParams(size=corpus.shape[1], distance=Distance.COSINE, on_disk=mode != "none"),
+        quantization_config=quantization_config(mode)
+    )
+    for i in range(0, len(corpus), 1000):
+        store.upsert(
+            collection_name=COLLECTION,
+            points=[PointStruct(id=ids[j], vector=corpus[j].tolist(), payload={"row": j}) for j in range(i, min(i + 1000, len(corpus)))],
+            wait=True
+        )
+
+    results = []
+    for oversampling in (OVERSAMPLING if mode != "none" else [1.0]):
+        params = search_params(mode)
+        if params is not None:
+            params.quantization.oversampling = oversampling
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            points = store.query_points(
+                collection_name=COLLECTION, query=query.tolist(), limit=TOP_K, with_payload=True, search_params=params
+            ).points
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected & {p.payload["row"] for p in points})
+        latencies = np.asarray(latencies) * 1000
+        results.append({
+            "mode": mode,
+            "oversampling": oversampling,
+            "ram_mb": ram_bytes(mode, len(corpus), corpus.shape[1]) / (1024 * 1024),
+            "recall": hits / (len(queries) * TOP_K),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99))
+        })
+    store.delete_collection(COLLECTION)
+    return results
+
+
+def run_benchmark():
+    vectors = load_corpus()
+    corpus, queries = vectors[:-NUM_QUERIES], vectors[-NUM_QUERIES:]
+    truth = exact_neighbours(corpus, queries)
+
+    backends = [("local", None)]
+    server = qdrant_server()
+    if server is not None:
+        backends.append(("qdrant", server))
+
+    for name, store in backends:
+        print(f"\n=== {name}: {len(corpus)} vectors, dim {corpus.shape[1]}, recall@{TOP_K} ===")
+        path = tempfile.mkdtemp(prefix="vectors-") if store is None else None
+        try:
+            for mode in MODES:
+                for m in measure(store or LocalVectorStore(path), mode, corpus, queries, truth):
+                    print(f"{m['mode']:<7} oversampling={m['oversampling']:<4} ram={m['ram_mb']:8.1f}MB  recall={m['recall']:.3f}  p50={m['p50_ms']:6.2f}ms  p99={m['p99_ms']:6.2f}ms")
+        finally:
+            if path:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run_benchmark()
+
+# Run by:  uv run -m test.benchmark_quantization
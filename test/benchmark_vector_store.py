@@ -0,0 +1,111 @@
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Dict, List
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct
+import app.core.local_vector_store as local_vector_store
+from app.core.local_vector_store import LocalVectorStore
+from app.core.vector_db import QDRANT_HOST, QDRANT_PORT
+
+DIM = 384
+CORPUS_SIZES = [10000, 50000]
+NUM_QUERIES = 200
+TOP_K = 10
+COLLECTION = "benchmark_vectors"
+
+
+def make_vectors(n: int, seed: int) -> np.ndarray:
+    """Normalized random vectors, clustered a little like real embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(64, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.normal(size=(n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray) -> List[set]:
+    scores = queries @ corpus.T
+    return [set(np.argsort(-row)[:TOP_K].tolist()) for row in scores]
+
+
+def qdrant_client() -> QdrantClient:
+    """Qdrant server from the app config, embedded Qdrant when it is not running"""
+    try:
+        client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, timeout=2)
+        client.get_collections()
+        return client
+    except Exception:
+        print("Qdrant server not reachable, using embedded Qdrant")
+        return QdrantClient(location=":memory:")
+
+
+def measure(name: str, client, corpus: np.ndarray, queries: np.ndarray, truth: List[set]) -> Dict:
+    ids = [str(uuid.UUID(int=i)) for i in range(len(corpus))]
+    if client.collection_exists(COLLECTION):
+        client.delete_collection(COLLECTION)
+    client.create_collection(collection_name=COLLECTION, vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+
+    start = time.perf_counter()
+    for i in range(0, len(corpus), 1000):
+        client.upsert(
+            collection_name=COLLECTION,
+            points=[PointStruct(id=ids[j], vector=corpus[j].tolist(), payload={"row": j}) for j in range(i, min(i + 1000, len(corpus)))],
+            wait=True
+        )
+    index_seconds = time.perf_counter() - start
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        points = client.query_points(collection_name=COLLECTION, query=query.tolist(), limit=TOP_K, with_payload=True).points
+        latencies.append(time.perf_counter() - start)
+        hits += len(expected & {p.payload["row"] for p in points})
+    client.delete_collection(COLLECTION)
+
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "name": name,
+        "index_seconds": index_seconds,
+        "recall": hits / (len(queries) * TOP_K),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99))
+    }
+
+
+def run_benchmark():
+    try:
+        import hnswlib  # noqa: F401
+        has_hnsw = True
+    except ImportError:
+        has_hnsw = False
+        print("hnswlib not installed, skipping the local HNSW index")
+
+    qdrant = qdrant_client()
+    for size in CORPUS_SIZES:
+        corpus = make_vectors(size, seed=42)
+        queries = make_vectors(NUM_QUERIES, seed=7)
+        truth = exact_neighbours(corpus, queries)
+        print(f"\n=== {size} vectors, dim {DIM}, recall@{TOP_K} ===")
+
+        backends = [("local exact", "exact")] + ([("local hnsw", "hnsw")] if has_hnsw else [])
+        results = []
+        for name, index in backends:
+            local_vector_store.LOCAL_VECTOR_INDEX = index
+            local_vector_store.LOCAL_ANN_MIN_POINTS = 0
+            path = tempfile.mkdtemp(prefix="vectors-")
+            try:
+                results.append(measure(name, LocalVectorStore(path), corpus, queries, truth))
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+        results.append(measure("qdrant", qdrant, corpus, queries, truth))
+
+        for m in results:
+            print(f"{m['name']:<12} index={m['index_seconds']:6.2f}s  recall={m['recall']:.3f}  p50={m['p50_ms']:6.2f}ms  p99={m['p99_ms']:6.2f}ms")
+
+
+if __name__ == "__main__":
+    run_benchmark()
+
+# Run by:  uv run -m test.benchmark_vector_store
@@ -1,9 +1,15 @@
 import time
 from typing import List, Dict, Set
 from sqlalchemy.orm import Session
-from app.core.retrieval import search_documents
+from app.core.retrieval import search_documents, search_documents_batch, RETRIEVAL_MODES, SEARCH_MODES
+from app.core.chunk_cache import chunk_cache
+from app.core.embeddings import warm_up_models, get_embedding_metrics
+from app.core.query_cache import query_cache
 from app.core.vector_db import client, collection_name
 from app.core.db import get_db
+from app.core.lexical_index import load_or_rebuild
+from app.core.reranker import reranker
+from app.core.tracing import stage_stats
 
 # Ground Truth Dataset
 GROUND_TRUTH = [
@@ -42,9 +48,111 @@ def f1_score(p: float, r: float) -> float:
     return 2 * (p * r) / (p + r) if (p + r) > 0 else 0.0
 
 
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def compare_retrieval_modes(db: Session = None, top_k: int = 5, repeats: int = 20):
+    """p50/p99 search latency of each retrieval mode over the ground truth queries"""
+    warm_up_models()
+    latencies: Dict[str, List[float]] = {mode: [] for mode in RETRIEVAL_MODES}
+
+    for _ in range(repeats):
+        for item in GROUND_TRUTH:
+            for mode in RETRIEVAL_MODES:
+                # Measure the postgres round trip, not the hot chunk cache
+                chunk_cache.clear()
+                start_time = time.perf_counter()
+                search_documents(query=item["query"], top_k=top_k, db=db, mode=mode)
+                latencies[mode].append(time.perf_counter() - start_time)
+
+    print("\n=== Retrieval Mode Latency ===")
+    for mode, values in latencies.items():
+        print(f"{mode}: p50 {percentile(values, 50)*1000:.1f}ms, p99 {percentile(values, 99)*1000:.1f}ms over {len(values)} searches")
+    return latencies
+
+
+def _evaluate_search(db: Session, top_k: int, repeats: int, before_search=None, **search_kwargs) -> Dict[str, float]:
+    """Average precision/recall/F1 and p50/p99 latency of one search configuration"""
+    scores = []
+    latencies: List[float] = []
+    for item in GROUND_TRUTH:
+        relevant: Set[int] = set(item["relevant_chunks"])
+        for _ in range(repeats):
+            if before_search:
+                before_search()
+            start_time = time.perf_counter()
+            retrieved = search_documents(query=item["query"], top_k=top_k, db=db, **search_kwargs)
+            latencies.append(time.perf_counter() - start_time)
+        retrieved_ids: Set[int] = {r.get("chunk_id") for r in retrieved if r.get("chunk_id") is not None}
+        tp = len(retrieved_ids & relevant)
+        p = precision(tp, len(retrieved_ids - relevant))
+        r = recall(tp, len(relevant - retrieved_ids))
+        scores.append((p, r, f1_score(p, r)))
+
+    avg_p, avg_r, avg_f1 = (sum(s[i] for s in scores) / len(scores) for i in range(3))
+    return {"precision": avg_p, "recall": avg_r, "f1_score": avg_f1, "p50": percentile(latencies, 50), "p99": percentile(latencies, 99)}
+
+
+def _print_report(title: str, report: Dict[str, Dict[str, float]]):
+    print(f"\n=== {title} ===")
+    print(f"{'':<14} {'precision':>9} {'recall':>7} {'f1':>5} {'p50':>9} {'p99':>9}")
+    for name, m in report.items():
+        print(f"{name:<14} {m['precision']:>9.2f} {m['recall']:>7.2f} {m['f1_score']:>5.2f} {m['p50']*1000:>7.1f}ms {m['p99']*1000:>7.1f}ms")
+
+
+def compare_search_modes(db: Session = None, top_k: int = 5, repeats: int = 5):
+    """Precision, recall and latency of dense, lexical and hybrid search"""
+    warm_up_models()
+    report = {search: _evaluate_search(db, top_k, repeats, search=search, rerank=False) for search in SEARCH_MODES}
+    _print_report("Search Modes", report)
+    return report
+
+
+def compare_reranking(db: Session = None, top_k: int = 5, repeats: int = 5):
+    """Effect of the cross-encoder stage on quality and latency, with a cold and a warm score cache"""
+    warm_up_models()
+    reranker.warm_up()
+    report = {
+        "no rerank": _evaluate_search(db, top_k, repeats, rerank=False),
+        "rerank": _evaluate_search(db, top_k, repeats, before_search=reranker.cache.clear, rerank=True),
+        "rerank cached": _evaluate_search(db, top_k, repeats, rerank=True)
+    }
+    _print_report("Reranking", report)
+    stats = reranker.stats()
+    print(f"Skipped: {stats['skipped']}, Shortened: {stats['shortened']}, {stats['seconds_per_pair']*1000:.1f}ms per pair, budget {stats['budget_ms']:.0f}ms")
+    return report
+
+
+def compare_batch_search(db: Session = None, top_k: int = 5, repeats: int = 5):
+    """One search per question against a single batched search for all of them"""
+    warm_up_models()
+    queries = [item["query"] for item in GROUND_TRUTH]
+    sequential, batched = [], []
+    # Embeddings come from the query cache after the first round, so this times the store round trips
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        for query in queries:
+            search_documents(query=query, top_k=top_k, db=db)
+        sequential.append(time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        search_documents_batch(queries, top_k=top_k, db=db)
+        batched.append(time.perf_counter() - start_time)
+
+    print(f"\n=== Batch Search ({len(queries)} queries) ===")
+    print(f"sequential: p50 {percentile(sequential, 50)*1000:.1f}ms, batched: p50 {percentile(batched, 50)*1000:.1f}ms")
+    return {"sequential": sequential, "batched": batched}
+
+
 def evaluate_queries(db: Session = None, top_k: int = 5):
     results_per_query = []
 
+    # Load the shared model up front so latency only measures retrieval
+    warm_up_models()
+
     for item in GROUND_TRUTH:
         query = item["query"]
         relevant: Set[int] = set(item["relevant_chunks"])
@@ -96,12 +204,31 @@ def evaluate_queries(db: Session = None, top_k: int = 5):
     print(f"Avg F1: {avg_f1:.2f}")
     print(f"Avg Latency: {avg_latency:.3f}s")
 
+    print("\n=== Embedding Model ===")
+    for model_name, m in get_embedding_metrics().items():
+        print(f"{model_name}: load {m['load_seconds']:.2f}s, {m['encode_calls']} encodes, avg {m['encode_seconds_avg']*1000:.1f}ms")
+
+    cache = query_cache.stats()
+    print("\n=== Query Embedding Cache ===")
+    print(f"Hits: {cache['hits']}, Misses: {cache['misses']}, Evictions: {cache['evictions']}, Hit rate: {cache['hit_rate']:.2f}")
+
+    # Where the search latency above went, stages can nest
+    print("\n=== Stage Latency ===")
+    for stage, m in stage_stats().items():
+        print(f"{stage}: {m['count']} spans, avg {m['avg_ms']:.1f}ms")
+
 if __name__ == "__main__":
     db_gen = get_db()  # generator
     db = next(db_gen)  # get session
 
     try:
+        # The API loads the BM25 index at startup, the harness has to do it itself
+        load_or_rebuild(db)
         evaluate_queries(db=db, top_k=2)
+        compare_search_modes(db=db, top_k=2)
+        compare_reranking(db=db, top_k=2)
+        compare_retrieval_modes(db=db, top_k=2)
+        compare_batch_search(db=db, top_k=2)
     finally:
         db.close()  
 
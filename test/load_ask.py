@@ -0,0 +1,115 @@
+import asyncio
+import os
+import sys
+import time
+from unittest import mock
+
+# Routers import core.* the way app/main.py runs them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+import httpx
+from fastapi import FastAPI
+from routers import rag
+from core.db import get_db, get_async_db
+from core.answer_cache import AnswerCache
+
+CONCURRENCY = [1, 16, 64]
+REQUESTS = 256
+
+# Simulated backend latencies in seconds (Redis, Qdrant + Postgres, LLM)
+HISTORY_LATENCY = 0.002
+SEARCH_LATENCY = 0.02
+LLM_LATENCY = 0.2
+
+CHUNKS = [{"score": 0.9, "qdrant_id": "q1", "text": "Returns are accepted within seven days.", "chunk_id": 0, "document": {"id": "d1", "filename": "policy.txt"}}]
+
+
+def search_documents(query, top_k=5, db=None, mode=None, **kwargs):
+    time.sleep(SEARCH_LATENCY)
+    return CHUNKS
+
+
+def generate_response(session_id, messages, temperature=0.2, max_tokens=800):
+    time.sleep(LLM_LATENCY)
+    return "You can return products within seven days."
+
+
+def get_chat_context(session_id):
+    time.sleep(HISTORY_LATENCY)
+    return None, []
+
+
+async def asearch_documents(query, top_k=5, db=None, mode=None, **kwargs):
+    await asyncio.sleep(SEARCH_LATENCY)
+    return CHUNKS
+
+
+async def agenerate_response(session_id, messages, temperature=0.2, max_tokens=800):
+    await asyncio.sleep(LLM_LATENCY)
+    return "You can return products within seven days."
+
+
+async def aget_chat_context(session_id):
+    await asyncio.sleep(HISTORY_LATENCY)
+    return None, []
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(rag.router, prefix="/rag")
+    app.dependency_overrides[get_db] = lambda: None
+    app.dependency_overrides[get_async_db] = lambda: None
+    return app
+
+
+async def drive(app: FastAPI, path: str, concurrency: int, total: int) -> float:
+    """Requests per second with `concurrency` clients sending `total` requests"""
+    transport = httpx.ASGITransport(app=app)
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as http:
+        async def client():
+            while not queue.empty():
+                i = queue.get_nowait()
+                response = await http.post(path, json={"session_id": f"load-{i}", "query": "What is the return policy?"})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return total / (time.perf_counter() - start)
+
+
+def run_load_test():
+    app = build_app()
+    patches = [
+        mock.patch.object(rag, "search_documents", search_documents),
+        mock.patch.object(rag, "generate_response", generate_response),
+        mock.patch.object(rag, "get_chat_context", get_chat_context),
+        mock.patch.object(rag, "asearch_documents", asearch_documents),
+        mock.patch.object(rag, "agenerate_response", agenerate_response),
+        mock.patch.object(rag, "aget_chat_context", aget_chat_context),
+        # Every request asks the same question, keep the LLM in the measurement
+        mock.patch.object(rag, "answer_cache", AnswerCache(None)),
+    ]
+    for p in patches:
+        p.start()
+    try:
+        print(f"{'concurrency':<12} {'sync /ask':>12} {'async /ask/async':>18}")
+        for concurrency in CONCURRENCY:
+            total = min(REQUESTS, concurrency * 8)
+            sync_rps = asyncio.run(drive(app, "/rag/ask", concurrency, total))
+            async_rps = asyncio.run(drive(app, "/rag/ask/async", concurrency, total))
+            print(f"{concurrency:<12} {sync_rps:>9.1f} r/s {async_rps:>15.1f} r/s")
+    finally:
+        for p in patches:
+            p.stop()
+
+
+if __name__ == "__main__":
+    run_load_test()
+
+# Run by:  uv run -m test.load_ask
+# Backends are simulated with sleeps so only the request handling model is compared:
+# sync handlers share the threadpool (40 threads by default), async ones share the event loop.
@@ -0,0 +1,63 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import app.core.query_cache as query_cache_module
+from app.core.embeddings import warm_up_models
+from app.core.query_batcher import QueryEmbeddingBatcher
+from app.core.query_cache import get_query_embedding, query_cache
+
+CONCURRENCY = [50, 100, 200, 500]
+QUERIES_PER_CLIENT = 4
+MAX_WAIT_MS = [1.0, 3.0, 10.0]
+
+WORDS = "what is the return policy for damaged products delivered by dropit nepal within seven days of the order".split()
+
+
+def make_queries(n: int, seed: int) -> List[str]:
+    """Distinct questions so every lookup misses the query cache"""
+    rng = random.Random(seed)
+    return [f"{i} " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 15))) for i in range(n)]
+
+
+def drive(concurrency: int, queries: List[str]) -> float:
+    """Queries per second with `concurrency` clients embedding one question at a time"""
+    query_cache.local.clear()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(get_query_embedding, queries))
+        return len(queries) / (time.perf_counter() - start)
+
+
+def run_load_test():
+    warm_up_models()
+    results: List[Dict] = []
+    for concurrency in CONCURRENCY:
+        queries = make_queries(concurrency * QUERIES_PER_CLIENT, seed=concurrency)
+        print(f"\n=== {concurrency} concurrent clients, {len(queries)} queries ===")
+
+        query_cache_module.QUERY_BATCHING = False
+        baseline = drive(concurrency, queries)
+        print(f"{'unbatched':<18} {baseline:8.1f} q/s")
+
+        query_cache_module.QUERY_BATCHING = True
+        for max_wait_ms in MAX_WAIT_MS:
+            batcher = QueryEmbeddingBatcher(max_wait_ms=max_wait_ms)
+            query_cache_module.query_batcher = batcher
+            qps = drive(concurrency, queries)
+            stats = batcher.stats()
+            print(
+                f"max_wait={max_wait_ms:<4}ms     {qps:8.1f} q/s  x{qps / baseline:4.1f}  "
+                f"batch avg {stats['batch_size_avg']:5.1f}  queue p50 {stats['queue_ms_p50']:6.1f}ms p99 {stats['queue_ms_p99']:6.1f}ms"
+            )
+            print(f"{'':<18} batch sizes {stats['batch_size_histogram']}")
+            results.append({"concurrency": concurrency, "max_wait_ms": max_wait_ms, "baseline_qps": baseline, "qps": qps, **stats})
+    return results
+
+
+if __name__ == "__main__":
+    run_load_test()
+
+# Run by:  uv run -m test.load_query_batching
+# Every client thread goes through get_query_embedding, the cache lookup and encode that
+# search_documents does for each /rag/ask request.